@@ -9,7 +9,10 @@ from sqlalchemy import text
 from account_service.app.redis import holds as redis_holds
 
 from libs.rmq import consumer as rmq_consumer
-from libs.rmq import bus as rmq_bus
+from libs.rmq import outbox
+from libs.rmq.bus import RetryPolicy
+from libs.rmq.flow import AdaptivePrefetch
+from libs.rmq.dedup import DedupStore
 from libs.rmq.publisher import publish_event
 from account_service.app.messaging.publisher import (
     publish_balance_held,
@@ -117,23 +120,20 @@ def _handle_payment_authorized(payload: Dict[str, Any], headers: Dict[str, Any],
     if not hold:
         return
 
-    with session_scope() as db:
+    # Debit and balance_updated event commit together (outbox)
+    with session_scope() as db, outbox.bind(db):
         db.execute(
             text("UPDATE accounts SET balance = balance - :amt WHERE user_id = :uid"),
             {"amt": amount, "uid": user_id},
         )
-    redis_holds.decrease_total(user_id, float(amount))
-
-    if True:
         # lookup email for user
         email: str = ""
-        with session_scope() as db:
-            row = db.execute(text("SELECT email FROM accounts WHERE user_id=:uid"), {"uid": user_id}).first()
-            if row:
-                try:
-                    email = str(row[0])
-                except Exception:
-                    email = ""
+        row = db.execute(text("SELECT email FROM accounts WHERE user_id=:uid"), {"uid": user_id}).first()
+        if row:
+            try:
+                email = str(row[0])
+            except Exception:
+                email = ""
         publish_balance_updated(
             user_id=user_id,
             amount=amount,
@@ -141,7 +141,8 @@ def _handle_payment_authorized(payload: Dict[str, Any], headers: Dict[str, Any],
             email=email,
             correlation_id=(headers or {}).get("correlation-id"),
         )
-        logger.info("account_service captured hold user_id=%s payment_id=%s", user_id, payment_id)
+    redis_holds.decrease_total(user_id, float(amount))
+    logger.info("account_service captured hold user_id=%s payment_id=%s", user_id, payment_id)
 
 
 def _handle_payment_unauthorized(payload: Dict[str, Any], headers: Dict[str, Any], message_id: str) -> None:
@@ -187,12 +188,35 @@ def _handle_payment_unauthorized(payload: Dict[str, Any], headers: Dict[str, Any
 
 
 
+def _dedup_store() -> DedupStore | None:
+    # Redelivered messages that were already handled are acked without re-running the handler
+    if settings.CONSUMER_DEDUP_TTL_SEC <= 0:
+        return None
+    return DedupStore.from_url(settings.REDIS_URL, ttl_sec=settings.CONSUMER_DEDUP_TTL_SEC)
+
+
+def _flow() -> AdaptivePrefetch | None:
+    # Prefetch follows observed handler latency and pauses on DB pool / Redis saturation
+    if settings.CONSUMER_PREFETCH_MAX <= 0:
+        return None
+    return AdaptivePrefetch(settings.CONSUMER_PREFETCH, max_prefetch=settings.CONSUMER_PREFETCH_MAX,
+                            target_latency=settings.CONSUMER_TARGET_LATENCY_MS / 1000.0)
+
+
 def start_consumers() -> None:
-    # Declare a single queue and bind both routing keys
-    rmq_bus.declare_queue(settings.ACCOUNT_PAYMENT_QUEUE, settings.RK_PAYMENT_INITIATED, dead_letter=True, prefetch=settings.CONSUMER_PREFETCH)
-    # Bind second key manually
-    ch = rmq_bus._Rmq.channel()
-    ch.queue_bind(queue=settings.ACCOUNT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_PAYMENT_AUTHORIZED)
-    ch.queue_bind(queue=settings.ACCOUNT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_PAYMENT_UNAUTHORIZED)
-    # Start consuming on one thread
-    rmq_bus.start_consume(settings.ACCOUNT_PAYMENT_QUEUE, _on_message)
+    # One queue for all payment events; the supervisor re-declares and resubscribes on reconnect
+    subs = [
+        rmq_consumer.Subscription(
+            settings.ACCOUNT_PAYMENT_QUEUE,
+            settings.RK_PAYMENT_INITIATED,
+            _on_message,
+            routing_keys=[settings.RK_PAYMENT_AUTHORIZED, settings.RK_PAYMENT_UNAUTHORIZED],
+            prefetch=settings.CONSUMER_PREFETCH,
+            retry=RetryPolicy.parse(settings.CONSUMER_RETRY_TIERS_MS),
+            dedup=_dedup_store(),
+            workers=settings.CONSUMER_WORKERS,
+            partition_key="payment_id",
+            flow=_flow(),
+        )
+    ]
+    rmq_consumer.run(subs, join=False)
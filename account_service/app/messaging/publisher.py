@@ -14,6 +14,7 @@ def publish_balance_held(*, user_id: str, amount: float, payment_id: str, email:
         routing_key=settings.RK_BALANCE_HELD,
         payload={"user_id": user_id, "amount": amount, "payment_id": payment_id, "email": email},
         event_type="balance_held",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.info("event balance_held published payment_id=%s user_id=%s amount=%s", payment_id, user_id, amount)
@@ -40,6 +41,7 @@ def publish_balance_hold_failed(
             "email": email,
         },
         event_type="balance_hold_failed",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.warning("event balance_hold_failed payment_id=%s user_id=%s reason=%s", payment_id, user_id, reason_code)
@@ -50,6 +52,7 @@ def publish_balance_updated(*, user_id: str, amount: float, payment_id: str, ema
         routing_key=settings.RK_BALANCE_UPDATED,
         payload={"user_id": user_id, "amount": amount, "payment_id": payment_id, "email": email},
         event_type="balance_updated",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.info("event balance_updated payment_id=%s user_id=%s", payment_id, user_id)
@@ -69,6 +72,7 @@ def publish_balance_released(
             "email": email,
         },
         event_type="balance_released",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.info("event balance_released payment_id=%s user_id=%s reason=%s", payment_id, user_id, reason_code)
@@ -22,6 +22,15 @@ class Settings(BaseSettings):
     EVENT_DLX: str = Field(default="ibanking.dlx")
     ACCOUNT_PAYMENT_QUEUE: str = Field(default="account.payment.q")
     CONSUMER_PREFETCH: int = Field(default=32)
+    CONSUMER_PREFETCH_MAX: int = Field(default=256, description="Upper bound of the adaptive prefetch (0 = static CONSUMER_PREFETCH)")
+    CONSUMER_TARGET_LATENCY_MS: int = Field(default=250, description="Adaptive prefetch target: max wait of a prefetched message before its handler runs")
+    CONSUMER_WORKERS: int = Field(default=0, description="Handler threads per consumer (0 = inline, one message at a time)")
+    CONSUMER_RETRY_TIERS_MS: str = Field(default="1000,10000,60000", description="Delayed-retry tiers in ms before the DLQ (empty = no retry); the payment_id consumers wait out each tier in process, holding later events of the same payment until the retry is done")
+    CONSUMERS_IN_WEB: bool = Field(default=True, description="Run RMQ consumers inside the web process (false: run them with `python -m libs.rmq.worker account_service`)")
+    CONSUMER_DRAIN_TIMEOUT_SEC: float = Field(default=8.0, description="On shutdown, how long in-flight handlers may run before the consumer connection is closed")
+    CONSUMER_DEDUP_TTL_SEC: int = Field(default=86400, description="How long processed message ids are remembered in Redis (0 = dedup off)")
+    OUTBOX_BATCH_SIZE: int = Field(default=200, description="Events per outbox relay batch")
+    OUTBOX_POLL_INTERVAL_MS: int = Field(default=500)
 
     # Redis (holds cache)
     REDIS_URL: str = Field(default="redis://localhost:6379/0")
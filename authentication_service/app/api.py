@@ -4,6 +4,7 @@ from authentication_service.app.schemas import LoginRequest, LoginResponse
 from authentication_service.app.security.jwt import create_access_token, hash_password
 from authentication_service.app.settings import settings
 from authentication_service.app.clients.account_client import AccountClient
+from libs.http import CircuitOpenError
 
 
 router = APIRouter()
@@ -15,7 +16,15 @@ def login(body: LoginRequest) -> LoginResponse:
     pwd_hash = hash_password(body.password, settings.PASSWORD_SALT)
 
     client = AccountClient()
-    result = client.verify_credentials(body.username, pwd_hash)
+    try:
+        result = client.verify_credentials(body.username, pwd_hash)
+    except CircuitOpenError as ex:
+        # Account service đang lỗi: trả 503 ngay thay vì chờ timeout
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Account service unavailable",
+            headers={"Retry-After": str(max(1, int(ex.retry_after)))},
+        )
 
     if not result.get("ok"):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
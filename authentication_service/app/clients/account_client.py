@@ -1,12 +1,13 @@
 from typing import Optional, Dict, Any
 
-from libs.http import HttpClient
+from libs.http import pooled_client
 from authentication_service.app.settings import settings
 
 
 class AccountClient:
     def __init__(self, base_url: Optional[str] = None) -> None:
-        self._client = HttpClient(base_url or settings.ACCOUNT_SERVICE_URL)
+        # Wrapper rẻ; connection keep-alive tới account service dùng chung cả process
+        self._client = pooled_client(base_url or settings.ACCOUNT_SERVICE_URL)
 
     def verify_credentials(self, username: str, password_hash: str) -> Dict[str, Any]:
         """
@@ -15,7 +16,8 @@ class AccountClient:
         """
         payload = {"username": username, "password_hash": password_hash}
         # Endpoint path is a suggestion; adjust to match account service.
-        resp = self._client.post("/internal/accounts/verify", json=payload)
+        # Chỉ đọc, không có side effect: được phép retry dù là POST
+        resp = self._client.post("/internal/accounts/verify", json=payload, idempotent=True)
         return resp.json()
 
     def get_account(self, user_id: str, *, authorization: Optional[str] = None, token: Optional[str] = None) -> Dict[str, Any]:
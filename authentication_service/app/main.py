@@ -1,10 +1,17 @@
 from fastapi import FastAPI
 from authentication_service.app.api import router as api_router
+from libs.http import client_registry
 
 
 def create_app() -> FastAPI:
     app = FastAPI(title="authentication_service")
     app.include_router(api_router)
+
+    @app.on_event("shutdown")
+    def _shutdown() -> None:
+        # Close the pooled keep-alive connections to account service
+        client_registry.close()
+
     return app
 
 
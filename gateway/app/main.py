@@ -7,6 +7,7 @@ import httpx
 from fastapi import FastAPI, Request, Response, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 
+from libs.http import HedgePolicy, client_registry, hedged
 from libs.security.jwt import verify_and_decode
 from gateway.app.settings import settings
 
@@ -43,23 +44,15 @@ app.add_middleware(
 )
 
 
-_client: httpx.AsyncClient | None = None
-
-
-@app.on_event("startup")
-async def _startup() -> None:
-    global _client
-    _client = httpx.AsyncClient(timeout=httpx.Timeout(settings.HTTP_TIMEOUT))
+_timeout = httpx.Timeout(settings.HTTP_TIMEOUT)
+_hedge = HedgePolicy(quantile=settings.HEDGE_QUANTILE, budget_ratio=settings.HEDGE_BUDGET_RATIO)
 
 
 @app.on_event("shutdown")
 async def _shutdown() -> None:
-    global _client
-    if _client is not None:
-        try:
-            await _client.aclose()
-        finally:
-            _client = None
+    # One keep-alive pool per upstream (libs.http.pool): a slow service cannot take
+    # every connection from the others
+    await client_registry.aclose()
 
 
 def _filtered_headers(headers: Iterable[tuple[str, str]]) -> Dict[str, str]:
@@ -87,10 +80,8 @@ async def _require_user(request: Request) -> str:
     return user_id
 
 
-async def _proxy(request: Request, base_url: str, tail: str, *, require_auth: bool = True) -> Response:
-    global _client
-    assert _client is not None
-
+async def _proxy(request: Request, base_url: str, tail: str, *, require_auth: bool = True,
+                 hedge: bool = False) -> Response:
     # Allow unauthenticated access to service docs/openapi endpoints
     normalized_tail = (tail or "").lstrip("/")
     is_docs = (
@@ -119,13 +110,25 @@ async def _proxy(request: Request, base_url: str, tail: str, *, require_auth: bo
     url = f"{base_url}/{tail}" if tail else base_url
     try:
         body = await request.body()
-        resp = await _client.request(
-            request.method,
-            url,
-            content=body if body else None,
-            headers=headers,
-            params=dict(request.query_params),
-        )
+
+        async def _send() -> httpx.Response:
+            resp = await client_registry.async_client(base_url).request(
+                request.method,
+                url,
+                content=body if body else None,
+                headers=headers,
+                params=dict(request.query_params),
+                timeout=_timeout,
+            )
+            if resp.status_code >= 500:
+                # A fast 5xx from a sick replica must lose the hedge race, not cancel a healthy attempt
+                raise httpx.HTTPStatusError(f"upstream {resp.status_code}", request=resp.request, response=resp)
+            return resp
+
+        # Read-only lookups: a second copy after the upstream's p95 cuts the tail from DB lock waits
+        resp = await (hedged(_send, base_url, _hedge) if hedge and settings.HEDGE_READS else _send())
+    except httpx.HTTPStatusError as e:
+        resp = e.response  # every attempt answered 5xx: pass it through as before
     except httpx.RequestError:
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Upstream unavailable")
 
@@ -149,7 +152,7 @@ async def auth_login(request: Request) -> Response:
 
 @app.get("/account/accounts/me")
 async def account_me(request: Request) -> Response:
-    return await _proxy(request, ACCOUNT_URL, "accounts/me", require_auth=True)
+    return await _proxy(request, ACCOUNT_URL, "accounts/me", require_auth=True, hedge=True)
 
 
 # Payment
@@ -167,7 +170,7 @@ async def otp_verify(request: Request) -> Response:
 # Tuition
 @app.get("/tuition/tuition/{student_id}")
 async def tuition_get(student_id: str, request: Request) -> Response:
-    return await _proxy(request, TUITION_URL, f"tuition/{student_id}", require_auth=True)
+    return await _proxy(request, TUITION_URL, f"tuition/{student_id}", require_auth=True, hedge=True)
 
 if __name__ == "__main__":
     import uvicorn
@@ -24,5 +24,10 @@ class Settings(BaseSettings):
     CORS_ALLOW_ORIGINS: str = Field(default="*")
     HTTP_TIMEOUT: float = Field(default=10.0)
 
+    # Hedged reads (libs.http.hedge): duplicate slow GETs to replicated upstreams
+    HEDGE_READS: bool = Field(default=False)
+    HEDGE_QUANTILE: float = Field(default=0.95, description="Send the second request after this latency quantile of the upstream")
+    HEDGE_BUDGET_RATIO: float = Field(default=0.1, description="Extra requests allowed per request (caps hedging load)")
+
 
 settings = Settings()
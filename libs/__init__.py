@@ -4,5 +4,6 @@ __all__ = [
     "http",
     "rmq",
     "event_contracts",
+    "metrics",
 ]
 
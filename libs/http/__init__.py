@@ -3,15 +3,36 @@
 from .client import (
     HttpClient,
     AsyncHttpClient,
+    pooled_client,
+    pooled_async_client,
     make_account_client,
     make_payment_client,
     make_tuition_client,
     make_otp_client,
 )
+from .pool import ClientRegistry, registry as client_registry
+from .resilience import CircuitBreaker, CircuitOpenError, RetryBudget, RetryPolicy, upstreams
+from .singleflight import SingleFlight
+from .cache import CacheRoute, ResponseCache
+from .hedge import HedgePolicy, hedged
 
 __all__ = [
     "HttpClient",
     "AsyncHttpClient",
+    "pooled_client",
+    "pooled_async_client",
+    "ClientRegistry",
+    "client_registry",
+    "RetryPolicy",
+    "RetryBudget",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "upstreams",
+    "SingleFlight",
+    "ResponseCache",
+    "CacheRoute",
+    "HedgePolicy",
+    "hedged",
     "make_account_client",
     "make_payment_client",
     "make_tuition_client",
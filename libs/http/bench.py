@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+"""Benchmark: AsyncHttpClient with and without single-flight under fan-in load.
+
+    python -m libs.http.bench [--callers 400] [--keys 20] [--waves 5]
+
+The upstream is an in-process httpx.MockTransport that serves ``--capacity``
+requests at a time (like a small worker pool) and takes ``--service-ms`` for each.
+Every wave, ``--callers`` coroutines ask at once for one of ``--keys`` resources
+(``/accounts/<id>``, the same user picked by many callers). Latency is measured
+per caller, from the call to the response; it includes the queueing at the upstream.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from .client import AsyncHttpClient
+
+BASE_URL = "http://upstream.bench"
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[max(0, int(round(q * len(ordered))) - 1)] if ordered else float("nan")
+
+
+async def run_once(*, single_flight: bool, callers: int, keys: int, waves: int,
+                   capacity: int, service_ms: float) -> Dict[str, float]:
+    slots = asyncio.Semaphore(capacity)
+    served = [0]
+
+    async def upstream(request: httpx.Request) -> httpx.Response:
+        async with slots:
+            await asyncio.sleep(service_ms / 1000.0)
+            served[0] += 1
+        return httpx.Response(200, json={"id": request.url.path.rsplit("/", 1)[-1]})
+
+    raw = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    client = AsyncHttpClient(BASE_URL, client=raw, single_flight=single_flight, retries=1)
+    latencies: List[float] = []
+
+    async def call(i: int) -> None:
+        t = time.perf_counter()
+        resp = await client.get(f"/accounts/{i % keys}", headers={"X-User-Id": str(i % keys)})
+        assert resp.json()["id"] == str(i % keys)
+        latencies.append(time.perf_counter() - t)
+
+    started = time.perf_counter()
+    for _ in range(waves):
+        await asyncio.gather(*(call(i) for i in range(callers)))
+    elapsed = time.perf_counter() - started
+    await raw.aclose()
+
+    ordered = sorted(latencies)
+    return {
+        "upstream": served[0],
+        "p50": statistics.median(ordered),
+        "p95": _percentile(ordered, 0.95),
+        "p99": _percentile(ordered, 0.99),
+        "elapsed": elapsed,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--callers", type=int, default=400, help="concurrent callers per wave")
+    ap.add_argument("--keys", type=int, default=20, help="distinct resources per wave")
+    ap.add_argument("--waves", type=int, default=5, help="number of waves")
+    ap.add_argument("--capacity", type=int, default=16, help="requests the upstream serves at a time")
+    ap.add_argument("--service-ms", type=float, default=10.0, help="upstream time per request")
+    args = ap.parse_args(argv)
+
+    print(f"{'mode':<14} {'upstream reqs':>13} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'total s':>8}")
+    for single_flight in (False, True):
+        r = asyncio.run(run_once(single_flight=single_flight, callers=args.callers, keys=args.keys,
+                                 waves=args.waves, capacity=args.capacity, service_ms=args.service_ms))
+        print(f"{'single-flight' if single_flight else 'plain':<14} {r['upstream']:>13} "
+              f"{r['p50'] * 1000:>8.1f} {r['p95'] * 1000:>8.1f} {r['p99'] * 1000:>8.1f} {r['elapsed']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+"""Response cache for HttpClient / AsyncHttpClient: per-route opt-in, TTL + ETag.
+
+    account_cache = ResponseCache(max_entries=4096, redis_url=os.getenv("HTTP_CACHE_REDIS_URL"))
+    account_cache.route("/accounts/me", ttl=60)
+    client = pooled_client(ACCOUNT_URL, cache=account_cache)
+
+Only GET requests whose path matches a registered route are cached; everything else
+goes to the network as before. The key is the full URL, the query params and the
+values of the route's ``vary`` headers (by default ``authorization`` and
+``x-user-id``, so users never see each other's answers).
+
+The upstream's ``Cache-Control`` wins over the route TTL. ``no-store`` or ``Vary: *``
+means the response is not stored. ``no-cache`` means it is stored but revalidated
+every time. ``max-age=N`` sets the TTL. A stale entry that has an ``ETag`` stays for
+``stale_sec`` more seconds; the next request sends ``If-None-Match`` and a ``304``
+refreshes the entry without transferring the body again.
+
+Entries live in an in-process LRU (``max_entries``). With ``redis_url`` they are
+also written to Redis (``<prefix><sha1>``, expiring with the entry) and read from
+there on a local miss, so replicas share hot lookups. Redis is optional: the
+``redis`` package is imported only then, and a Redis error is treated as a miss.
+
+Metrics: ``http_client_cache_total{route, result}`` where result is ``hit``
+(fresh, no network), ``revalidated`` (304) or ``miss``.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+try:
+    import httpx
+except Exception:  # pragma: no cover
+    httpx = None  # type: ignore
+
+from libs.metrics import registry as metrics
+from .singleflight import COALESCE_HEADERS
+
+logger = logging.getLogger(__name__)
+
+VARY_HEADERS: Tuple[str, ...] = COALESCE_HEADERS
+STALE_SEC = 300.0
+# Body đã được httpx giải nén; bỏ các header mô tả encoding/độ dài gốc
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+_MAX_AGE = re.compile(r"(?:^|,)\s*(?:s-maxage|max-age)\s*=\s*\"?(\d+)", re.I)
+
+
+@dataclass
+class CacheRoute:
+    pattern: str                 # prefix của path, hoặc regex nếu bắt đầu bằng "^"
+    ttl: float
+    vary: Tuple[str, ...] = VARY_HEADERS
+
+    def matches(self, path: str) -> bool:
+        if self.pattern.startswith("^"):
+            return re.match(self.pattern, path) is not None
+        return path.startswith(self.pattern)
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: List[Tuple[str, str]]
+    content: bytes
+    etag: Optional[str]
+    expires_at: float            # wall clock: entry có thể nằm trong Redis dùng chung
+    keep_until: float
+    stored_at: float = field(default_factory=time.time)
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def to_response(self, method: str, url: str) -> "httpx.Response":
+        return httpx.Response(self.status_code, headers=self.headers, content=self.content,
+                              request=httpx.Request(method, url))
+
+    def dumps(self) -> str:
+        data = dict(self.__dict__, content=base64.b64encode(self.content).decode("ascii"))
+        return json.dumps(data)
+
+    @classmethod
+    def loads(cls, raw: Any) -> "CachedResponse":
+        data = json.loads(raw)
+        data["content"] = base64.b64decode(data["content"])
+        data["headers"] = [tuple(h) for h in data["headers"]]
+        return cls(**data)
+
+
+def _cache_control(resp: "httpx.Response") -> str:
+    return resp.headers.get("cache-control", "").lower()
+
+
+class ResponseCache:
+    def __init__(self, *, max_entries: int = 1024, stale_sec: float = STALE_SEC,
+                 redis_url: Optional[str] = None, prefix: str = "httpcache:") -> None:
+        self.max_entries = max(1, int(max_entries))
+        self.stale_sec = stale_sec
+        self.prefix = prefix
+        self.routes: List[CacheRoute] = []
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url:
+            import redis  # optional: chỉ cần khi bật tầng Redis
+
+            self._redis = redis.from_url(redis_url, socket_connect_timeout=1, socket_timeout=1)
+
+    def route(self, pattern: str, ttl: float, *, vary: Sequence[str] = VARY_HEADERS) -> CacheRoute:
+        """Opt-in cache cho các GET có path khớp `pattern` (prefix hoặc regex "^...")."""
+        r = CacheRoute(pattern, float(ttl), tuple(h.lower() for h in vary))
+        self.routes.append(r)
+        return r
+
+    def match(self, method: str, url: str) -> Optional[CacheRoute]:
+        if method.upper() != "GET":
+            return None
+        path = urlsplit(url).path or "/"
+        return next((r for r in self.routes if r.matches(path)), None)
+
+    def key(self, route: CacheRoute, url: str, params: Optional[Dict[str, Any]],
+            headers: Dict[str, str]) -> str:
+        h = {k.lower(): v for k, v in headers.items()}
+        parts = [url, sorted((str(k), str(v)) for k, v in (params or {}).items()),
+                 [h.get(name) for name in route.vary]]
+        return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+    # --- storage: LRU trong process, Redis phía sau (nếu có) ---
+    def get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.keep_until > now:
+                    self._entries.move_to_end(key)
+                    return entry
+                del self._entries[key]
+        if self._redis is None:
+            return None
+        try:
+            raw = self._redis.get(self.prefix + key)
+        except Exception:
+            logger.debug("http cache: redis get failed", exc_info=True)
+            return None
+        if raw is None:
+            return None
+        entry = CachedResponse.loads(raw)
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key: str, entry: CachedResponse) -> None:
+        self._remember(key, entry)
+        if self._redis is None:
+            return
+        ttl = max(1, int(entry.keep_until - time.time()))
+        try:
+            self._redis.set(self.prefix + key, entry.dumps(), ex=ttl)
+        except Exception:
+            logger.debug("http cache: redis set failed", exc_info=True)
+
+    async def aget(self, key: str) -> Optional[CachedResponse]:
+        # Redis client là sync: đẩy sang thread để không chặn event loop
+        if self._redis is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, entry: CachedResponse) -> None:
+        if self._redis is None:
+            self.put(key, entry)
+        else:
+            await asyncio.to_thread(self.put, key, entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # --- HTTP semantics ---
+    def _ttl(self, route: CacheRoute, resp: "httpx.Response") -> Optional[float]:
+        """TTL theo Cache-Control (ưu tiên) hoặc route; None nếu không được lưu."""
+        cc = _cache_control(resp)
+        if "no-store" in cc or resp.headers.get("vary", "").strip() == "*":
+            return None
+        if "no-cache" in cc:
+            return 0.0
+        m = _MAX_AGE.search(cc)
+        return float(m.group(1)) if m else route.ttl
+
+    def entry_for(self, route: CacheRoute, resp: "httpx.Response") -> Optional[CachedResponse]:
+        """CachedResponse cho một 200 vừa nhận, hoặc None nếu response không cache được."""
+        if resp.status_code != 200:
+            return None
+        ttl = self._ttl(route, resp)
+        if ttl is None:
+            return None
+        etag = resp.headers.get("etag")
+        if ttl <= 0 and not etag:
+            return None  # phải revalidate mỗi lần mà không có validator: lưu cũng vô ích
+        now = time.time()
+        headers = [(k, v) for k, v in resp.headers.items() if k.lower() not in _DROP_HEADERS]
+        return CachedResponse(resp.status_code, headers, resp.content, etag,
+                              expires_at=now + ttl, keep_until=now + ttl + (self.stale_sec if etag else 0.0))
+
+    def refreshed(self, route: CacheRoute, entry: CachedResponse,
+                  not_modified: "httpx.Response") -> CachedResponse:
+        """Entry sau khi upstream trả 304: giữ body, gia hạn theo Cache-Control mới."""
+        ttl = self._ttl(route, not_modified)
+        ttl = route.ttl if ttl is None else ttl
+        now = time.time()
+        return CachedResponse(entry.status_code, entry.headers, entry.content,
+                              not_modified.headers.get("etag", entry.etag),
+                              expires_at=now + ttl, keep_until=now + ttl + self.stale_sec)
+
+    def conditional_headers(self, headers: Optional[Dict[str, str]],
+                            entry: Optional[CachedResponse]) -> Optional[Dict[str, str]]:
+        if entry is None or not entry.etag:
+            return headers
+        return {**(headers or {}), "If-None-Match": entry.etag}
+
+    @staticmethod
+    def record(route: CacheRoute, result: str) -> None:
+        metrics.inc("http_client_cache_total", route=route.pattern, result=result)
@@ -1,21 +1,37 @@
 from __future__ import annotations
 
-"""HTTP client for sync/async calls with correlation-id and simple retries.
-
-Standardizes inter-service HTTP calls across services using httpx.
+"""HTTP client for sync/async calls with correlation-id and guarded retries.
+
+Standardizes inter-service HTTP calls across services using httpx. Use
+``pooled_client()`` / ``pooled_async_client()`` (and the ``make_*_client`` factories)
+to share keep-alive connections per upstream (see libs.http.pool). Retries follow a
+``RetryPolicy`` and spend the upstream's retry budget; a circuit breaker per upstream
+fails calls fast with ``CircuitOpenError`` (see libs.http.resilience).
+``AsyncHttpClient(single_flight=True)`` coalesces concurrent identical GETs into one
+upstream call (see libs.http.singleflight); ``cache=ResponseCache(...)`` serves opted-in
+routes from a TTL/ETag cache (see libs.http.cache); ``hedge=HedgePolicy()`` sends a
+second copy of slow GET/HEAD calls, or of calls made with ``idempotent=True`` (see
+libs.http.hedge).
 """
 
 import asyncio
 import os
 import time
 import uuid
-from typing import Any, Dict, Optional, TYPE_CHECKING
+from typing import Any, Dict, Optional, Sequence, Tuple, TYPE_CHECKING
 
 try:
     import httpx
 except Exception:  # pragma: no cover
     httpx = None  # type: ignore
 
+from libs.metrics import registry as metrics
+from .cache import ResponseCache
+from .hedge import HedgePolicy, hedged
+from .pool import registry
+from .resilience import RetryPolicy, Upstream, is_failure, upstreams
+from .singleflight import COALESCE_HEADERS, COALESCE_METHODS, flights
+
 if TYPE_CHECKING:
     import httpx as _httpx  # type: ignore
     ResponseT = _httpx.Response
@@ -29,6 +45,8 @@ BACKOFF_FACTOR = float(os.getenv("HTTP_CLIENT_BACKOFF", "0.2"))
 
 CORRELATION_HEADER = "correlation-id"
 
+DEFAULT_RETRY = RetryPolicy(attempts=max(1, DEFAULT_RETRIES), backoff=BACKOFF_FACTOR)
+
 
 def _build_url(base_url: str, url: str) -> str:
     if url.startswith("http://") or url.startswith("https://"):
@@ -38,6 +56,22 @@ def _build_url(base_url: str, url: str) -> str:
     return f"{base_url.rstrip('/')}/{url.lstrip('/')}"
 
 
+def _retry_delay(up: Upstream, policy: RetryPolicy, method: str, ex: Exception,
+                 attempt: int, attempts: int, idempotent: Optional[bool]) -> Optional[float]:
+    """Ghi lỗi vào breaker; trả về thời gian chờ trước lần thử tiếp, hoặc None nếu phải raise."""
+    up.breaker.record(is_failure(ex))
+    if attempt >= attempts - 1:
+        return None
+    reason = policy.reason(method, ex, idempotent)
+    if reason is None:
+        return None
+    if not up.budget.withdraw():
+        metrics.inc("http_client_retry_budget_exhausted_total", upstream=up.name)
+        return None
+    metrics.inc("http_client_retries_total", upstream=up.name, reason=reason)
+    return policy.delay(attempt, ex)
+
+
 class HttpClient:
     def __init__(
         self,
@@ -46,14 +80,22 @@ class HttpClient:
         default_headers: Optional[Dict[str, str]] = None,
         timeout: float = DEFAULT_TIMEOUT,
         retries: int = DEFAULT_RETRIES,
+        retry: Optional[RetryPolicy] = None,
+        client: Optional["httpx.Client"] = None,
+        cache: Optional[ResponseCache] = None,
     ) -> None:
         if httpx is None:
             raise RuntimeError("httpx is required for HttpClient; please install it.")
         self.base_url = base_url
         self.timeout = httpx.Timeout(timeout)
-        self.retries = max(1, retries)
+        self.retry = retry or (DEFAULT_RETRY if retries == DEFAULT_RETRY.attempts
+                               else RetryPolicy(attempts=max(1, retries), backoff=BACKOFF_FACTOR))
+        self.retries = self.retry.attempts
         self._default_headers = default_headers or {}
-        self._client = httpx.Client(timeout=self.timeout)
+        # `client` dùng chung (libs.http.pool) thì registry đóng nó, không phải wrapper này
+        self._owns_client = client is None
+        self._client = client if client is not None else httpx.Client(timeout=self.timeout)
+        self.cache = cache
 
     def _headers(self, headers: Optional[Dict[str, str]], correlation_id: Optional[str]) -> Dict[str, str]:
         h = dict(self._default_headers)
@@ -72,13 +114,57 @@ class HttpClient:
         headers: Optional[Dict[str, str]] = None,
         correlation_id: Optional[str] = None,
         retries: Optional[int] = None,
+        idempotent: Optional[bool] = None,
     ) -> ResponseT:
         if httpx is None:
             raise RuntimeError("httpx is required for HttpClient; please install it.")
+        full_url = _build_url(self.base_url, url)
+        route = self.cache.match(method, full_url) if self.cache is not None else None
+        if route is None:
+            return self._request(method, url, params=params, json=json, headers=headers,
+                                 correlation_id=correlation_id, retries=retries, idempotent=idempotent)
+        cache = self.cache
+        key = cache.key(route, full_url, params, {**self._default_headers, **(headers or {})})
+        entry = cache.get(key)
+        if entry is not None and entry.fresh:
+            cache.record(route, "hit")
+            return entry.to_response(method, full_url)
+        try:
+            resp = self._request(method, url, params=params, json=json,
+                                 headers=cache.conditional_headers(headers, entry),
+                                 correlation_id=correlation_id, retries=retries, idempotent=idempotent)
+        except httpx.HTTPStatusError as ex:
+            if entry is None or ex.response.status_code != 304:
+                raise
+            entry = cache.refreshed(route, entry, ex.response)
+            cache.put(key, entry)
+            cache.record(route, "revalidated")
+            return entry.to_response(method, full_url)
+        cache.record(route, "miss")
+        stored = cache.entry_for(route, resp)
+        if stored is not None:
+            cache.put(key, stored)
+        return resp
+
+    def _request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]],
+        json: Optional[Any],
+        headers: Optional[Dict[str, str]],
+        correlation_id: Optional[str],
+        retries: Optional[int],
+        idempotent: Optional[bool],
+    ) -> ResponseT:
         attempts = max(1, retries or self.retries)
         last_exc: Optional[Exception] = None
         full_url = _build_url(self.base_url, url)
+        up = upstreams.get(full_url)
+        up.budget.deposit()
         for attempt in range(attempts):
+            up.breaker.before_call()
             try:
                 resp = self._client.request(
                     method,
@@ -86,14 +172,18 @@ class HttpClient:
                     params=params,
                     json=json,
                     headers=self._headers(headers, correlation_id),
+                    timeout=self.timeout,
                 )
                 resp.raise_for_status()
-                return resp
             except (httpx.TimeoutException, httpx.TransportError, httpx.HTTPStatusError) as ex:
                 last_exc = ex
-                if attempt >= attempts - 1:
+                delay = _retry_delay(up, self.retry, method, ex, attempt, attempts, idempotent)
+                if delay is None:
                     raise
-                time.sleep(BACKOFF_FACTOR * (2 ** attempt))
+                time.sleep(delay)
+                continue
+            up.breaker.record(False)
+            return resp
         assert last_exc is not None
         raise last_exc
 
@@ -110,7 +200,8 @@ class HttpClient:
         return self.request("DELETE", url, **kwargs)
 
     def close(self) -> None:
-        self._client.close()
+        if self._owns_client:
+            self._client.close()
 
     # --- helpers to manage default headers (e.g., Authorization) ---
     def set_default_headers(self, headers: Dict[str, str]) -> None:
@@ -133,14 +224,28 @@ class AsyncHttpClient:
         default_headers: Optional[Dict[str, str]] = None,
         timeout: float = DEFAULT_TIMEOUT,
         retries: int = DEFAULT_RETRIES,
+        retry: Optional[RetryPolicy] = None,
+        client: Optional["httpx.AsyncClient"] = None,
+        cache: Optional[ResponseCache] = None,
+        hedge: Optional[HedgePolicy] = None,
+        single_flight: bool = False,
+        coalesce_headers: Sequence[str] = COALESCE_HEADERS,
     ) -> None:
         if httpx is None:
             raise RuntimeError("httpx is required for AsyncHttpClient; please install it.")
         self.base_url = base_url
         self.timeout = httpx.Timeout(timeout)
-        self.retries = max(1, retries)
+        self.retry = retry or (DEFAULT_RETRY if retries == DEFAULT_RETRY.attempts
+                               else RetryPolicy(attempts=max(1, retries), backoff=BACKOFF_FACTOR))
+        self.retries = self.retry.attempts
         self._default_headers = default_headers or {}
-        self._client = httpx.AsyncClient(timeout=self.timeout)
+        # `client` dùng chung (libs.http.pool) thì registry đóng nó, không phải wrapper này
+        self._owns_client = client is None
+        self._client = client if client is not None else httpx.AsyncClient(timeout=self.timeout)
+        self.cache = cache
+        self.hedge = hedge
+        self.single_flight = single_flight
+        self.coalesce_headers = tuple(h.lower() for h in coalesce_headers)
 
     def _headers(self, headers: Optional[Dict[str, str]], correlation_id: Optional[str]) -> Dict[str, str]:
         h = dict(self._default_headers)
@@ -159,13 +264,130 @@ class AsyncHttpClient:
         headers: Optional[Dict[str, str]] = None,
         correlation_id: Optional[str] = None,
         retries: Optional[int] = None,
+        idempotent: Optional[bool] = None,
+        coalesce: Optional[bool] = None,
+        hedge: Optional[bool] = None,
     ) -> ResponseT:
         if httpx is None:
             raise RuntimeError("httpx is required for AsyncHttpClient; please install it.")
+        full_url = _build_url(self.base_url, url)
+        route = self.cache.match(method, full_url) if self.cache is not None else None
+        if route is None:
+            return await self._send(method, url, params=params, json=json, headers=headers,
+                                    correlation_id=correlation_id, retries=retries,
+                                    idempotent=idempotent, coalesce=coalesce, hedge=hedge)
+        cache = self.cache
+        key = cache.key(route, full_url, params, {**self._default_headers, **(headers or {})})
+        entry = await cache.aget(key)
+        if entry is not None and entry.fresh:
+            cache.record(route, "hit")
+            return entry.to_response(method, full_url)
+        try:
+            resp = await self._send(method, url, params=params, json=json,
+                                    headers=cache.conditional_headers(headers, entry),
+                                    correlation_id=correlation_id, retries=retries,
+                                    idempotent=idempotent, coalesce=coalesce, hedge=hedge)
+        except httpx.HTTPStatusError as ex:
+            if entry is None or ex.response.status_code != 304:
+                raise
+            entry = cache.refreshed(route, entry, ex.response)
+            await cache.aput(key, entry)
+            cache.record(route, "revalidated")
+            return entry.to_response(method, full_url)
+        cache.record(route, "miss")
+        stored = cache.entry_for(route, resp)
+        if stored is not None:
+            await cache.aput(key, stored)
+        return resp
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]],
+        json: Optional[Any],
+        headers: Optional[Dict[str, str]],
+        correlation_id: Optional[str],
+        retries: Optional[int],
+        idempotent: Optional[bool],
+        coalesce: Optional[bool],
+        hedge: Optional[bool],
+    ) -> ResponseT:
+        if (self.single_flight if coalesce is None else coalesce) \
+                and method.upper() in COALESCE_METHODS and json is None:
+            key = self._flight_key(method, url, params, headers)
+            resp, shared = await flights.do(key, lambda: self._attempt(
+                method, url, params=params, json=None, headers=headers,
+                correlation_id=correlation_id, retries=retries, idempotent=idempotent, hedge=hedge))
+            if shared:
+                metrics.inc("http_client_coalesced_total", upstream=upstreams.get(key[1]).name)
+            return resp
+        return await self._attempt(method, url, params=params, json=json, headers=headers,
+                                   correlation_id=correlation_id, retries=retries, idempotent=idempotent,
+                                   hedge=hedge)
+
+    async def _attempt(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]],
+        json: Optional[Any],
+        headers: Optional[Dict[str, str]],
+        correlation_id: Optional[str],
+        retries: Optional[int],
+        idempotent: Optional[bool],
+        hedge: Optional[bool],
+    ) -> ResponseT:
+        # Chỉ hedge GET/HEAD; PUT/DELETE (retry được theo RetryPolicy) cần idempotent=True tường minh
+        safe = method.upper() in COALESCE_METHODS if idempotent is None else idempotent
+        if self.hedge is None or not safe or hedge is False:
+            return await self._request(method, url, params=params, json=json, headers=headers,
+                                       correlation_id=correlation_id, retries=retries, idempotent=idempotent)
+        # Hai bản của cùng một call mang chung correlation-id
+        correlation_id = correlation_id or str(uuid.uuid4())
+        return await hedged(lambda: self._request(
+            method, url, params=params, json=json, headers=headers,
+            correlation_id=correlation_id, retries=retries, idempotent=idempotent),
+            _build_url(self.base_url, url), self.hedge,
+            hedge_call=lambda: self._request(
+                method, url, params=params, json=json, headers=headers,
+                correlation_id=correlation_id, retries=retries, idempotent=idempotent, hedge_copy=True))
+
+    def _flight_key(self, method: str, url: str, params: Optional[Dict[str, Any]],
+                    headers: Optional[Dict[str, str]]) -> Tuple[Any, ...]:
+        h = {k.lower(): v for k, v in {**self._default_headers, **(headers or {})}.items()}
+        return (method.upper(), _build_url(self.base_url, url),
+                tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())),
+                tuple(h.get(name) for name in self.coalesce_headers))
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]],
+        json: Optional[Any],
+        headers: Optional[Dict[str, str]],
+        correlation_id: Optional[str],
+        retries: Optional[int],
+        idempotent: Optional[bool],
+        hedge_copy: bool = False,
+    ) -> ResponseT:
+        full_url = _build_url(self.base_url, url)
+        if hedge_copy:
+            # Bản hedge của một call đã được tính: không nạp retry budget, không qua breaker, không retry
+            resp = await self._client.request(method, full_url, params=params, json=json,
+                                              headers=self._headers(headers, correlation_id), timeout=self.timeout)
+            resp.raise_for_status()
+            return resp
         attempts = max(1, retries or self.retries)
         last_exc: Optional[Exception] = None
-        full_url = _build_url(self.base_url, url)
+        up = upstreams.get(full_url)
+        up.budget.deposit()
         for attempt in range(attempts):
+            up.breaker.before_call()
             try:
                 resp = await self._client.request(
                     method,
@@ -173,14 +395,18 @@ class AsyncHttpClient:
                     params=params,
                     json=json,
                     headers=self._headers(headers, correlation_id),
+                    timeout=self.timeout,
                 )
                 resp.raise_for_status()
-                return resp
             except (httpx.TimeoutException, httpx.TransportError, httpx.HTTPStatusError) as ex:
                 last_exc = ex
-                if attempt >= attempts - 1:
+                delay = _retry_delay(up, self.retry, method, ex, attempt, attempts, idempotent)
+                if delay is None:
                     raise
-                await asyncio.sleep(BACKOFF_FACTOR * (2 ** attempt))
+                await asyncio.sleep(delay)
+                continue
+            up.breaker.record(False)
+            return resp
         assert last_exc is not None
         raise last_exc
 
@@ -197,7 +423,8 @@ class AsyncHttpClient:
         return await self.request("DELETE", url, **kwargs)
 
     async def aclose(self) -> None:
-        await self._client.aclose()
+        if self._owns_client:
+            await self._client.aclose()
 
     # --- helpers to manage default headers (e.g., Authorization) ---
     def set_default_headers(self, headers: Dict[str, str]) -> None:
@@ -212,26 +439,38 @@ class AsyncHttpClient:
             self._default_headers.pop("Authorization", None)
 
 
-# Factory helpers from env (sync clients)
+def pooled_client(base_url: str = "", **kwargs: Any) -> HttpClient:
+    """HttpClient riêng (headers, retries) trên connection pool dùng chung của upstream."""
+    return HttpClient(base_url, client=registry.client(base_url), **kwargs)
+
+
+def pooled_async_client(base_url: str = "", **kwargs: Any) -> AsyncHttpClient:
+    """Như pooled_client, cho event loop đang chạy (gọi từ trong coroutine); single_flight=True để gộp GET trùng."""
+    return AsyncHttpClient(base_url, client=registry.async_client(base_url), **kwargs)
+
+
+# Factory helpers from env (sync clients, pooled per upstream)
 def make_account_client() -> HttpClient:
-    return HttpClient(os.getenv("ACCOUNT_SERVICE_URL", "http://account-service:8080"))
+    return pooled_client(os.getenv("ACCOUNT_SERVICE_URL", "http://account-service:8080"))
 
 
 def make_payment_client() -> HttpClient:
-    return HttpClient(os.getenv("PAYMENT_SERVICE_URL", "http://payment-service:8080"))
+    return pooled_client(os.getenv("PAYMENT_SERVICE_URL", "http://payment-service:8080"))
 
 
 def make_tuition_client() -> HttpClient:
-    return HttpClient(os.getenv("TUITION_SERVICE_URL", "http://tuition-service:8080"))
+    return pooled_client(os.getenv("TUITION_SERVICE_URL", "http://tuition-service:8080"))
 
 
 def make_otp_client() -> HttpClient:
-    return HttpClient(os.getenv("OTP_SERVICE_URL", "http://otp-service:8080"))
+    return pooled_client(os.getenv("OTP_SERVICE_URL", "http://otp-service:8080"))
 
 
 __all__ = [
     "HttpClient",
     "AsyncHttpClient",
+    "pooled_client",
+    "pooled_async_client",
     "make_account_client",
     "make_payment_client",
     "make_tuition_client",
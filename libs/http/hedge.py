@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+"""Hedged requests: cut tail latency of read-only calls to replicated upstreams.
+
+``hedged(call, upstream, policy)`` starts ``call()``. If it has not finished after
+the upstream's recent ``quantile`` latency (p95 by default), it starts a second
+``call()`` and returns whichever succeeds first; the other is cancelled. When one of
+them fails, the other one's result is used. Only about 5% of calls are slower than
+the p95, so hedging roughly doubles those slow calls and adds little average load.
+A ``RetryBudget`` per upstream (``budget_ratio`` of the calls) caps the extra load:
+when a degraded upstream pushes every call past the delay, the budget runs out and
+calls stop being hedged.
+
+The delay comes from the last ``window`` successful latencies of primary attempts
+(a call the hedge won adds no sample: its time includes the delay itself and would
+push the quantile up to ``max_delay``), recomputed every ``RECOMPUTE_EVERY`` samples and clamped to
+``[min_delay, max_delay]``; ``initial_delay`` is used until ``min_samples`` are known.
+Only hedge calls that are safe to send twice (GET/HEAD or explicitly idempotent).
+
+``AsyncHttpClient(hedge=HedgePolicy())`` hedges GET/HEAD and ``idempotent=True`` calls; the gateway
+uses ``hedged`` directly around its pooled client. Metrics, labelled by ``upstream``:
+``http_client_hedged_total``, ``http_client_hedge_wins_total`` (the hedge answered
+first), ``http_client_hedge_budget_exhausted_total`` and the gauge
+``http_client_hedge_delay_seconds``.
+"""
+
+import asyncio
+import collections
+import os
+import threading
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from libs.metrics import registry as metrics
+from .pool import origin
+from .resilience import RetryBudget
+
+T = TypeVar("T")
+
+QUANTILE = float(os.getenv("HTTP_HEDGE_QUANTILE", "0.95"))
+MIN_DELAY = float(os.getenv("HTTP_HEDGE_MIN_DELAY", "0.01"))
+MAX_DELAY = float(os.getenv("HTTP_HEDGE_MAX_DELAY", "1.0"))
+INITIAL_DELAY = float(os.getenv("HTTP_HEDGE_INITIAL_DELAY", "0.1"))
+BUDGET_RATIO = float(os.getenv("HTTP_HEDGE_BUDGET_RATIO", "0.1"))
+RECOMPUTE_EVERY = 10
+
+
+class _Upstream:
+    def __init__(self, name: str, policy: "HedgePolicy") -> None:
+        self.name = name
+        self.policy = policy
+        self.latencies: Deque[float] = collections.deque(maxlen=policy.window)
+        self.budget = RetryBudget(ratio=policy.budget_ratio, min_per_sec=0.0, capacity=policy.budget_capacity)
+        self.delay = policy.initial_delay
+        self._since = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        p = self.policy
+        with self._lock:
+            self.latencies.append(seconds)
+            self._since += 1
+            if len(self.latencies) < p.min_samples or self._since < RECOMPUTE_EVERY:
+                return
+            self._since = 0
+            ordered = sorted(self.latencies)
+            q = ordered[min(len(ordered) - 1, int(p.quantile * len(ordered)))]
+            self.delay = min(p.max_delay, max(p.min_delay, q))
+        metrics.set_gauge("http_client_hedge_delay_seconds", self.delay, upstream=self.name)
+
+
+class HedgePolicy:
+    def __init__(self, *, quantile: float = QUANTILE,
+                 min_delay: float = MIN_DELAY,
+                 max_delay: float = MAX_DELAY,
+                 initial_delay: float = INITIAL_DELAY,
+                 window: int = 200,
+                 min_samples: int = 20,
+                 budget_ratio: float = BUDGET_RATIO,
+                 budget_capacity: float = 10.0) -> None:
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.window = max(1, window)
+        self.min_samples = max(1, min_samples)
+        self.budget_ratio = budget_ratio
+        self.budget_capacity = budget_capacity
+        self._upstreams: Dict[str, _Upstream] = {}
+        self._lock = threading.Lock()
+
+    def upstream(self, url: str) -> _Upstream:
+        key = origin(url)
+        with self._lock:
+            up = self._upstreams.get(key)
+            if up is None:
+                up = self._upstreams[key] = _Upstream(key, self)
+            return up
+
+    def delay(self, url: str) -> float:
+        return self.upstream(url).delay
+
+
+def _settle(task: "asyncio.Future") -> None:
+    # Task thua đã xong với exception: đọc nó để asyncio không log "never retrieved"
+    if task.done() and not task.cancelled():
+        task.exception()
+    elif not task.done():
+        task.cancel()
+
+
+async def hedged(call: Callable[[], Awaitable[T]], upstream: str, policy: HedgePolicy,
+                 hedge_call: Optional[Callable[[], Awaitable[T]]] = None) -> T:
+    """
+    Chạy call(); quá delay của upstream mà chưa xong thì gọi thêm hedge_call() (mặc định call),
+    lấy kết quả thành công nhanh nhất. Attempt raise exception là thua.
+    """
+    up = policy.upstream(upstream)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    def _primary(result: T) -> T:
+        # Chỉ latency của attempt đầu: delay + thời gian của bản hedge không được tính vào p95
+        up.observe(loop.time() - started)
+        return result
+
+    up.budget.deposit()
+    tasks = [asyncio.ensure_future(call())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=up.delay)
+        if done:
+            return _primary(tasks[0].result())
+        if not up.budget.withdraw():
+            metrics.inc("http_client_hedge_budget_exhausted_total", upstream=up.name)
+            return _primary(await tasks[0])
+        metrics.inc("http_client_hedged_total", upstream=up.name)
+        tasks.append(asyncio.ensure_future((hedge_call or call)()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is tasks[0]:
+                        return _primary(task.result())
+                    metrics.inc("http_client_hedge_wins_total", upstream=up.name)
+                    return task.result()
+                error = error or task.exception()
+        assert error is not None
+        raise error
+    finally:
+        for task in tasks:
+            _settle(task)
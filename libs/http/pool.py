@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+"""Process-wide keep-alive connection pools, one per upstream.
+
+Building an ``httpx.Client`` per call opens a new TCP connection (and handshake) every
+time and leaks its sockets when nobody closes it. ``registry`` keeps one pooled
+``httpx.Client`` per upstream origin (``scheme://host:port``) for the whole process, and
+one ``httpx.AsyncClient`` per origin and event loop (an async pool cannot be shared
+across loops). ``HttpClient`` / ``AsyncHttpClient`` built with ``pooled_client()`` /
+``pooled_async_client()`` (libs.http.client) are thin wrappers over these pools: their
+headers and retries are their own, the connections are shared.
+
+Pool limits come from ``HTTP_POOL_MAX_CONNECTIONS``, ``HTTP_POOL_MAX_KEEPALIVE`` and
+``HTTP_POOL_KEEPALIVE_EXPIRY``; ``HTTP_CLIENT_HTTP2=true`` turns on HTTP/2 when the
+``h2`` package is installed. ``registry.configure(url, ...)`` overrides them for one
+upstream before its first use. Services call ``registry.close()`` (sync pools) and
+``await registry.aclose()`` (pools of the running loop) on shutdown.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from dataclasses import dataclass, replace
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+try:
+    import httpx
+except Exception:  # pragma: no cover
+    httpx = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "false").lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    max_connections: int = MAX_CONNECTIONS
+    max_keepalive: int = MAX_KEEPALIVE
+    keepalive_expiry: float = KEEPALIVE_EXPIRY
+    http2: bool = HTTP2
+
+    def kwargs(self) -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=self.max_connections,
+                              max_keepalive_connections=self.max_keepalive,
+                              keepalive_expiry=self.keepalive_expiry)
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but the h2 package is missing; using HTTP/1.1")
+                http2 = False
+        return {"limits": limits, "http2": http2}
+
+
+def origin(url: str) -> str:
+    """`http://account-service:8080/x` -> `http://account-service:8080` (khóa của pool)."""
+    parts = urlsplit(url)
+    if not parts.scheme or not parts.netloc:
+        return ""  # URL tương đối: dùng chung pool mặc định
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class ClientRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._config: Dict[str, PoolConfig] = {}
+        self._sync: Dict[str, "httpx.Client"] = {}
+        self._async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]" = \
+            weakref.WeakKeyDictionary()
+
+    def configure(self, url: str, **overrides: Any) -> None:
+        """Limits riêng cho một upstream (max_connections, max_keepalive, keepalive_expiry, http2)."""
+        key = origin(url)
+        with self._lock:
+            if key in self._sync:
+                logger.warning("http pool %s is already open; new limits apply once it is reopened", key)
+            self._config[key] = replace(self._config.get(key, PoolConfig()), **overrides)
+
+    def _kwargs(self, key: str) -> Dict[str, Any]:
+        return self._config.get(key, PoolConfig()).kwargs()
+
+    def client(self, url: str = "") -> "httpx.Client":
+        """httpx.Client dùng chung của upstream `url` (tạo ở lần gọi đầu)."""
+        if httpx is None:
+            raise RuntimeError("httpx is required for the HTTP client pool; please install it.")
+        key = origin(url)
+        with self._lock:
+            c = self._sync.get(key)
+            if c is None or c.is_closed:
+                c = self._sync[key] = httpx.Client(**self._kwargs(key))
+            return c
+
+    def async_client(self, url: str = "") -> "httpx.AsyncClient":
+        """httpx.AsyncClient dùng chung của upstream `url` trên event loop đang chạy."""
+        if httpx is None:
+            raise RuntimeError("httpx is required for the HTTP client pool; please install it.")
+        key = origin(url)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async.setdefault(loop, {})
+            c = clients.get(key)
+            if c is None or c.is_closed:
+                c = clients[key] = httpx.AsyncClient(**self._kwargs(key))
+            return c
+
+    def close(self) -> None:
+        """Đóng các pool sync; lần gọi client() sau sẽ mở pool mới."""
+        with self._lock:
+            clients, self._sync = list(self._sync.values()), {}
+        for c in clients:
+            c.close()
+
+    async def aclose(self) -> None:
+        """Đóng các pool async của event loop đang chạy."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = list(self._async.pop(loop, {}).values())
+        for c in clients:
+            await c.aclose()
+
+
+registry = ClientRegistry()
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+"""Retry policy, retry budget and circuit breaker for inter-service HTTP calls.
+
+``HttpClient`` / ``AsyncHttpClient`` used to retry every failure three times, 4xx and
+POSTs included. During an upstream slowdown that triples the load exactly when it
+hurts. Three mechanisms now decide whether a call is made or retried:
+
+- ``RetryPolicy`` retries only what is safe and useful. A connect error can always be
+  retried, because the request never left. Timeouts, dropped connections and the
+  statuses in ``statuses`` (429/502/503/504) are retried only for idempotent methods
+  (or ``idempotent=True`` per request). The delay is exponential with full jitter,
+  capped at ``max_backoff``, and a ``Retry-After`` header is honoured within that cap.
+- ``RetryBudget`` is a token bucket per upstream. Every call adds ``ratio`` tokens and
+  every retry spends one, so retries stay below ``ratio`` of the traffic plus
+  ``min_per_sec``. When the bucket is empty the error is returned instead of retried.
+- ``CircuitBreaker`` keeps the outcome of the last ``window`` calls per upstream. When
+  at least ``min_calls`` were made and the failure rate reaches ``failure_rate``, it
+  opens. While open, calls fail fast with ``CircuitOpenError`` for ``open_sec``. Then
+  it lets ``half_open_calls`` trial calls through: if they succeed it closes, if one
+  fails it opens again. Only transport errors, timeouts and 5xx count as failures; a
+  4xx means the upstream is up.
+
+Metrics (libs.metrics), labelled by ``upstream`` (origin, see libs.http.pool):
+``http_client_breaker_state`` (0 closed, 1 half-open, 2 open),
+``http_client_breaker_opened_total``, ``http_client_rejected_total``,
+``http_client_retries_total{reason}`` and ``http_client_retry_budget_exhausted_total``.
+"""
+
+import collections
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, FrozenSet, Optional
+
+try:
+    import httpx
+except Exception:  # pragma: no cover
+    httpx = None  # type: ignore
+
+from libs.metrics import registry as metrics
+from .pool import origin
+
+MAX_BACKOFF = float(os.getenv("HTTP_CLIENT_MAX_BACKOFF", "2.0"))
+BUDGET_RATIO = float(os.getenv("HTTP_RETRY_BUDGET_RATIO", "0.2"))
+BUDGET_MIN_PER_SEC = float(os.getenv("HTTP_RETRY_BUDGET_MIN_PER_SEC", "1.0"))
+BREAKER_WINDOW = int(os.getenv("HTTP_BREAKER_WINDOW", "20"))
+BREAKER_FAILURE_RATE = float(os.getenv("HTTP_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("HTTP_BREAKER_MIN_CALLS", "10"))
+BREAKER_OPEN_SEC = float(os.getenv("HTTP_BREAKER_OPEN_SEC", "10"))
+
+IDEMPOTENT_METHODS: FrozenSet[str] = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRYABLE_STATUSES: FrozenSet[int] = frozenset({429, 502, 503, 504})
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Upstream đang bị circuit breaker chặn; gọi lại sau `retry_after` giây."""
+
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(f"circuit open for {upstream or 'default upstream'}; retry in {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def _status(ex: Exception) -> Optional[int]:
+    if httpx is not None and isinstance(ex, httpx.HTTPStatusError):
+        return ex.response.status_code
+    return None
+
+
+def is_failure(ex: Exception) -> bool:
+    """Lỗi tính cho circuit breaker: transport/timeout và 5xx (4xx nghĩa là upstream vẫn sống)."""
+    status = _status(ex)
+    return status is None or status >= 500
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3
+    backoff: float = 0.2
+    max_backoff: float = MAX_BACKOFF
+    statuses: FrozenSet[int] = RETRYABLE_STATUSES
+    methods: FrozenSet[str] = IDEMPOTENT_METHODS
+
+    def reason(self, method: str, ex: Exception, idempotent: Optional[bool] = None) -> Optional[str]:
+        """Lý do retry (nhãn metric) hoặc None nếu không nên retry."""
+        if httpx is None:
+            return None
+        if isinstance(ex, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return "connect"  # request chưa được gửi đi: retry được cả POST
+        safe = method.upper() in self.methods if idempotent is None else idempotent
+        if not safe:
+            return None
+        status = _status(ex)
+        if status is not None:
+            return f"status_{status}" if status in self.statuses else None
+        if isinstance(ex, httpx.TimeoutException):
+            return "timeout"
+        if isinstance(ex, httpx.TransportError):
+            return "transport"
+        return None
+
+    def delay(self, attempt: int, ex: Exception) -> float:
+        """Full jitter trên backoff * 2^attempt; Retry-After (giây) được tôn trọng trong giới hạn max_backoff."""
+        status = _status(ex)
+        if status is not None:
+            retry_after = ex.response.headers.get("retry-after", "")  # type: ignore[attr-defined]
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+
+class RetryBudget:
+    """Token bucket: mỗi call nạp `ratio` token, mỗi retry tiêu 1; cộng thêm `min_per_sec` token mỗi giây."""
+
+    def __init__(self, ratio: float = BUDGET_RATIO, min_per_sec: float = BUDGET_MIN_PER_SEC,
+                 capacity: Optional[float] = None) -> None:
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.capacity = capacity if capacity is not None else max(10.0, min_per_sec * 10)
+        self._tokens = self.capacity
+        self._at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._at) * self.min_per_sec)
+        self._at = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class CircuitBreaker:
+    def __init__(self, name: str = "", *,
+                 window: int = BREAKER_WINDOW,
+                 failure_rate: float = BREAKER_FAILURE_RATE,
+                 min_calls: int = BREAKER_MIN_CALLS,
+                 open_sec: float = BREAKER_OPEN_SEC,
+                 half_open_calls: int = 1) -> None:
+        self.name = name
+        self.window = max(1, window)
+        self.failure_rate = failure_rate
+        self.min_calls = max(1, min_calls)
+        self.open_sec = open_sec
+        self.half_open_calls = max(1, half_open_calls)
+        self._outcomes: Deque[bool] = collections.deque(maxlen=self.window)  # True = fail
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0        # call thử đã cho qua trong half-open
+        self._successes = 0     # call thử đã thành công
+        self._lock = threading.Lock()
+        metrics.set_gauge("http_client_breaker_state", 0, upstream=name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current(time.monotonic())
+
+    def _set(self, state: str) -> None:
+        self._state = state
+        metrics.set_gauge("http_client_breaker_state", _STATE_VALUE[state], upstream=self.name)
+
+    def _current(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.open_sec:
+            self._set(HALF_OPEN)
+            self._trials = self._successes = 0
+        elif self._state == HALF_OPEN and now - self._opened_at >= 2 * self.open_sec:
+            # call thử không báo kết quả (exception lạ, task bị cancel): cho thử lại
+            self._opened_at = now - self.open_sec
+            self._trials = self._successes = 0
+        return self._state
+
+    def before_call(self) -> None:
+        """Gọi trước mỗi attempt; raise CircuitOpenError nếu breaker không cho qua."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return
+            retry_after = max(0.0, self.open_sec - (now - self._opened_at)) if state == OPEN else 0.0
+        metrics.inc("http_client_rejected_total", upstream=self.name)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def _open(self, now: float) -> None:
+        self._set(OPEN)
+        self._opened_at = now
+        self._outcomes.clear()
+        metrics.inc("http_client_breaker_opened_total", upstream=self.name)
+
+    def record(self, failed: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current(now)
+            if state == HALF_OPEN:
+                if failed:
+                    self._open(now)
+                    return
+                self._successes += 1
+                if self._successes >= self.half_open_calls:
+                    self._set(CLOSED)
+                return
+            if state == OPEN:
+                return  # kết quả của call bắt đầu trước khi breaker mở
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+
+@dataclass
+class Upstream:
+    name: str
+    breaker: CircuitBreaker
+    budget: RetryBudget = field(default_factory=RetryBudget)
+
+
+class UpstreamRegistry:
+    """Breaker + retry budget dùng chung cho mọi client tới cùng một upstream (origin)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._upstreams: Dict[str, Upstream] = {}
+        self._overrides: Dict[str, Dict[str, Any]] = {}
+
+    def configure(self, url: str, *, budget: Optional[Dict[str, Any]] = None, **breaker: Any) -> None:
+        """Tham số breaker (window, failure_rate, ...) / budget riêng cho một upstream, trước lần dùng đầu."""
+        with self._lock:
+            self._overrides[origin(url)] = {"budget": budget or {}, "breaker": breaker}
+
+    def get(self, url: str) -> Upstream:
+        key = origin(url)
+        with self._lock:
+            up = self._upstreams.get(key)
+            if up is None:
+                cfg = self._overrides.get(key, {})
+                up = self._upstreams[key] = Upstream(key, CircuitBreaker(key, **cfg.get("breaker", {})),
+                                                     RetryBudget(**cfg.get("budget", {})))
+            return up
+
+    def reset(self) -> None:
+        with self._lock:
+            self._upstreams.clear()
+
+
+upstreams = UpstreamRegistry()
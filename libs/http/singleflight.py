@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+"""Single-flight: concurrent identical requests share one upstream call.
+
+When many coroutines ask for the same resource at once (a hot tuition record, the
+same user's ``/accounts/me``), ``AsyncHttpClient(single_flight=True)`` sends only the
+first request. Callers that arrive while it is in flight await the same task and get
+the same ``httpx.Response`` (or exception); treat it as read-only. The key is the
+method, the full URL with its query params and the values of ``coalesce_headers``.
+Put every header that changes the answer in that list (by default ``authorization``
+and ``x-user-id``), otherwise two users could share one response. Only GET and HEAD
+without a body are coalesced. Nothing is cached: the entry is gone once the response
+arrives.
+
+In-flight calls are tracked per event loop. The shared call runs as its own task,
+so a cancelled caller does not cancel it for the others.
+"""
+
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+COALESCE_METHODS = frozenset({"GET", "HEAD"})
+COALESCE_HEADERS: Tuple[str, ...] = ("authorization", "x-user-id")
+
+
+def _retrieve(task: "asyncio.Task[Any]") -> None:
+    # Mọi caller có thể đã bị cancel: đánh dấu exception là đã đọc để asyncio không log cảnh báo
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Task]]" = \
+            weakref.WeakKeyDictionary()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Chạy fn() hoặc chờ call đang bay cùng key; trả về (kết quả, shared)."""
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        task = calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = calls[key] = loop.create_task(fn())
+
+            def _done(t: "asyncio.Task[Any]", key: Hashable = key) -> None:
+                if calls.get(key) is t:
+                    del calls[key]
+                _retrieve(t)
+
+            task.add_done_callback(_done)
+        return await asyncio.shield(task), shared
+
+    def in_flight(self) -> int:
+        """Số call đang bay trên event loop hiện tại."""
+        return len(self._calls.get(asyncio.get_running_loop(), {}))
+
+
+flights = SingleFlight()
@@ -0,0 +1,18 @@
+"""In-process metrics shared by libs (RMQ, HTTP)."""
+
+from .registry import (LATENCY_BUCKETS, Registry, Sink, registry, inc, set_gauge, observe,
+                       histogram, snapshot)
+from . import prometheus
+
+__all__ = [
+    "LATENCY_BUCKETS",
+    "Registry",
+    "Sink",
+    "registry",
+    "inc",
+    "set_gauge",
+    "observe",
+    "histogram",
+    "snapshot",
+    "prometheus",
+]
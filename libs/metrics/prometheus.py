@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+"""Prometheus text exposition (format 0.0.4) of a ``Registry``.
+
+Counters and gauges map one to one; histograms get cumulative ``_bucket`` series
+plus ``_sum`` / ``_count``; plain summaries export ``_sum`` / ``_count`` and their
+max as a separate ``<name>_max`` gauge. Services serve ``render()`` on ``/metrics``.
+"""
+
+import math
+from typing import Dict, Iterable, List, Tuple
+
+from .registry import LabelKey, Registry, registry as default_registry
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # the web framework appends "; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(key: Iterable[Tuple[str, str]]) -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in key]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v))
+
+
+def render(reg: Registry = default_registry) -> str:
+    snap = reg.snapshot()
+    out: List[str] = []
+
+    def family(name: str, kind: str, series: Dict[LabelKey, float]) -> None:
+        out.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(series.items()):
+            out.append(f"{name}{_fmt_labels(key)} {_fmt_value(value)}")
+
+    for name, series in sorted(snap["counters"].items()):
+        family(name, "counter", series)
+    for name, series in sorted(snap["gauges"].items()):
+        family(name, "gauge", series)
+
+    histograms = snap["histograms"]
+    for name, series in sorted(snap["summaries"].items()):
+        if name in histograms:
+            bounds = histograms[name]["buckets"]
+            out.append(f"# TYPE {name} histogram")
+            for key, s in sorted(series.items()):
+                counts = histograms[name]["series"].get(key, [0.0] * len(bounds))
+                acc = 0.0
+                for le, c in zip(bounds, counts):
+                    acc += c
+                    out.append(f"{name}_bucket{_fmt_labels(key + (('le', _fmt_value(le)),))} {_fmt_value(acc)}")
+                out.append(f"{name}_bucket{_fmt_labels(key + (('le', '+Inf'),))} {_fmt_value(s['count'])}")
+                out.append(f"{name}_sum{_fmt_labels(key)} {_fmt_value(s['sum'])}")
+                out.append(f"{name}_count{_fmt_labels(key)} {_fmt_value(s['count'])}")
+        else:
+            out.append(f"# TYPE {name} summary")
+            for key, s in sorted(series.items()):
+                out.append(f"{name}_sum{_fmt_labels(key)} {_fmt_value(s['sum'])}")
+                out.append(f"{name}_count{_fmt_labels(key)} {_fmt_value(s['count'])}")
+        family(f"{name}_max", "gauge", {key: s["max"] for key, s in series.items()})
+
+    return "\n".join(out) + "\n"
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+"""Tiny thread-safe metrics registry: counters, gauges, summaries and histograms.
+
+Series are keyed by metric name plus a sorted tuple of label pairs, e.g.
+``inc("rmq_published_total", routing_key="payment.v1.initiated")``.
+
+``observe()`` always keeps count/sum/max; names declared with ``histogram()``
+also get cumulative bucket counts. Every record is forwarded to the registered
+sinks (see ``Sink``) so metrics can be pushed elsewhere (StatsD, logs, ...)
+on top of the in-process store that the Prometheus exporter reads.
+"""
+
+import bisect
+import logging
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Seconds; good default for handler / publish latencies
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Sink:
+    """Nhận mọi record của Registry; override các method cần dùng."""
+
+    def inc(self, name: str, value: float, labels: LabelKey) -> None:
+        pass
+
+    def set_gauge(self, name: str, value: float, labels: LabelKey) -> None:
+        pass
+
+    def observe(self, name: str, value: float, labels: LabelKey) -> None:
+        pass
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelKey, Dict[str, float]]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._sinks: List[Sink] = []
+
+    def add_sink(self, sink: Sink) -> None:
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink: Sink) -> None:
+        if sink in self._sinks:
+            self._sinks.remove(sink)
+
+    def _forward(self, method: str, name: str, value: float, key: LabelKey) -> None:
+        for sink in self._sinks:
+            try:
+                getattr(sink, method)(name, value, key)
+            except Exception:
+                logger.debug("metrics sink %r failed", sink, exc_info=True)
+
+    def histogram(self, name: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        """Khai báo `name` là histogram (bucket upper bounds, tăng dần); idempotent."""
+        with self._lock:
+            self._buckets.setdefault(name, tuple(sorted(float(b) for b in buckets)))
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+        if self._sinks:
+            self._forward("inc", name, value, key)
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = float(value)
+        if self._sinks:
+            self._forward("set_gauge", name, float(value), key)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record one observation (count/sum/max, plus buckets for histograms), e.g. a latency in seconds."""
+        value = float(value)
+        key = _labels(labels)
+        with self._lock:
+            s = self._summaries.setdefault(name, {}).setdefault(key, {"count": 0.0, "sum": 0.0, "max": 0.0})
+            s["count"] += 1
+            s["sum"] += value
+            if value > s["max"]:
+                s["max"] = value
+            bounds = self._buckets.get(name)
+            if bounds is not None:
+                counts = self._histograms.setdefault(name, {}).setdefault(key, [0.0] * len(bounds))
+                # Non-cumulative per bucket; the exporter accumulates. Above the last bound -> only +Inf (count)
+                i = bisect.bisect_left(bounds, value)
+                if i < len(bounds):
+                    counts[i] += 1
+        if self._sinks:
+            self._forward("observe", name, value, key)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Point-in-time copy of every series, for logging or an HTTP endpoint."""
+        with self._lock:
+            return {
+                "counters": {n: dict(s) for n, s in self._counters.items()},
+                "gauges": {n: dict(s) for n, s in self._gauges.items()},
+                "summaries": {n: {k: dict(v) for k, v in s.items()} for n, s in self._summaries.items()},
+                "histograms": {
+                    n: {"buckets": self._buckets[n], "series": {k: list(v) for k, v in s.items()}}
+                    for n, s in self._histograms.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+            self._histograms.clear()
+
+
+# Process-wide default registry
+registry = Registry()
+
+inc = registry.inc
+set_gauge = registry.set_gauge
+observe = registry.observe
+histogram = registry.histogram
+snapshot = registry.snapshot
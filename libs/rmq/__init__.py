@@ -1,16 +1,53 @@
 """RabbitMQ helpers: bus, publisher, consumer."""
 
-from .bus import declare_queue, publish, start_consume
+from .bus import declare_queue, publish, start_consume, start_consume_batch, BatchMessage, RetryPolicy
 from .publisher import publish_event
-from .consumer import subscribe, run, Subscription
+from .consumer import subscribe, subscribe_batch, run, Subscription, BatchSubscription, PartitionOrderError
+from .confirms import ConfirmPublisher, PublishNacked, PublishNotSent, PublishUnconfirmed
+from .dedup import DedupStore
+from .flow import AdaptivePrefetch, Saturated
+from .topology import ExchangeSpec, QueueSpec, Topology
+from .sharding import ShardedQueue
+from .transport import Transport, PikaTransport, get_transport, set_transport
+from .memory import MemoryBroker, MemoryTransport
+from . import aio, codec, lag, outbox, spool, topology
 
 __all__ = [
     "declare_queue",
     "publish",
     "start_consume",
+    "start_consume_batch",
+    "BatchMessage",
+    "RetryPolicy",
     "publish_event",
     "subscribe",
+    "subscribe_batch",
     "run",
     "Subscription",
+    "BatchSubscription",
+    "PartitionOrderError",
+    "ConfirmPublisher",
+    "PublishNacked",
+    "PublishNotSent",
+    "PublishUnconfirmed",
+    "DedupStore",
+    "AdaptivePrefetch",
+    "Saturated",
+    "ExchangeSpec",
+    "QueueSpec",
+    "ShardedQueue",
+    "Topology",
+    "Transport",
+    "PikaTransport",
+    "get_transport",
+    "set_transport",
+    "MemoryBroker",
+    "MemoryTransport",
+    "aio",
+    "codec",
+    "lag",
+    "outbox",
+    "spool",
+    "topology",
 ]
 
@@ -0,0 +1,56 @@
+# libs/rmq/aio.py
+"""
+Asyncio publish path cho FastAPI `async def` handlers.
+
+Message được giao cho ConfirmPublisher (I/O thread riêng, xem confirms.py) nên
+event loop không bao giờ block trên pika; handler chỉ `await` broker ack.
+"""
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+from .bus import publish as _publish
+from .confirms import PublishNotSent
+from .publisher import _event_headers
+
+CONFIRM_TIMEOUT = float(os.getenv("RABBIT_CONFIRM_TIMEOUT", "10"))
+
+
+async def publish(routing_key: str,
+                  body: Dict[str, Any],
+                  headers: Optional[Dict[str, Any]] = None,
+                  message_id: Optional[str] = None,
+                  *,
+                  wait_confirm: bool = True,
+                  timeout: Optional[float] = CONFIRM_TIMEOUT) -> None:
+    """
+    Publish không block event loop. wait_confirm=True chờ broker ack tối đa `timeout` giây;
+    False thì chỉ enqueue rồi trả về.
+    Hết timeout mà message còn trong hàng đợi của ConfirmPublisher: nó bị huỷ, raise PublishNotSent
+    (chắc chắn chưa tới broker). Đã giao cho channel rồi thì raise asyncio.TimeoutError: kết quả
+    không xác định, broker vẫn có thể nhận và ack sau deadline (PublishUnconfirmed/AMQPError cũng vậy).
+    """
+    fut = _publish(routing_key, body, headers=headers, message_id=message_id, confirm=True)
+    if not wait_confirm or fut is None:
+        return
+    try:
+        await asyncio.wait_for(asyncio.wrap_future(fut), timeout)
+    except asyncio.TimeoutError:
+        if fut.cancel():
+            raise PublishNotSent(f"publish to {routing_key} not sent within {timeout}s") from None
+        raise
+
+
+async def publish_event(
+    routing_key: str,
+    payload: Dict[str, Any],
+    *,
+    event_type: str,
+    idempotency_key: Optional[str] = None,
+    correlation_id: Optional[str] = None,
+    partition_key: Optional[str] = None,
+    wait_confirm: bool = True,
+    timeout: Optional[float] = CONFIRM_TIMEOUT,
+) -> None:
+    headers = _event_headers(event_type, idempotency_key, correlation_id, partition_key)
+    await publish(routing_key, payload, headers=headers, wait_confirm=wait_confirm, timeout=timeout)
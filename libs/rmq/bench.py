@@ -0,0 +1,151 @@
+# libs/rmq/bench.py
+from __future__ import annotations
+
+"""Benchmark: static vs adaptive prefetch (libs.rmq.flow) on the in-memory broker.
+
+    python -m libs.rmq.bench [--rate 300] [--seconds 4]
+
+Two replicas consume one queue with 4 handler threads each. Replica "fast" answers in
+2 ms; replica "slow" sits on a degraded database (40 ms per message). In the
+"saturated" scenario its connection pool also times out (handler raises after 20 ms)
+for the first 1.5 s. Failed messages go through a 250 ms retry tier as in the services.
+Messages are published at a fixed rate; latency is publish -> handler success, so it
+includes retries and the time a message sat in a replica's prefetch buffer.
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pika
+
+from .bus import RetryPolicy, _Rmq, start_consume
+from .flow import AdaptivePrefetch, Saturated
+from .memory import MemoryConnection, MemoryTransport
+from .topology import QueueSpec
+from .transport import get_transport, set_transport
+
+QUEUE = "bench.work.q"
+WORKERS = 4
+
+
+class _Transport(MemoryTransport):
+    """Ghi lại connection để đóng consumer khi hết một lượt chạy."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.connections: List[MemoryConnection] = []
+
+    def connect(self) -> MemoryConnection:
+        conn = super().connect()
+        self.connections.append(conn)
+        return conn
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[max(0, int(round(q * len(ordered))) - 1)] if ordered else float("nan")
+
+
+def run_once(*, adaptive: bool, saturate_for: float, rate: int, seconds: float,
+             fast_ms: float = 2.0, slow_ms: float = 40.0, target_ms: float = 50.0) -> Dict[str, object]:
+    transport = _Transport()
+    previous = get_transport()
+    set_transport(transport)
+    retry = RetryPolicy([250], max_attempts=50)
+    admin = transport.connect().channel()
+    QueueSpec(QUEUE, (), dead_letter=False, retry=retry).declare(admin)
+
+    total = int(rate * seconds)
+    latencies: List[float] = []
+    failures = [0]
+    lock = threading.Lock()
+    done = threading.Event()
+    started = time.perf_counter()
+
+    def handler(service_ms: float, saturates: bool):
+        def _handle(payload, headers, message_id) -> None:
+            if saturates and time.perf_counter() - started < saturate_for:
+                time.sleep(0.02)  # chờ connection pool rồi timeout
+                with lock:
+                    failures[0] += 1
+                raise Saturated("db pool exhausted")
+            time.sleep(service_ms / 1000.0)
+            with lock:
+                latencies.append(time.perf_counter() - payload["t"])
+                if len(latencies) >= total:
+                    done.set()
+        return _handle
+
+    flows: Dict[str, Optional[AdaptivePrefetch]] = {}
+    threads = []
+    for name, service_ms, saturates in (("fast", fast_ms, False), ("slow", slow_ms, True)):
+        flow = AdaptivePrefetch(32, target_latency=target_ms / 1000.0, interval=0.25, min_samples=5,
+                                pause=0.5) if adaptive else None
+        flows[name] = flow
+
+        def _consume(h=handler(service_ms, saturates), flow=flow) -> None:
+            try:
+                start_consume(QUEUE, h, prefetch=32, workers=WORKERS, retry=retry, flow=flow)
+            except Exception:
+                pass  # connection đóng khi kết thúc lượt chạy
+            finally:
+                _Rmq.reset()
+
+        t = threading.Thread(target=_consume, name=f"bench-{name}", daemon=True)
+        t.start()
+        threads.append(t)
+    time.sleep(0.2)  # cho consumer kịp basic_consume
+
+    pub = transport.connect().channel()
+    props = pika.BasicProperties(content_type="application/json", delivery_mode=2)
+    t0 = time.perf_counter()
+    for i in range(total):
+        delay = t0 + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        pub.basic_publish("", QUEUE, json.dumps({"i": i, "t": time.perf_counter()}).encode(), props)
+    done.wait(seconds * 10 + 30)
+
+    for conn in transport.connections:
+        conn.close()
+    for t in threads:
+        t.join(5)
+    set_transport(previous)
+
+    ordered = sorted(latencies)
+    return {
+        "processed": len(ordered),
+        "failures": failures[0],
+        "p50": statistics.median(ordered) if ordered else float("nan"),
+        "p95": _percentile(ordered, 0.95),
+        "p99": _percentile(ordered, 0.99),
+        "max": ordered[-1] if ordered else float("nan"),
+        "prefetch": {n: (f.prefetch if f is not None else 32) for n, f in flows.items()},
+        "pauses": sum(f.pauses for f in flows.values() if f is not None),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rate", type=int, default=300, help="messages per second")
+    ap.add_argument("--seconds", type=float, default=4.0, help="publish duration per run")
+    args = ap.parse_args(argv)
+    logging.getLogger("libs.rmq").setLevel(logging.ERROR)  # handler fail là cố ý
+
+    print(f"{'scenario':<10} {'prefetch':<9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'failures':>9} {'pauses':>7}  final prefetch (fast/slow)")
+    for scenario, saturate_for in (("degraded", 0.0), ("saturated", 1.5)):
+        for adaptive in (False, True):
+            r = run_once(adaptive=adaptive, saturate_for=saturate_for, rate=args.rate, seconds=args.seconds)
+            pf = r["prefetch"]
+            print(f"{scenario:<10} {'adaptive' if adaptive else 'static':<9} "
+                  f"{r['p50'] * 1000:>8.1f} {r['p95'] * 1000:>8.1f} {r['p99'] * 1000:>8.1f} {r['max'] * 1000:>8.1f} "
+                  f"{r['failures']:>9} {r['pauses']:>7}  {pf['fast']}/{pf['slow']}")
+
+
+if __name__ == "__main__":
+    main()
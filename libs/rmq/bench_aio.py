@@ -0,0 +1,151 @@
+# libs/rmq/bench_aio.py
+from __future__ import annotations
+
+"""Load test: requests/sec of init_payment as a sync endpoint vs async + aio.publish.
+
+    python -m libs.rmq.bench_aio [--clients 200] [--requests 4000] [--redis-ms 2] [--confirm-ms 5]
+
+Two FastAPI endpoints do what ``POST /payments/init`` does: write the intent to Redis
+(``--redis-ms``, simulated) and publish ``payment_initiated`` on the in-memory broker.
+
+- ``sync``: a ``def`` endpoint (the old init_payment) publishing through the pooled
+  channels of ``bus.publish``. Every request holds one of AnyIO's 40 threadpool threads.
+- ``async``: an ``async def`` endpoint awaiting ``aio.publish_event``. The publish goes to
+  the ConfirmPublisher I/O thread, which acks everything queued in one batch after
+  ``--confirm-ms`` (the broker's fsync), as RabbitMQ does with ``multiple=True``.
+
+``--clients`` coroutines send requests back to back through httpx's ASGI transport until
+``--requests`` are done; latency is measured per request. Client and server share one
+process, so absolute numbers are low; compare the two rows.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import types
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI
+from pika.spec import Basic
+
+from . import aio, bus, confirms
+from .bench import _percentile
+from .confirms import ConfirmPublisher
+from .memory import MemoryBroker, MemoryTransport
+from .transport import get_transport, set_transport
+
+QUEUE = "bench.payment.q"
+ROUTING_KEY = "payment.v1.initiated"
+
+
+class _Transport(MemoryTransport):
+    # bus._publish_raw chỉ đi qua ConfirmPublisher khi transport có confirms
+    supports_confirms = True
+
+
+class _MemoryConfirms(ConfirmPublisher):
+    """ConfirmPublisher publish vào MemoryBroker; mỗi batch được ack (multiple=True) sau confirm_ms."""
+
+    def __init__(self, broker: MemoryBroker, confirm_ms: float) -> None:
+        super().__init__()
+        self._memory = MemoryTransport(broker).connect()
+        self.confirm_ms = confirm_ms
+
+    def _run(self) -> None:
+        self._ch = self._memory.channel()
+        self._ready = True
+        while not self._stopping:
+            if self._pending.empty():
+                time.sleep(0.0002)
+                continue
+            self._drain()
+            time.sleep(self.confirm_ms / 1000.0)
+            ack = Basic.Ack(delivery_tag=self._next_tag, multiple=True)
+            self._on_confirm(types.SimpleNamespace(method=ack))
+
+
+def _app(redis_ms: float) -> FastAPI:
+    app = FastAPI()
+    body = {"payment_id": "p", "user_id": "u", "tuition_id": "t", "amount": 1000, "term": 1}
+
+    @app.post("/sync")
+    def init_sync() -> Dict[str, str]:
+        time.sleep(redis_ms / 1000.0)  # set_intent (redis, sync)
+        bus.publish(ROUTING_KEY, body)
+        return {"status": "PROCESSING"}
+
+    @app.post("/async")
+    async def init_async() -> Dict[str, str]:
+        await asyncio.sleep(redis_ms / 1000.0)  # set_intent_async
+        await aio.publish_event(ROUTING_KEY, body, event_type="payment_initiated", partition_key="p")
+        return {"status": "PROCESSING"}
+
+    return app
+
+
+async def _load(app: FastAPI, path: str, clients: int, requests: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    remaining = [requests]
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker() -> None:
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                t = time.perf_counter()
+                resp = await client.post(path)
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - t)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        "rps": len(ordered) / elapsed,
+        "p50": statistics.median(ordered),
+        "p99": _percentile(ordered, 0.99),
+    }
+
+
+def run_once(*, mode: str, clients: int, requests: int, redis_ms: float, confirm_ms: float) -> Dict[str, float]:
+    broker = MemoryBroker()
+    previous = get_transport()
+    set_transport(_Transport(broker))
+    ch = MemoryTransport(broker).connect().channel()
+    ch.exchange_declare(bus.EXCHANGE, "topic", durable=True)
+    ch.queue_declare(QUEUE, durable=True)
+    ch.queue_bind(QUEUE, bus.EXCHANGE, ROUTING_KEY)
+
+    publisher = _MemoryConfirms(broker, confirm_ms)
+    confirms._publisher = publisher
+    try:
+        r = asyncio.run(_load(_app(redis_ms), f"/{mode}", clients, requests))
+        r["published"] = broker.message_count(QUEUE)
+        return r
+    finally:
+        publisher.stop(1.0)
+        confirms._publisher = None
+        bus._publisher_pool.close()
+        set_transport(previous)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clients", type=int, default=200, help="concurrent clients")
+    ap.add_argument("--requests", type=int, default=4000, help="requests per run")
+    ap.add_argument("--redis-ms", type=float, default=2.0, help="simulated Redis write per request")
+    ap.add_argument("--confirm-ms", type=float, default=5.0, help="broker time to ack a batch of publishes")
+    args = ap.parse_args(argv)
+
+    print(f"{'endpoint':<28} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'published':>10}")
+    for mode, label in (("sync", "def + bus.publish"), ("async", "async def + aio (confirmed)")):
+        r = run_once(mode=mode, clients=args.clients, requests=args.requests,
+                     redis_ms=args.redis_ms, confirm_ms=args.confirm_ms)
+        print(f"{label:<28} {r['rps']:>8.0f} {r['p50'] * 1000:>8.1f} {r['p99'] * 1000:>8.1f} {r['published']:>10}")
+
+
+if __name__ == "__main__":
+    main()
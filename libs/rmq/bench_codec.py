@@ -0,0 +1,120 @@
+# libs/rmq/bench_codec.py
+from __future__ import annotations
+
+"""Benchmark: encode/decode ops/sec and body size of each codec on real event payloads.
+
+    python -m libs.rmq.bench_codec [--seconds 0.5]
+
+Payloads are the bodies the services publish (payment_initiated, balance_held,
+otp_generated, ...), plus one with a datetime and a ``Decimal`` to cover ``_default``.
+Every registered codec is measured; ``json (stdlib)`` is ``JsonCodec`` with orjson
+unavailable, i.e. what a service without orjson installed publishes.
+"""
+
+import argparse
+import datetime
+import decimal
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import codec
+
+PAYLOADS: Dict[str, Dict[str, Any]] = {
+    "payment_initiated": {
+        "payment_id": "7f1c2a9e-3b4d-4c5e-8f60-1a2b3c4d5e6f", "user_id": "u-102938",
+        "tuition_id": "t-2024-1-522H0001", "amount": 15750000, "term": 1,
+        "email": "student.522h0001@student.tdtu.edu.vn", "student_id": "522H0001",
+    },
+    "balance_held": {
+        "user_id": "u-102938", "amount": 15750000.0,
+        "payment_id": "7f1c2a9e-3b4d-4c5e-8f60-1a2b3c4d5e6f",
+        "email": "student.522h0001@student.tdtu.edu.vn",
+    },
+    "balance_hold_failed": {
+        "user_id": "u-102938", "amount": 15750000.0, "payment_id": "7f1c2a9e-3b4d-4c5e-8f60-1a2b3c4d5e6f",
+        "reason_code": "INSUFFICIENT_FUNDS", "reason_message": "Số dư không đủ để thanh toán học phí",
+        "email": "student.522h0001@student.tdtu.edu.vn",
+    },
+    "otp_generated": {
+        "payment_id": "7f1c2a9e-3b4d-4c5e-8f60-1a2b3c4d5e6f", "user_id": "u-102938",
+        "tuition_id": "t-2024-1-522H0001", "amount": 15750000, "otp": "482913",
+        "email": "student.522h0001@student.tdtu.edu.vn",
+    },
+    "datetime+decimal": {
+        "payment_id": "7f1c2a9e-3b4d-4c5e-8f60-1a2b3c4d5e6f", "user_id": "u-102938",
+        "tuition_id": "t-2024-1-522H0001", "amount": decimal.Decimal("15750000.00"),
+        "completed_at": datetime.datetime(2024, 9, 1, 8, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+    },
+}
+
+
+class _StdlibJson(codec.JsonCodec):
+    """JsonCodec như khi không cài orjson."""
+
+    def encode(self, obj: Any) -> bytes:
+        saved, codec.orjson = codec.orjson, None
+        try:
+            return super().encode(obj)
+        finally:
+            codec.orjson = saved
+
+    def decode(self, data: bytes) -> Any:
+        saved, codec.orjson = codec.orjson, None
+        try:
+            return super().decode(data)
+        finally:
+            codec.orjson = saved
+
+
+def _codecs() -> List[Tuple[str, codec.Codec]]:
+    seen: List[codec.Codec] = []
+    out: List[Tuple[str, codec.Codec]] = []
+    for c in codec._codecs.values():
+        if c in seen:
+            continue
+        seen.append(c)
+        name = c.content_type.split("/")[-1]
+        if isinstance(c, codec.JsonCodec) and codec.orjson is not None:
+            out.append((f"{name} (orjson)", c))
+            out.append((f"{name} (stdlib)", _StdlibJson()))
+        else:
+            out.append((name, c))
+    return out
+
+
+def _rate(fn: Callable[[], Any], seconds: float) -> float:
+    n = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+        for _ in range(200):
+            fn()
+        n += 200
+        now = time.perf_counter()
+        if now >= deadline:
+            return n / (now - started)
+
+
+def run_once(c: codec.Codec, payload: Dict[str, Any], *, seconds: float) -> Dict[str, float]:
+    data = c.encode(payload)
+    return {
+        "encode": _rate(lambda: c.encode(payload), seconds),
+        "decode": _rate(lambda: c.decode(data), seconds),
+        "bytes": len(data),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=0.5, help="duration per measurement")
+    args = ap.parse_args(argv)
+
+    print(f"{'payload':<22} {'codec':<18} {'encode/s':>10} {'decode/s':>10} {'bytes':>6}")
+    for event, payload in PAYLOADS.items():
+        for name, c in _codecs():
+            r = run_once(c, payload, seconds=args.seconds)
+            print(f"{event:<22} {name:<18} {r['encode']:>10.0f} {r['decode']:>10.0f} {r['bytes']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# libs/rmq/bench_publish.py
+from __future__ import annotations
+
+"""Benchmark: publishes/sec with a new channel per publish vs the pooled publisher channels.
+
+    python -m libs.rmq.bench_publish [--threads 16] [--seconds 3] [--rtt-ms 0.5]
+
+Runs on the in-memory broker. ``--rtt-ms`` charges a broker round trip to every
+synchronous AMQP method: three for opening a connection, one for opening a channel
+and one per declare. ``basic_publish`` without confirms is asynchronous and costs
+none. ``--threads`` callers publish back to back, as FastAPI's sync handler
+threadpool does during a payment-init burst.
+
+- ``per-publish``: the old ``bus.publish``. It keeps one connection per thread, opens a
+  new channel and declares both exchanges before every ``basic_publish``.
+- ``pooled``: ``bus.publish`` through ``_ChannelPool``. A few long-lived channels are
+  shared by all threads, and exchanges are declared once per connection.
+"""
+
+import argparse
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import pika
+
+from . import bus
+from .memory import MemoryBroker, MemoryConnection, MemoryTransport
+from .transport import get_transport, set_transport
+
+QUEUE = "bench.publish.q"
+ROUTING_KEY = "payment.v1.initiated"
+BODY = {"payment_id": "p", "user_id": "u", "tuition_id": "t", "amount": 1000, "term": 1}
+_ROUND_TRIPS = {"channel": 1, "exchange_declare": 1, "exchange_bind": 1, "queue_declare": 1, "queue_bind": 1}
+
+
+class _RoundTrips:
+    """Proxy của connection/channel: mỗi method đồng bộ (xem _ROUND_TRIPS) chờ thêm `rtt` giây."""
+
+    def __init__(self, target: Any, rtt: float) -> None:
+        self._target = target
+        self._rtt = rtt
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        trips = _ROUND_TRIPS.get(name)
+        if not trips:
+            return attr
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            time.sleep(self._rtt * trips)
+            result = attr(*args, **kwargs)
+            return _RoundTrips(result, self._rtt) if name == "channel" else result
+
+        return call
+
+
+class _Transport(MemoryTransport):
+    def __init__(self, broker: MemoryBroker, rtt: float) -> None:
+        super().__init__(broker)
+        self.rtt = rtt
+        self.connections: List[MemoryConnection] = []
+
+    def connect(self) -> Any:
+        time.sleep(self.rtt * 3)  # TCP + AMQP handshake (start, tune, open)
+        conn = super().connect()
+        self.connections.append(conn)
+        return _RoundTrips(conn, self.rtt)
+
+
+def _per_publish(transport: _Transport) -> Any:
+    """bus.publish trước khi có pool: connection theo thread, channel mới + khai báo exchange mỗi lần."""
+    local = threading.local()
+    codec = bus.codec
+
+    def publish(routing_key: str, body: Dict[str, Any]) -> None:
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = transport.connect()
+        ch = conn.channel()
+        ch.exchange_declare(exchange=bus.EXCHANGE, exchange_type="topic", durable=True)
+        ch.exchange_declare(exchange=bus.DLX, exchange_type="topic", durable=True)
+        props = pika.BasicProperties(content_type=codec.DEFAULT_CONTENT_TYPE, delivery_mode=2, headers={})
+        ch.basic_publish(exchange=bus.EXCHANGE, routing_key=routing_key,
+                         body=codec.encode(body, codec.DEFAULT_CONTENT_TYPE), properties=props)
+
+    return publish
+
+
+def run_once(*, pooled: bool, threads: int, seconds: float, rtt_ms: float) -> Dict[str, float]:
+    broker = MemoryBroker()
+    transport = _Transport(broker, rtt_ms / 1000.0)
+    previous = get_transport()
+    set_transport(transport)
+    ch = MemoryTransport(broker).connect().channel()
+    ch.exchange_declare(bus.EXCHANGE, "topic", durable=True)
+    ch.queue_declare(QUEUE, durable=True)
+    ch.queue_bind(QUEUE, bus.EXCHANGE, ROUTING_KEY)
+
+    publish = (lambda rk, body: bus.publish(rk, body)) if pooled else _per_publish(transport)
+    counts = [0] * threads
+    stop = threading.Event()
+
+    def _worker(i: int) -> None:
+        while not stop.is_set():
+            publish(ROUTING_KEY, BODY)
+            counts[i] += 1
+
+    workers = [threading.Thread(target=_worker, args=(i,), daemon=True) for i in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    bus._publisher_pool.close()
+    for conn in transport.connections:
+        conn.close()
+    set_transport(previous)
+    return {
+        "rate": sum(counts) / elapsed,
+        "published": broker.message_count(QUEUE),
+        "connections": len(transport.connections),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--threads", type=int, default=16, help="publishing threads")
+    ap.add_argument("--seconds", type=float, default=3.0, help="duration per run")
+    ap.add_argument("--rtt-ms", type=float, default=0.5, help="simulated broker round trip")
+    args = ap.parse_args(argv)
+
+    print(f"{'mode':<12} {'publishes/s':>12} {'connections':>12} {'published':>10}")
+    for pooled in (False, True):
+        r = run_once(pooled=pooled, threads=args.threads, seconds=args.seconds, rtt_ms=args.rtt_ms)
+        print(f"{'pooled' if pooled else 'per-publish':<12} {r['rate']:>12.0f} "
+              f"{r['connections']:>12} {r['published']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# libs/rmq/codec.py
+from __future__ import annotations
+
+"""Message body codecs keyed by AMQP ``content_type``.
+
+Publishers encode with the codec for the content type they send (default
+``RABBIT_CONTENT_TYPE``); consumers always pick the codec from the incoming
+message's ``content_type`` property, so services on old and new codecs can run
+side by side during a rollout. Switch publishers to a new format only after every
+consumer of their routing keys can decode it.
+
+Every codec encodes the same Python types. ``datetime``/``date``/``time`` become ISO
+8601 strings, ``UUID`` and ``Decimal`` become strings (``_default``), and dict keys
+may be ``int``/``float``/``bool``/``None`` or any of the types above. ``JsonCodec`` with
+stdlib json writes the same bytes as with orjson, so a service without orjson installed
+publishes the same wire format.
+"""
+
+import abc
+import datetime
+import decimal
+import json
+import os
+import uuid
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgpack
+except Exception:  # pragma: no cover
+    msgpack = None  # type: ignore
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+DEFAULT_CONTENT_TYPE = os.getenv("RABBIT_CONTENT_TYPE", JSON)
+
+
+def _default(obj: Any) -> Any:
+    """`default=` chung cho mọi codec: các kiểu orjson tự encode được, thêm Decimal."""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (uuid.UUID, decimal.Decimal)):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def _str_keys(obj: Any) -> Any:
+    # stdlib json chỉ nhận key str/int/float/bool/None; orjson (OPT_NON_STR_KEYS) nhận cả datetime, UUID...
+    if isinstance(obj, dict):
+        return {k if k is None or isinstance(k, (str, int, float)) else _default(k): _str_keys(v)
+                for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_str_keys(v) for v in obj]
+    return obj
+
+
+class Codec(abc.ABC):
+    content_type: str = ""
+
+    @abc.abstractmethod
+    def encode(self, obj: Any) -> bytes:
+        """obj -> body bytes; kiểu không hỗ trợ thì raise TypeError."""
+
+    @abc.abstractmethod
+    def decode(self, data: bytes) -> Any:
+        """body bytes -> obj."""
+
+
+class JsonCodec(Codec):
+    """JSON via orjson when installed (same wire format), stdlib json otherwise."""
+    content_type = JSON
+
+    def encode(self, obj: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        try:
+            return self._dumps(obj)
+        except TypeError:
+            # Key không phải str (datetime, UUID...): đổi key rồi thử lại, giá trị lỗi vẫn raise
+            return self._dumps(_str_keys(obj))
+
+    @staticmethod
+    def _dumps(obj: Any) -> bytes:
+        # separators/ensure_ascii như orjson: cùng bytes trên wire
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def decode(self, data: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data.decode("utf-8"))
+
+
+class MsgpackCodec(Codec):
+    content_type = MSGPACK
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise RuntimeError("msgpack is required for MsgpackCodec; please install it.")
+
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True, default=_default)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False)
+
+
+_codecs: Dict[str, Codec] = {}
+
+
+def _normalize(content_type: Optional[str]) -> str:
+    # "application/json; charset=utf-8" -> "application/json"; missing -> JSON (legacy publishers)
+    return (content_type or JSON).split(";", 1)[0].strip().lower()
+
+
+def register_codec(codec: Codec, *aliases: str) -> None:
+    for ct in (codec.content_type, *aliases):
+        _codecs[_normalize(ct)] = codec
+
+
+def get_codec(content_type: Optional[str] = None) -> Codec:
+    ct = _normalize(content_type)
+    codec = _codecs.get(ct)
+    if codec is None:
+        raise ValueError(f"no codec registered for content_type={ct!r}")
+    return codec
+
+
+def encode(obj: Any, content_type: Optional[str] = None) -> bytes:
+    return get_codec(content_type).encode(obj)
+
+
+def decode(data: bytes, content_type: Optional[str] = None) -> Any:
+    return get_codec(content_type).decode(data)
+
+
+register_codec(JsonCodec(), "text/json")
+if msgpack is not None:
+    register_codec(MsgpackCodec(), "application/x-msgpack")
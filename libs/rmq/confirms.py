@@ -0,0 +1,303 @@
+# libs/rmq/confirms.py
+from __future__ import annotations
+
+"""Publisher confirms tracked asynchronously on a dedicated I/O thread.
+
+Callers enqueue a message and get a ``Future`` back straight away. The I/O thread
+owns one confirm-mode channel, publishes everything queued so far in one go and
+settles the futures as the broker acks; a single ``multiple=True`` ack confirms a
+whole batch of delivery tags at once, so throughput stays close to fire-and-forget.
+"""
+
+import collections
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+import pika
+from pika.spec import Basic
+
+from libs.metrics import registry as metrics
+from .bus import RABBIT_URL, HEARTBEAT, EXCHANGE, DLX, RECONNECT_MAX_DELAY, get_spool
+
+logger = logging.getLogger(__name__)
+
+metrics.histogram("rmq_confirm_latency_seconds")
+
+
+class PublishNacked(Exception):
+    """The broker refused (nacked) a confirmed publish."""
+
+
+class PublishUnconfirmed(Exception):
+    """The connection dropped before the broker confirmed the publish."""
+
+
+class PublishNotSent(Exception):
+    """The publish was cancelled before reaching the channel: the broker never saw it."""
+
+
+class _Outgoing:
+    __slots__ = ("routing_key", "body", "properties", "future", "spool", "sent_at")
+
+    def __init__(self, routing_key: str, body: bytes, properties: pika.BasicProperties, future: Future,
+                 spool: bool = True) -> None:
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.future = future
+        self.spool = spool  # False: message do spool replay, không được ghi lại vào spool
+        self.sent_at = 0.0
+
+
+def _settle(fut: Future, exc: Optional[BaseException] = None) -> None:
+    if fut.done():
+        return
+    if exc is None:
+        fut.set_result(None)
+    else:
+        fut.set_exception(exc)
+
+
+class ConfirmPublisher:
+    """
+    Confirm-mode publisher running pika's SelectConnection on its own thread.
+
+    - submit() is thread-safe and never blocks on the broker.
+    - Unsent messages survive a reconnect; in-flight ones fail with PublishUnconfirmed
+      (their fate is unknown, the caller decides whether to republish).
+    - With a publish spool enabled (spool.py), both go to the spool instead when the
+      connection drops and their futures resolve; the spool republishes them.
+      Messages submitted with spool=False (the spool's own replay) are never spooled
+      again: they fail with PublishUnconfirmed and stay at the head of the spool.
+    """
+
+    def __init__(self, url: str = RABBIT_URL) -> None:
+        self._params = pika.URLParameters(url)
+        self._params.heartbeat = HEARTBEAT
+        self._pending: "queue.SimpleQueue[_Outgoing]" = queue.SimpleQueue()
+        self._inflight: "collections.OrderedDict[int, _Outgoing]" = collections.OrderedDict()
+        self._conn: Optional[pika.SelectConnection] = None
+        self._ch: Optional[pika.channel.Channel] = None
+        self._ready = False
+        self._next_tag = 0
+        self._backoff = 0.5
+        self._down_since: Optional[float] = None  # lần mất kết nối gần nhất; None khi đang kết nối
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # --- caller side ---
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="rmq-confirm-publisher", daemon=True)
+            self._thread.start()
+
+    def submit(self, routing_key: str, body: bytes, properties: pika.BasicProperties,
+               callback: Optional[Callable[[Future], None]] = None, spool: bool = True) -> Future:
+        """Queue one message; the returned future resolves once the broker acks it."""
+        fut: Future = Future()
+        if callback is not None:
+            fut.add_done_callback(callback)
+        self._pending.put(_Outgoing(routing_key, body, properties, fut, spool))
+        self.start()
+        conn = self._conn
+        if conn is not None and self._ready:
+            try:
+                conn.ioloop.add_callback_threadsafe(self._drain)
+            except Exception:
+                pass  # loop is shutting down; the message is drained after reconnect
+        return fut
+
+    def unavailable_for(self) -> float:
+        """Số giây broker không kết nối được (0 khi đang kết nối hoặc chưa từng thử)."""
+        since = self._down_since
+        return 0.0 if since is None else max(time.monotonic() - since, 1e-6)
+
+    def connected(self) -> bool:
+        """True khi channel đang ở confirm mode và gửi được ngay."""
+        return self._ready and self._down_since is None
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping = True
+        conn = self._conn
+        if conn is not None:
+            try:
+                conn.ioloop.add_callback_threadsafe(self._close)
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # --- I/O thread ---
+    def _run(self) -> None:
+        while not self._stopping:
+            self._conn = pika.SelectConnection(
+                self._params,
+                on_open_callback=self._on_open,
+                on_open_error_callback=self._on_open_error,
+                on_close_callback=self._on_closed,
+            )
+            try:
+                self._conn.ioloop.start()
+            except Exception:
+                logger.exception("rmq confirm publisher I/O loop crashed")
+            self._connection_lost()
+            if self._stopping:
+                break
+            time.sleep(self._backoff * (0.5 + random.random()))
+            self._backoff = min(self._backoff * 2, RECONNECT_MAX_DELAY)
+
+    def _connection_lost(self) -> None:
+        self._ready = False
+        self._ch = None
+        if not self._stopping and self._down_since is None:
+            self._down_since = time.monotonic()
+        self._fail_inflight()
+        if not self._stopping:
+            self._spill_pending()
+
+    def _close(self) -> None:
+        conn = self._conn
+        if conn is not None and conn.is_open:
+            conn.close()
+        elif conn is not None:
+            conn.ioloop.stop()
+
+    def _on_open(self, conn: pika.SelectConnection) -> None:
+        conn.channel(on_open_callback=self._on_channel_open)
+
+    def _on_open_error(self, conn: pika.SelectConnection, err: BaseException) -> None:
+        logger.warning("rmq confirm publisher cannot connect: %s", err)
+        conn.ioloop.stop()
+
+    def _on_closed(self, conn: pika.SelectConnection, reason: BaseException) -> None:
+        self._ready = False
+        self._ch = None
+        conn.ioloop.stop()
+
+    def _on_channel_open(self, ch: pika.channel.Channel) -> None:
+        self._ch = ch
+        ch.add_on_close_callback(self._on_channel_closed)
+        ch.exchange_declare(
+            exchange=EXCHANGE, exchange_type="topic", durable=True,
+            callback=lambda _f: ch.exchange_declare(
+                exchange=DLX, exchange_type="topic", durable=True,
+                callback=lambda _f: ch.confirm_delivery(self._on_confirm, callback=self._on_confirm_mode),
+            ),
+        )
+
+    def _on_channel_closed(self, ch: pika.channel.Channel, reason: BaseException) -> None:
+        logger.warning("rmq confirm publisher channel closed: %s", reason)
+        self._ready = False
+        self._ch = None
+        self._close()
+
+    def _on_confirm_mode(self, _frame: object) -> None:
+        self._next_tag = 0
+        self._backoff = 0.5
+        self._down_since = None
+        self._ready = True
+        self._drain()
+
+    def _drain(self) -> None:
+        ch = self._ch
+        if not self._ready or ch is None:
+            return
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if not item.future.set_running_or_notify_cancel():
+                continue  # cancelled trước khi gửi; từ đây future.cancel() không còn thành công
+            self._next_tag += 1
+            item.sent_at = time.monotonic()
+            self._inflight[self._next_tag] = item
+            try:
+                ch.basic_publish(EXCHANGE, item.routing_key, item.body, item.properties)
+            except Exception as ex:
+                self._inflight.pop(self._next_tag, None)
+                _settle(item.future, ex)
+        metrics.set_gauge("rmq_publish_inflight", len(self._inflight))
+
+    def _on_confirm(self, frame: pika.frame.Method) -> None:
+        method = frame.method
+        acked = isinstance(method, Basic.Ack)
+        tag = method.delivery_tag
+        if method.multiple:
+            tags = [t for t in self._inflight if tag == 0 or t <= tag]
+        else:
+            tags = [tag]
+
+        now = time.monotonic()
+        for t in tags:
+            item = self._inflight.pop(t, None)
+            if item is None:
+                continue
+            metrics.observe("rmq_confirm_latency_seconds", now - item.sent_at)
+            if acked:
+                _settle(item.future)
+            else:
+                _settle(item.future, PublishNacked(f"broker nacked publish to {item.routing_key}"))
+        metrics.inc("rmq_publish_confirmed_total" if acked else "rmq_publish_nacked_total", len(tags))
+        metrics.observe("rmq_confirm_batch_size", len(tags))
+        metrics.set_gauge("rmq_publish_inflight", len(self._inflight))
+
+    def _fail_inflight(self) -> None:
+        spool = get_spool()
+        while self._inflight:
+            _, item = self._inflight.popitem(last=False)
+            if item.spool and spool is not None and not self._stopping and self._to_spool(spool, item):
+                continue  # spool publish lại (cùng message_id, consumer dedup bỏ bản trùng)
+            _settle(item.future, PublishUnconfirmed(f"connection lost before confirm ({item.routing_key})"))
+        metrics.set_gauge("rmq_publish_inflight", 0)
+
+    def _spill_pending(self) -> None:
+        """Mất kết nối: message chưa gửi chuyển sang spool (nếu bật) thay vì chờ reconnect."""
+        spool = get_spool()
+        if spool is None:
+            return
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if not item.future.set_running_or_notify_cancel():
+                continue
+            if not item.spool:
+                # Bản replay từ spool: record vẫn nằm đầu spool, ghi lại sẽ đẩy nó ra sau message mới hơn
+                _settle(item.future, PublishUnconfirmed(f"broker unavailable ({item.routing_key})"))
+            elif not self._to_spool(spool, item):
+                _settle(item.future, PublishUnconfirmed(f"broker unavailable and spool full ({item.routing_key})"))
+
+    @staticmethod
+    def _to_spool(spool, item: _Outgoing) -> bool:
+        try:
+            spool.append(item.routing_key, item.body, item.properties)
+        except Exception:
+            logger.warning("rmq publish spool rejected %s", item.routing_key, exc_info=True)
+            return False
+        _settle(item.future)
+        return True
+
+
+_publisher: Optional[ConfirmPublisher] = None
+_publisher_lock = threading.Lock()
+
+
+def get_confirm_publisher() -> ConfirmPublisher:
+    """Process-wide confirm publisher, created and started on first use."""
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = ConfirmPublisher()
+        _publisher.start()
+        return _publisher
@@ -1,39 +1,253 @@
 # libs/rmq/consumer.py
-import threading
-from typing import Callable, Dict, Any, Optional
-from .bus import declare_queue, start_consume
+import logging, os, random, threading, time
+from typing import Callable, Dict, Any, Iterable, List, Optional
+
+from libs.metrics import registry as metrics
+from .bus import (DEFAULT_RETRY, DRAIN_TIMEOUT, PREFETCH, RECONNECT_MAX_DELAY, BatchMessage, ConsumerControl,
+                  RetryPolicy, _Rmq, declare_retry_queues, start_consume, start_consume_batch)
+from .dedup import DedupStore
+from .flow import AdaptivePrefetch
+from . import topology
+
+logger = logging.getLogger(__name__)
 
 class Subscription:
     def __init__(self, queue: str, routing_key: str,
-                 handler: Callable[[Dict[str, Any], Dict[str, Any], str], None]):
+                 handler: Callable[[Dict[str, Any], Dict[str, Any], str], None],
+                 *,
+                 prefetch: int = PREFETCH,
+                 workers: int = 0,
+                 partition_key: Optional[str] = None,
+                 routing_keys: Iterable[str] = (),
+                 dead_letter: bool = True,
+                 retry: Optional[RetryPolicy] = DEFAULT_RETRY,
+                 retry_partitioned: Optional[bool] = None,
+                 dedup: Optional[DedupStore] = None,
+                 queue_options: Optional[Dict[str, Any]] = None,
+                 flow: Optional[AdaptivePrefetch] = None,
+                 consumer_priority: Optional[int] = None,
+                 start_delay: float = 0.0):
         self.queue = queue
         self.routing_key = routing_key
         self.handler = handler
+        self.prefetch = prefetch
+        self.workers = workers              # >0: xử lý song song trên KeyedWorkerPool
+        self.partition_key = partition_key  # field trong payload giữ thứ tự, vd. "payment_id"
+        self.routing_keys = list(routing_keys)  # routing key bind thêm vào cùng queue
+        self.dead_letter = dead_letter
+        self.retry = retry                  # None: fail là vào thẳng DLQ
+        self.retry_partitioned = retry_partitioned  # có partition_key: True = qua retry queue, mặc định tại chỗ
+        self.dedup = dedup                  # bỏ qua message đã xử lý (redelivery)
+        self.queue_options = dict(queue_options or {})  # lazy / quorum / max_priority / arguments (QueueSpec)
+        self.flow = flow                    # prefetch thích ứng + pause khi downstream quá tải
+        self.consumer_priority = consumer_priority  # x-priority (single-active-consumer chọn consumer cao nhất)
+        self.start_delay = start_delay      # giây chờ trước lần consume đầu (shard standby, xem sharding.py)
+        self.control = ConsumerControl()    # stop() -> graceful drain
+
+    def spec(self) -> topology.QueueSpec:
+        return topology.QueueSpec(self.queue, [self.routing_key, *self.routing_keys],
+                                  dead_letter=self.dead_letter, retry=self.retry, **self.queue_options)
+
+    def declare(self) -> None:
+        """
+        Đăng ký queue vào topology.registry và khai báo (idempotent); connection mới (sau reconnect)
+        tự khai báo lại từ registry.
+        """
+        if not self.routing_key:
+            if self.retry is not None:
+                declare_retry_queues(self.queue, self.retry)
+            return
+        topology.declare(self.spec())
+
+    def consume(self) -> None:
+        start_consume(self.queue, self.handler, prefetch=self.prefetch,
+                      workers=self.workers, partition_key=self.partition_key, retry=self.retry,
+                      retry_partitioned=self.retry_partitioned,
+                      dedup=self.dedup, flow=self.flow, consumer_priority=self.consumer_priority,
+                      control=self.control)
 
 def subscribe(queue: str,
               routing_key: str,
               handler: Callable[[Dict[str, Any], Dict[str, Any], str], None],
               *,
               dead_letter: bool = True,
-              prefetch: int = 32) -> Subscription:
-    declare_queue(queue=queue, routing_key=routing_key,
-                  dead_letter=dead_letter, prefetch=prefetch)
-    return Subscription(queue, routing_key, handler)
+              prefetch: int = 32,
+              workers: int = 0,
+              partition_key: Optional[str] = None,
+              routing_keys: Iterable[str] = (),
+              retry: Optional[RetryPolicy] = DEFAULT_RETRY,
+              retry_partitioned: Optional[bool] = None,
+              dedup: Optional[DedupStore] = None,
+              flow: Optional[AdaptivePrefetch] = None) -> Subscription:
+    sub = Subscription(queue, routing_key, handler, prefetch=prefetch,
+                       workers=workers, partition_key=partition_key,
+                       routing_keys=routing_keys, dead_letter=dead_letter, retry=retry,
+                       retry_partitioned=retry_partitioned, dedup=dedup, flow=flow)
+    sub.declare()
+    return sub
+
+class BatchSubscription(Subscription):
+    """Subscription giao message theo batch (xem bus.start_consume_batch)."""
+    def __init__(self, queue: str, routing_key: Optional[str],
+                 handler: Callable[[List[BatchMessage]], Optional[Iterable[BatchMessage]]],
+                 *,
+                 max_batch: int = 100,
+                 max_wait_ms: int = 50,
+                 prefetch: int = PREFETCH,
+                 routing_keys: Iterable[str] = (),
+                 dead_letter: bool = True,
+                 retry: Optional[RetryPolicy] = DEFAULT_RETRY,
+                 dedup: Optional[DedupStore] = None,
+                 queue_options: Optional[Dict[str, Any]] = None):
+        super().__init__(queue, routing_key or "", handler, prefetch=prefetch,  # type: ignore[arg-type]
+                         routing_keys=routing_keys, dead_letter=dead_letter, retry=retry, dedup=dedup,
+                         queue_options=queue_options)
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
 
-# --- NEW: chạy mỗi subscription trên 1 thread ---
+    def consume(self) -> None:
+        start_consume_batch(self.queue, self.handler, max_batch=self.max_batch,  # type: ignore[arg-type]
+                            max_wait_ms=self.max_wait_ms, prefetch=self.prefetch, retry=self.retry,
+                            dedup=self.dedup, control=self.control)
+
+def subscribe_batch(queue: str,
+                    handler: Callable[[List[BatchMessage]], Optional[Iterable[BatchMessage]]],
+                    *,
+                    max_batch: int = 100,
+                    max_wait_ms: int = 50,
+                    routing_key: Optional[str] = None,
+                    dead_letter: bool = True,
+                    prefetch: int = 32,
+                    routing_keys: Iterable[str] = (),
+                    retry: Optional[RetryPolicy] = DEFAULT_RETRY,
+                    dedup: Optional[DedupStore] = None) -> BatchSubscription:
+    """
+    Như subscribe() nhưng handler nhận list[BatchMessage]; trả về các message fail để chỉ
+    retry/nack chúng, còn lại được ack bằng một lần multiple=True. routing_key=None: queue đã được khai báo.
+    """
+    sub = BatchSubscription(queue, routing_key, handler, max_batch=max_batch,
+                            max_wait_ms=max_wait_ms, prefetch=prefetch,
+                            routing_keys=routing_keys, dead_letter=dead_letter, retry=retry,
+                            dedup=dedup)
+    sub.declare()
+    return sub
+
+# --- Supervisor: mỗi subscription chạy trên 1 thread, tự reconnect khi mất kết nối ---
 _threads: list[threading.Thread] = []
+_subs: list[Subscription] = []
+_stopping = threading.Event()
+_status: Dict[str, Dict[str, Any]] = {}
+_status_lock = threading.Lock()
+
+RECONNECT_BASE_DELAY = 0.5
+STABLE_AFTER_SEC = 30.0  # chạy ổn định lâu hơn mức này thì reset backoff
+
+
+def _set_status(queue: str, state: str, error: Optional[str] = None, restarted: bool = False) -> None:
+    with _status_lock:
+        st = _status.setdefault(queue, {"state": state, "restarts": 0, "last_error": None, "since": time.time()})
+        if st["state"] != state:
+            st["since"] = time.time()
+        st["state"] = state
+        if error is not None:
+            st["last_error"] = error
+        if restarted:
+            st["restarts"] += 1
+    metrics.set_gauge("rmq_consumer_up", 1 if state == "running" else 0, queue=queue)
+    if restarted:
+        metrics.inc("rmq_consumer_restarts_total", queue=queue)
+
+
+def status() -> Dict[str, Dict[str, Any]]:
+    """Liveness của từng consumer: state (starting/standby/running/reconnecting/stopped), restarts, last_error, since."""
+    with _status_lock:
+        return {q: dict(st) for q, st in _status.items()}
+
+
+def healthy() -> bool:
+    st = status()
+    return bool(st) and all(v["state"] in ("running", "standby") for v in st.values())
+
+
+def _supervise(sub: Subscription) -> None:
+    """
+    Giữ consumer sống: mất connection/channel thì bỏ connection cũ, chờ backoff có jitter,
+    khai báo lại topology rồi consume lại.
+    """
+    delay = RECONNECT_BASE_DELAY
+    if sub.start_delay > 0:
+        _set_status(sub.queue, "standby")
+        _stopping.wait(sub.start_delay)
+    else:
+        _set_status(sub.queue, "starting")
+    while not _stopping.is_set():
+        started = time.monotonic()
+        try:
+            sub.declare()
+            # "running" chỉ khi basic_consume đã thành công (ConsumerControl._attach)
+            sub.control.on_consuming = lambda: _set_status(sub.queue, "running")
+            sub.consume()
+            error = "consumer loop exited"
+        except Exception as ex:
+            error = f"{type(ex).__name__}: {ex}"
+        if _stopping.is_set():
+            break
+        logger.warning("rmq consumer %s down (%s); reconnecting", sub.queue, error)
+        _Rmq.reset()
+        if time.monotonic() - started > STABLE_AFTER_SEC:
+            delay = RECONNECT_BASE_DELAY
+        _set_status(sub.queue, "reconnecting", error=error, restarted=True)
+        _stopping.wait(delay * (0.5 + random.random()))
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
+    # Đóng connection của thread: message còn unacked (quá deadline) được broker redeliver
+    _Rmq.reset()
+    _set_status(sub.queue, "stopped")
+
+
+class PartitionOrderError(RuntimeError):
+    """Nhiều process consume song song một queue có partition_key: thứ tự theo key không còn được giữ."""
+
+
+def _single_active(sub: Subscription) -> bool:
+    spec = topology.registry.get(sub.queue) or sub.spec()
+    return bool(spec.arguments().get("x-single-active-consumer"))
+
+
+def _check_partition_order(subscriptions: Iterable[Subscription]) -> None:
+    """
+    partition_key chỉ giữ thứ tự trong một process: chạy dưới libs.rmq.worker với nhiều process,
+    queue phải là single-active-consumer (ShardedQueue). Ngược lại raise PartitionOrderError,
+    hoặc chỉ log warning nếu RMQ_WORKER_ALLOW_UNORDERED=1 (worker --allow-unordered).
+    """
+    from .worker import ALLOW_UNORDERED_ENV, worker_count
+    count = worker_count()
+    bad = [s.queue for s in subscriptions if s.partition_key and count > 1 and not _single_active(s)]
+    if not bad:
+        return
+    msg = (f"{count} worker processes would consume {', '.join(bad)} concurrently; partition_key order "
+           f"only holds inside one process. Use a ShardedQueue, run --processes 1, or pass "
+           f"--allow-unordered if the handlers tolerate reordering")
+    if os.getenv(ALLOW_UNORDERED_ENV, "").lower() in ("1", "true", "yes"):
+        logger.warning("rmq consumers: %s", msg)
+        return
+    raise PartitionOrderError(msg)
+
 
 def run(subscriptions: list[Subscription], *, join: bool = False) -> None:
     """
-    Khởi động tất cả consumer song song (mỗi queue 1 thread).
+    Khởi động tất cả consumer song song (mỗi queue 1 thread), có supervisor tự reconnect.
     - join=True: dùng cho script/worker đứng độc lập (giữ process không thoát).
     - join=False: dùng trong FastAPI (không block event loop của web server).
+    Raise PartitionOrderError (trước khi consume gì) nếu worker nhiều process phá thứ tự partition_key.
     """
     global _threads
+    _check_partition_order(subscriptions)
+    _stopping.clear()
     for sub in subscriptions:
+        _subs.append(sub)
         t = threading.Thread(
-            target=start_consume,
-            args=(sub.queue, sub.handler),
+            target=_supervise,
+            args=(sub,),
             name=f"rmq-consumer:{sub.queue}",
             daemon=True  # dừng theo process, tránh treo khi shutdown
         )
@@ -43,3 +257,55 @@ def run(subscriptions: list[Subscription], *, join: bool = False) -> None:
     if join:
         for t in _threads:
             t.join()
+
+
+def stop(timeout: float = DRAIN_TIMEOUT) -> bool:
+    """
+    Graceful drain (gọi khi shutdown): mọi consumer ngừng nhận message mới, message đã prefetch
+    nhưng chưa bắt đầu được nack requeue ngay, handler đang chạy có tối đa `timeout` giây để
+    xong và ack. Trả về True nếu mọi consumer dừng kịp; thread còn sống là daemon nên không
+    giữ process lại, message chưa ack của chúng được redeliver khi connection đóng.
+    """
+    deadline = time.monotonic() + timeout
+    _stopping.set()
+    for sub in list(_subs):
+        sub.control.stop(deadline)
+    for t in list(_threads):
+        t.join(max(0.0, deadline - time.monotonic()) + 1.0)  # +1s: đóng connection sau drain
+    alive = [t.name for t in _threads if t.is_alive()]
+    if alive:
+        logger.warning("rmq consumers not drained before deadline: %s", ", ".join(alive))
+    _threads[:] = [t for t in _threads if t.is_alive()]
+    _subs.clear()
+    return not alive
+
+
+def mount_ops(app: Any, settings: Any, *, after_drain: Iterable[Callable[[], None]] = ()) -> None:
+    """
+    Endpoint vận hành chung cho FastAPI app của service:
+    - GET /health: liveness của consumer (xem status()); CONSUMERS_IN_WEB=false thì consumer chạy
+      trong libs.rmq.worker, process đó tự phục vụ /health.
+    - GET /metrics: Prometheus text của libs.metrics.
+    - shutdown: stop() với settings.CONSUMER_DRAIN_TIMEOUT_SEC (rolling deploy: handler đang chạy
+      được ack trước khi process thoát), sau đó lần lượt gọi `after_drain` (outbox relay, spool, ...).
+    """
+    from fastapi.responses import PlainTextResponse  # chỉ web process cần fastapi
+    from libs.metrics import prometheus
+
+    cleanups = list(after_drain)
+
+    @app.on_event("shutdown")
+    def _shutdown() -> None:
+        stop(timeout=settings.CONSUMER_DRAIN_TIMEOUT_SEC)
+        for fn in cleanups:
+            fn()
+
+    @app.get("/health")
+    def health() -> dict:
+        if not settings.CONSUMERS_IN_WEB:
+            return {"status": "ok", "consumers": {}}
+        return {"status": "ok" if healthy() else "degraded", "consumers": status()}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics_endpoint() -> PlainTextResponse:
+        return PlainTextResponse(prometheus.render(), media_type=prometheus.CONTENT_TYPE)
@@ -0,0 +1,102 @@
+# libs/rmq/dedup.py
+from __future__ import annotations
+
+"""Consumer-side deduplication of redelivered messages.
+
+A message is identified by its ``idempotency-key`` header (see publish_event),
+falling back to ``message_id``, scoped to the consuming queue: the same event fanned
+out to two services is processed once by each. The key is recorded only after the
+handler succeeded, so a crash mid-handler still gets the redelivery processed.
+
+Lookups go to an in-process LRU first and to Redis (shared by every replica, keys
+expire after ``ttl_sec``) on a miss. If Redis is unreachable the store fails open:
+the message is processed, as it would be without dedup.
+"""
+
+import collections
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+try:
+    import redis
+except Exception:  # pragma: no cover
+    redis = None  # type: ignore
+
+from libs.metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+
+
+def dedup_key(headers: Optional[Dict[str, Any]], message_id: Optional[str]) -> Optional[str]:
+    key = (headers or {}).get(IDEMPOTENCY_HEADER) or message_id
+    return str(key) if key else None
+
+
+class DedupStore:
+    def __init__(self, client: Any = None, *, ttl_sec: int = 86400, lru_size: int = 10000,
+                 namespace: str = "rmq:dedup") -> None:
+        self._client = client           # redis.Redis; None = chỉ dùng LRU (1 process)
+        self.ttl_sec = int(ttl_sec)
+        self.namespace = namespace
+        self._lru_size = max(0, int(lru_size))
+        self._lru: "collections.OrderedDict[str, None]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "DedupStore":
+        if redis is None:
+            raise RuntimeError("redis is required for DedupStore.from_url; please install it.")
+        client = redis.from_url(url, socket_connect_timeout=2, socket_timeout=2, retry_on_timeout=True)
+        return cls(client, **kwargs)
+
+    def _key(self, queue: str, key: str) -> str:
+        return f"{self.namespace}:{queue}:{key}"
+
+    def _remember(self, k: str) -> None:
+        if not self._lru_size:
+            return
+        with self._lock:
+            self._lru[k] = None
+            self._lru.move_to_end(k)
+            while len(self._lru) > self._lru_size:
+                self._lru.popitem(last=False)
+
+    def seen(self, queue: str, key: Optional[str]) -> bool:
+        """True nếu message đã được xử lý thành công trước đó (handler sẽ bị bỏ qua)."""
+        if not key:
+            return False
+        k = self._key(queue, key)
+        with self._lock:
+            if k in self._lru:
+                self._lru.move_to_end(k)
+                metrics.inc("rmq_dedup_hits_total", queue=queue, tier="lru")
+                return True
+        if self._client is not None:
+            try:
+                hit = bool(self._client.exists(k))
+            except Exception as ex:
+                logger.warning("rmq dedup lookup failed queue=%s: %s", queue, ex)
+                metrics.inc("rmq_dedup_errors_total", queue=queue)
+                hit = False
+            if hit:
+                self._remember(k)
+                metrics.inc("rmq_dedup_hits_total", queue=queue, tier="redis")
+                return True
+        metrics.inc("rmq_dedup_misses_total", queue=queue)
+        return False
+
+    def mark(self, queue: str, key: Optional[str]) -> None:
+        """Ghi nhận message đã xử lý xong."""
+        if not key:
+            return
+        k = self._key(queue, key)
+        self._remember(k)
+        if self._client is not None:
+            try:
+                self._client.set(k, 1, ex=self.ttl_sec)
+            except Exception as ex:
+                logger.warning("rmq dedup mark failed queue=%s: %s", queue, ex)
+                metrics.inc("rmq_dedup_errors_total", queue=queue)
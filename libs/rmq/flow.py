@@ -0,0 +1,160 @@
+# libs/rmq/flow.py
+from __future__ import annotations
+
+"""Adaptive prefetch and backpressure for ``start_consume``.
+
+A static ``basic_qos`` is wrong both ways: when the database slows down a replica
+keeps up to ``prefetch`` messages it cannot process (each waits ``prefetch /
+concurrency`` handler runs while healthier replicas idle), and when handlers are
+fast a small prefetch starves the workers.
+
+``AdaptivePrefetch`` sizes the prefetch from the observed handler latency: with
+``concurrency`` handlers in parallel and p95 handler time ``L``, a prefetch of
+``concurrency * target_latency / L`` keeps every worker busy while a buffered
+message waits about ``target_latency`` before its handler starts. Every
+``interval`` the prefetch moves toward that value, shrinking at most by half and
+growing by at most a quarter per step; an error rate above ``max_error_rate``
+halves it.
+
+Handlers failing with a saturation error (SQLAlchemy pool timeout, Redis timeout or
+an explicit ``Saturated``) pause the consumer: start_consume cancels it, so
+deliveries not yet handed to a handler go back to the queue for other replicas,
+waits ``pause`` seconds (doubling on consecutive saturations, up to ``max_pause``)
+and resumes at ``min_prefetch``.
+"""
+
+import math
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+try:
+    from sqlalchemy.exc import TimeoutError as _PoolTimeout
+except Exception:  # pragma: no cover
+    _PoolTimeout = None  # type: ignore
+
+try:
+    from redis.exceptions import TimeoutError as _RedisTimeout
+except Exception:  # pragma: no cover
+    _RedisTimeout = None  # type: ignore
+
+PREFETCH_MIN = int(os.getenv("CONSUMER_PREFETCH_MIN", "1"))
+PREFETCH_MAX = int(os.getenv("CONSUMER_PREFETCH_MAX", "256"))
+TARGET_LATENCY = float(os.getenv("CONSUMER_TARGET_LATENCY_MS", "250")) / 1000.0
+
+
+class Saturated(Exception):
+    """Handler raise khi downstream quá tải để consumer tạm ngừng nhận message."""
+
+
+SATURATION_ERRORS: Tuple[type, ...] = tuple(t for t in (Saturated, _PoolTimeout, _RedisTimeout) if t is not None)
+
+
+def is_saturation(exc: Optional[BaseException]) -> bool:
+    """True nếu `exc` (hoặc exception gây ra nó) là lỗi quá tải: pool DB hết connection, Redis timeout."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, SATURATION_ERRORS):
+            return True
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class AdaptivePrefetch:
+    """Bộ điều khiển prefetch của một consumer; record() gọi được từ mọi thread."""
+
+    def __init__(self, initial: int = 32, *,
+                 concurrency: int = 1,
+                 min_prefetch: int = PREFETCH_MIN,
+                 max_prefetch: int = PREFETCH_MAX,
+                 target_latency: float = TARGET_LATENCY,
+                 max_error_rate: float = 0.2,
+                 interval: float = 1.0,
+                 min_samples: int = 10,
+                 pause: float = 1.0,
+                 max_pause: float = 30.0,
+                 saturation: Callable[[BaseException], bool] = is_saturation) -> None:
+        self.min_prefetch = max(1, int(min_prefetch))
+        self.max_prefetch = max(self.min_prefetch, int(max_prefetch))
+        self.prefetch = min(max(int(initial), self.min_prefetch), self.max_prefetch)
+        self.concurrency = max(1, int(concurrency))
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.interval = interval
+        self.min_samples = max(1, int(min_samples))
+        self.base_pause = pause
+        self.max_pause = max_pause
+        self.pauses = 0
+        self.last_p95: Optional[float] = None
+        self._saturation = saturation
+        self._lock = threading.Lock()
+        self._samples: List[float] = []
+        self._errors = 0
+        self._window_start = time.monotonic()
+        self._next_pause = pause
+        self._paused_until = 0.0
+
+    def reset(self, concurrency: Optional[int] = None) -> None:
+        """Consumer (re)start: bỏ window cũ, giữ prefetch đã học."""
+        with self._lock:
+            if concurrency is not None:
+                self.concurrency = max(1, int(concurrency))
+            self._samples.clear()
+            self._errors = 0
+            self._window_start = time.monotonic()
+
+    def record(self, latency: float, ok: bool, exc: Optional[BaseException] = None) -> None:
+        """Một lần chạy handler: thời gian (s), kết quả và exception nếu fail."""
+        saturated = exc is not None and self._saturation(exc)
+        with self._lock:
+            self._samples.append(latency)
+            if not ok:
+                self._errors += 1
+            if not saturated:
+                return
+            now = time.monotonic()
+            if now < self._paused_until:
+                return  # các worker khác báo cùng một đợt quá tải
+            self._paused_until = now + self._next_pause
+            self._next_pause = min(self._next_pause * 2, self.max_pause)
+            self.pauses += 1
+            self.prefetch = self.min_prefetch
+            self._samples.clear()
+            self._errors = 0
+            self._window_start = self._paused_until
+
+    def pause_remaining(self, now: Optional[float] = None) -> float:
+        return max(0.0, self._paused_until - (time.monotonic() if now is None else now))
+
+    def update(self, now: Optional[float] = None) -> Optional[int]:
+        """Đánh giá window nếu đủ `interval` và `min_samples`; trả về prefetch mới nếu đổi."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now < self._paused_until or now - self._window_start < self.interval \
+                    or len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+            p95 = ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+            error_rate = self._errors / len(ordered)
+            self._samples.clear()
+            self._errors = 0
+            self._window_start = now
+            self.last_p95 = p95
+
+            cur = self.prefetch
+            if error_rate > self.max_error_rate:
+                new = cur // 2
+            else:
+                ideal = int(self.concurrency * self.target_latency / max(p95, 1e-6))
+                if ideal < cur:
+                    new = max(ideal, cur // 2)
+                else:
+                    new = min(ideal, cur + max(1, cur // 4))
+                self._next_pause = self.base_pause  # window khoẻ: reset backoff của pause
+            new = min(max(new, self.min_prefetch), self.max_prefetch)
+            if new == cur:
+                return None
+            self.prefetch = new
+            return new
@@ -0,0 +1,98 @@
+# libs/rmq/lag.py
+from __future__ import annotations
+
+"""Per-queue lag gauges.
+
+Consumers already record ``rmq_event_age_seconds`` (a histogram of publish ->
+receive time) and ``rmq_consumer_lag_seconds`` (the age of the last message received
+per queue). Neither shows a backlog that nobody is consuming. ``QueueMonitor`` polls
+the broker with a passive ``queue_declare`` every ``interval`` seconds from its own
+thread and connection, and exports:
+
+- ``rmq_queue_depth{queue}``: messages ready;
+- ``rmq_queue_consumers{queue}``;
+- ``rmq_queue_drain_seconds{queue}``: depth divided by this process's ack rate over
+  the last interval. It is only an estimate for one replica, and it is unset when
+  nothing was acked.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import pika
+
+from libs.metrics import registry as metrics
+from .bus import _Rmq
+
+logger = logging.getLogger(__name__)
+
+MONITOR_INTERVAL = float(os.getenv("RABBIT_QUEUE_MONITOR_SEC", "15"))
+
+
+def _acked(queue: str) -> float:
+    series = metrics.snapshot()["counters"].get("rmq_acked_total", {})
+    return sum(v for key, v in series.items() if ("queue", queue) in key)
+
+
+class QueueMonitor:
+    def __init__(self, queues: Iterable[str], interval: float = MONITOR_INTERVAL) -> None:
+        self.queues: List[str] = list(dict.fromkeys(queues))
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last: Dict[str, tuple] = {}  # queue -> (monotonic, acked)
+
+    def poll(self) -> Dict[str, int]:
+        """Một lượt passive declare; trả về depth từng queue (queue chưa tồn tại bị bỏ qua)."""
+        depths: Dict[str, int] = {}
+        now = time.monotonic()
+        for queue in self.queues:
+            try:
+                ok = _Rmq.admin_channel().queue_declare(queue=queue, passive=True).method
+            except pika.exceptions.ChannelClosedByBroker as ex:
+                # 404: queue chưa được khai báo; admin_channel() mở channel mới ở lần sau
+                logger.debug("rmq queue monitor: %s unavailable (%s)", queue, ex)
+                continue
+            depths[queue] = ok.message_count
+            metrics.set_gauge("rmq_queue_depth", ok.message_count, queue=queue)
+            metrics.set_gauge("rmq_queue_consumers", ok.consumer_count, queue=queue)
+            acked = _acked(queue)
+            prev = self._last.get(queue)
+            self._last[queue] = (now, acked)
+            if prev is not None and now > prev[0]:
+                rate = (acked - prev[1]) / (now - prev[0])
+                if rate > 0:
+                    metrics.set_gauge("rmq_queue_drain_seconds", ok.message_count / rate, queue=queue)
+                elif ok.message_count == 0:
+                    metrics.set_gauge("rmq_queue_drain_seconds", 0, queue=queue)
+        return depths
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.poll()
+            except Exception:
+                logger.warning("rmq queue monitor poll failed", exc_info=True)
+                _Rmq.reset()
+            self._stopping.wait(self.interval)
+        _Rmq.reset()
+
+    def start(self) -> "QueueMonitor":
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="rmq-queue-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def start_monitor(queues: Iterable[str], interval: float = MONITOR_INTERVAL) -> QueueMonitor:
+    return QueueMonitor(queues, interval).start()
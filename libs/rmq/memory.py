@@ -0,0 +1,693 @@
+# libs/rmq/memory.py
+from __future__ import annotations
+
+"""In-process broker implementing the slice of AMQP 0-9-1 the bus relies on.
+
+- topic / direct / fanout exchanges plus the default ("") exchange, exchange-to-exchange
+  bindings and ``x-consistent-hash`` exchanges (binding key = weight, ``hash-header`` /
+  ``hash-property`` arguments as in the RabbitMQ plugin)
+- durable-style queues with bindings (and unbind / delete with ``if_unused`` /
+  ``if_empty``), ``x-message-ttl`` / per-message ``expiration``
+  and dead-lettering through ``x-dead-letter-exchange`` / ``x-dead-letter-routing-key``
+  (so DLQs and the delayed-retry tiers behave as on RabbitMQ)
+- per-channel ``basic_qos`` prefetch, round-robin delivery between consumers,
+  ack / nack (multiple, requeue) and redelivery of unacked messages on channel close
+- ``x-single-active-consumer`` queues: the highest ``x-priority`` consumer (earliest on a
+  tie) gets every message; a higher-priority consumer takes over once the active one has
+  no unacked messages left, as quorum queues do
+
+Connections mimic pika's ``BlockingConnection``: deliveries and
+``add_callback_threadsafe`` callbacks are handed to the thread running
+``start_consuming``. Nothing is persisted; a process restart loses every message.
+"""
+
+import bisect
+import collections
+import functools
+import hashlib
+import heapq
+import itertools
+import queue
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import pika
+from pika.exceptions import ChannelClosedByBroker, ChannelWrongStateError, ConnectionWrongStateError
+from pika.frame import Method
+from pika.spec import Basic, Queue as QueueSpec
+
+from .transport import Transport
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+@functools.lru_cache(maxsize=1024)
+def _topic_match(pattern: str, routing_key: str) -> bool:
+    # "*" = đúng 1 word, "#" = 0..n word (giống RabbitMQ)
+    def match(p: Tuple[str, ...], k: Tuple[str, ...]) -> bool:
+        if not p:
+            return not k
+        if p[0] == "#":
+            return any(match(p[1:], k[i:]) for i in range(len(k) + 1))
+        return bool(k) and p[0] in ("*", k[0]) and match(p[1:], k[1:])
+    return match(tuple(pattern.split(".")), tuple(routing_key.split(".")))
+
+
+class _Message:
+    __slots__ = ("exchange", "routing_key", "body", "properties", "expires_at", "redelivered")
+
+    def __init__(self, exchange: str, routing_key: str, body: bytes, properties: pika.BasicProperties,
+                 expires_at: Optional[float] = None) -> None:
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.expires_at = expires_at
+        self.redelivered = False
+
+
+class _Queue:
+    def __init__(self, name: str, arguments: Dict[str, Any]) -> None:
+        self.name = name
+        self.arguments = dict(arguments)
+        self.messages: Deque[_Message] = collections.deque()
+        self.consumers: List[Tuple["MemoryChannel", str, Callable, int]] = []  # (channel, tag, callback, priority)
+        self.rr = 0
+        self.active: Optional[Tuple["MemoryChannel", str]] = None  # x-single-active-consumer
+
+
+class MemoryBroker:
+    """Một "vhost" trong bộ nhớ; mọi MemoryConnection cùng broker thấy chung exchange/queue."""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._exchanges: Dict[str, str] = {"": "direct"}
+        self._exchange_args: Dict[str, Dict[str, Any]] = {}
+        self._bindings: Dict[str, List[Tuple[str, str]]] = collections.defaultdict(list)
+        self._exchange_bindings: Dict[str, List[Tuple[str, str]]] = collections.defaultdict(list)
+        self._rings: Dict[str, List[Tuple[int, str]]] = {}
+        self._queues: Dict[str, _Queue] = {}
+        self._expiry: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._sweeper: Optional[threading.Thread] = None
+
+    # --- topology ---
+    def exchange_declare(self, exchange: str, exchange_type: str, arguments: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            existing = self._exchanges.get(exchange)
+            if existing is not None and existing != exchange_type:
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - inequivalent arg 'type' for exchange '{exchange}'")
+            self._exchanges[exchange] = exchange_type
+            self._exchange_args.setdefault(exchange, dict(arguments or {}))
+
+    def exchange_bind(self, destination: str, source: str, routing_key: str) -> None:
+        with self._lock:
+            for name in (destination, source):
+                if name not in self._exchanges:
+                    raise ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{name}'")
+            if (destination, routing_key) not in self._exchange_bindings[source]:
+                self._exchange_bindings[source].append((destination, routing_key))
+
+    def queue_declare(self, queue_name: str, arguments: Optional[Dict[str, Any]], passive: bool) -> _Queue:
+        with self._lock:
+            q = self._queues.get(queue_name)
+            if q is None:
+                if passive:
+                    raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue_name}'")
+                q = self._queues[queue_name] = _Queue(queue_name, arguments or {})
+            elif not passive and arguments is not None and dict(arguments) != q.arguments:
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - inequivalent arg for queue '{queue_name}'")
+            return q
+
+    def queue_bind(self, queue_name: str, exchange: str, routing_key: str) -> None:
+        with self._lock:
+            if queue_name not in self._queues:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue_name}'")
+            if exchange not in self._exchanges:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{exchange}'")
+            if (queue_name, routing_key) not in self._bindings[exchange]:
+                self._bindings[exchange].append((queue_name, routing_key))
+                self._rings.pop(exchange, None)
+
+    def queue_unbind(self, queue_name: str, exchange: str, routing_key: str) -> None:
+        with self._lock:
+            if queue_name not in self._queues:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue_name}'")
+            if (queue_name, routing_key) in self._bindings.get(exchange, ()):
+                self._bindings[exchange].remove((queue_name, routing_key))
+                self._rings.pop(exchange, None)
+
+    def queue_delete(self, queue_name: str, if_unused: bool, if_empty: bool) -> int:
+        with self._lock:
+            q = self._queues.get(queue_name)
+            if q is None:
+                return 0  # RabbitMQ: xoá queue không tồn tại vẫn ok
+            if if_unused and q.consumers:
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - queue '{queue_name}' in use")
+            if if_empty and q.messages:
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - queue '{queue_name}' not empty")
+            del self._queues[queue_name]
+            for exchange, bindings in self._bindings.items():
+                if any(b[0] == queue_name for b in bindings):
+                    bindings[:] = [b for b in bindings if b[0] != queue_name]
+                    self._rings.pop(exchange, None)
+            return len(q.messages)
+
+    def exchange_delete(self, exchange: str, if_unused: bool) -> None:
+        with self._lock:
+            if exchange not in self._exchanges:
+                return
+            if if_unused and (self._bindings.get(exchange) or self._exchange_bindings.get(exchange)):
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - exchange '{exchange}' in use")
+            del self._exchanges[exchange]
+            self._exchange_args.pop(exchange, None)
+            self._bindings.pop(exchange, None)
+            self._exchange_bindings.pop(exchange, None)
+            self._rings.pop(exchange, None)
+            for bindings in self._exchange_bindings.values():
+                bindings[:] = [b for b in bindings if b[0] != exchange]
+
+    def queue_purge(self, queue_name: str) -> int:
+        with self._lock:
+            q = self._queues[queue_name]
+            n = len(q.messages)
+            q.messages.clear()
+            return n
+
+    # --- routing ---
+    @staticmethod
+    def _matches(kind: str, key: str, routing_key: str) -> bool:
+        return kind == "fanout" or (kind == "direct" and key == routing_key) or \
+            (kind == "topic" and _topic_match(key, routing_key))
+
+    def _ring(self, exchange: str) -> List[Tuple[int, str]]:
+        ring = self._rings.get(exchange)
+        if ring is None:
+            # Mỗi queue `weight` * 64 điểm trên vòng hash
+            ring = sorted((_hash(f"{qname}:{i}"), qname)
+                          for qname, weight in self._bindings.get(exchange, ())
+                          for i in range(max(1, int(weight or 1)) * 64))
+            self._rings[exchange] = ring
+        return ring
+
+    def _hash_route(self, exchange: str, routing_key: str, props: Optional[pika.BasicProperties]) -> List[str]:
+        ring = self._ring(exchange)
+        if not ring:
+            return []
+        args = self._exchange_args.get(exchange, {})
+        if "hash-header" in args:
+            value = ((props.headers if props is not None else None) or {}).get(args["hash-header"], "")
+        elif "hash-property" in args:
+            value = getattr(props, args["hash-property"], None) or ""
+        else:
+            value = routing_key
+        i = bisect.bisect(ring, (_hash(str(value)), "")) % len(ring)
+        return [ring[i][1]]
+
+    def _route(self, exchange: str, routing_key: str, props: Optional[pika.BasicProperties] = None,
+               _visited: Optional[Set[str]] = None) -> List[str]:
+        if exchange == "":
+            return [routing_key] if routing_key in self._queues else []
+        kind = self._exchanges.get(exchange)
+        if kind is None:
+            raise ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{exchange}'")
+        visited = _visited if _visited is not None else set()
+        visited.add(exchange)
+        if kind == "x-consistent-hash":
+            return self._hash_route(exchange, routing_key, props)
+        out: List[str] = []
+        for qname, key in self._bindings.get(exchange, ()):
+            if qname not in out and self._matches(kind, key, routing_key):
+                out.append(qname)
+        for dest, key in self._exchange_bindings.get(exchange, ()):
+            if dest not in visited and self._matches(kind, key, routing_key):
+                out.extend(q for q in self._route(dest, routing_key, props, visited) if q not in out)
+        return out
+
+    def publish(self, exchange: str, routing_key: str, body: bytes, properties: Optional[pika.BasicProperties]) -> int:
+        """Route và enqueue; trả về số queue nhận được message (0 = unroutable, bị bỏ như RabbitMQ)."""
+        props = properties or pika.BasicProperties()
+        with self._lock:
+            targets = self._route(exchange, routing_key, props)
+            for qname in targets:
+                self._enqueue(self._queues[qname], _Message(exchange, routing_key, body, props))
+            return len(targets)
+
+    def _enqueue(self, q: _Queue, msg: _Message) -> None:
+        ttl = q.arguments.get("x-message-ttl")
+        if msg.properties.expiration is not None:
+            per_msg = int(msg.properties.expiration)
+            ttl = per_msg if ttl is None else min(int(ttl), per_msg)
+        if ttl is not None:
+            msg.expires_at = time.monotonic() + int(ttl) / 1000.0
+            heapq.heappush(self._expiry, (msg.expires_at, next(self._seq), q.name))
+            self._ensure_sweeper()
+        q.messages.append(msg)
+        self._dispatch(q)
+
+    def _dead_letter(self, q: _Queue, msg: _Message, reason: str) -> None:
+        dlx = q.arguments.get("x-dead-letter-exchange")
+        if dlx is None:
+            return  # không có DLX: message bị bỏ
+        rk = q.arguments.get("x-dead-letter-routing-key", msg.routing_key)
+        p = msg.properties
+        headers = dict(p.headers or {})
+        deaths = list(headers.get("x-death") or [])
+        deaths.insert(0, {"queue": q.name, "reason": reason, "count": 1,
+                          "exchange": msg.exchange, "routing-keys": [msg.routing_key]})
+        headers["x-death"] = deaths
+        props = pika.BasicProperties(content_type=p.content_type, delivery_mode=p.delivery_mode,
+                                     headers=headers, message_id=p.message_id, priority=p.priority)
+        try:
+            targets = self._route(dlx, rk, props)
+        except ChannelClosedByBroker:
+            return  # DLX chưa khai báo: RabbitMQ cũng bỏ message
+        for qname in targets:
+            self._enqueue(self._queues[qname], _Message(dlx, rk, msg.body, props))
+
+    # --- TTL ---
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is None or not self._sweeper.is_alive():
+            self._sweeper = threading.Thread(target=self._sweep, name="rmq-memory-ttl", daemon=True)
+            self._sweeper.start()
+        else:
+            self._changed.notify_all()
+
+    def _sweep(self) -> None:
+        with self._lock:
+            while True:
+                if not self._expiry:
+                    self._changed.wait(1.0)
+                    continue
+                due = self._expiry[0][0] - time.monotonic()
+                if due > 0:
+                    self._changed.wait(due)
+                    continue
+                _, _, qname = heapq.heappop(self._expiry)
+                q = self._queues.get(qname)
+                if q is not None:
+                    self._expire_head(q)
+
+    def _expire_head(self, q: _Queue) -> None:
+        # Như RabbitMQ: chỉ message ở đầu queue mới bị expire
+        now = time.monotonic()
+        while q.messages and q.messages[0].expires_at is not None and q.messages[0].expires_at <= now:
+            self._dead_letter(q, q.messages.popleft(), "expired")
+
+    # --- delivery ---
+    @staticmethod
+    def _active(q: _Queue) -> Tuple["MemoryChannel", str, Callable, int]:
+        best = max(q.consumers, key=lambda c: c[3])  # bằng priority: consumer đăng ký trước
+        cur = next((c for c in q.consumers if q.active is not None and c[0] is q.active[0] and c[1] == q.active[1]), None)
+        if cur is not None and (cur[3] >= best[3] or any(e[0] is q for e in cur[0]._unacked.values())):
+            return cur
+        q.active = (best[0], best[1])
+        return best
+
+    def _dispatch(self, q: _Queue) -> None:
+        self._expire_head(q)
+        while q.messages and q.consumers:
+            consumers = [self._active(q)] if q.arguments.get("x-single-active-consumer") else q.consumers
+            for i in range(len(consumers)):
+                ch, tag, cb, _ = consumers[(q.rr + i) % len(consumers)]
+                if ch._has_capacity():
+                    q.rr = (q.rr + i + 1) % len(consumers)
+                    ch._deliver(q, tag, cb, q.messages.popleft())
+                    break
+            else:
+                return  # mọi consumer đều đã đủ prefetch
+            self._expire_head(q)
+        self._changed.notify_all()
+
+    def _consume(self, ch: "MemoryChannel", queue_name: str, consumer_tag: str, callback: Callable,
+                 priority: int = 0) -> None:
+        with self._lock:
+            q = self._queues.get(queue_name)
+            if q is None:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue_name}'")
+            q.consumers.append((ch, consumer_tag, callback, priority))
+            self._dispatch(q)
+
+    def _cancel(self, ch: "MemoryChannel", consumer_tag: Optional[str] = None) -> None:
+        with self._lock:
+            for q in self._queues.values():
+                q.consumers = [c for c in q.consumers if not (c[0] is ch and consumer_tag in (None, c[1]))]
+                if q.consumers and q.messages:
+                    self._dispatch(q)  # single-active-consumer: consumer kế tiếp nhận tiếp
+
+    def _settle(self, ch: "MemoryChannel", entries: Iterable[Tuple[_Queue, _Message]], *, requeue: Optional[bool]) -> None:
+        """requeue=None: ack; True: trả lại đầu queue; False: dead-letter."""
+        entries = list(entries)
+        if requeue:
+            entries.reverse()  # appendleft: giữ nguyên thứ tự ban đầu ở đầu queue
+        with self._lock:
+            for q, msg in entries:
+                if requeue:
+                    msg.redelivered = True
+                    q.messages.appendleft(msg)
+                elif requeue is False:
+                    self._dead_letter(q, msg, "rejected")
+            for q in self._queues.values():
+                if q.consumers and q.messages:
+                    self._dispatch(q)  # capacity vừa được giải phóng trên channel này
+            self._changed.notify_all()
+
+    # --- introspection (benchmark / test) ---
+    def message_count(self, queue_name: str) -> int:
+        with self._lock:
+            return len(self._queues[queue_name].messages)
+
+    def queues(self) -> List[str]:
+        with self._lock:
+            return list(self._queues)
+
+    def wait_idle(self, queues: Optional[Iterable[str]] = None, timeout: float = 10.0) -> bool:
+        """
+        Chờ tới khi các queue (mặc định: mọi queue có consumer) rỗng và không còn message unacked.
+        Trả về False nếu hết timeout.
+        """
+        deadline = time.monotonic() + timeout
+        names = list(queues) if queues is not None else None
+        with self._lock:
+            while True:
+                watched = [self._queues[n] for n in names] if names is not None else \
+                    [q for q in self._queues.values() if q.consumers]
+                busy = any(q.messages for q in watched) or any(
+                    ch._unacked for q in watched for ch, *_ in q.consumers)
+                if not busy:
+                    return True
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._changed.wait(min(left, 0.05))
+
+
+class MemoryChannel:
+    def __init__(self, connection: "MemoryConnection", channel_number: int) -> None:
+        self.connection = connection
+        self.channel_number = channel_number
+        self._broker = connection.broker
+        self._prefetch = 0
+        self._next_tag = 0
+        self._unacked: "collections.OrderedDict[int, Tuple[_Queue, _Message]]" = collections.OrderedDict()
+        self._undispatched: Dict[int, str] = {}  # delivery tag -> consumer tag, chưa tới callback
+        self._consumers: Set[str] = set()
+        self._consumer_seq = itertools.count(1)
+        self._consuming = False
+        self._closed = False
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed and self.connection.is_open
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def _check(self) -> None:
+        if not self.is_open:
+            raise ChannelWrongStateError("Channel is closed.")
+
+    def _fail(self, ex: ChannelClosedByBroker) -> None:
+        # Lỗi protocol: broker đóng channel như RabbitMQ
+        self.close()
+        raise ex
+
+    # --- topology ---
+    def exchange_declare(self, exchange: str, exchange_type: str = "direct", durable: bool = False, **_: Any) -> None:
+        self._check()
+        try:
+            self._broker.exchange_declare(exchange, exchange_type, _.get("arguments"))
+        except ChannelClosedByBroker as ex:
+            self._fail(ex)
+
+    def exchange_bind(self, destination: str, source: str, routing_key: str = "", **_: Any) -> None:
+        self._check()
+        try:
+            self._broker.exchange_bind(destination, source, routing_key)
+        except ChannelClosedByBroker as ex:
+            self._fail(ex)
+
+    def queue_declare(self, queue: str, passive: bool = False, durable: bool = False,
+                      exclusive: bool = False, auto_delete: bool = False,
+                      arguments: Optional[Dict[str, Any]] = None) -> Method:
+        self._check()
+        try:
+            q = self._broker.queue_declare(queue, arguments if not passive else None, passive)
+        except ChannelClosedByBroker as ex:
+            self._fail(ex)
+        return Method(self.channel_number, QueueSpec.DeclareOk(
+            queue=q.name, message_count=len(q.messages), consumer_count=len(q.consumers)))
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: Optional[str] = None, **_: Any) -> None:
+        self._check()
+        try:
+            self._broker.queue_bind(queue, exchange, routing_key if routing_key is not None else queue)
+        except ChannelClosedByBroker as ex:
+            self._fail(ex)
+
+    def queue_unbind(self, queue: str, exchange: str, routing_key: Optional[str] = None, **_: Any) -> None:
+        self._check()
+        try:
+            self._broker.queue_unbind(queue, exchange, routing_key if routing_key is not None else queue)
+        except ChannelClosedByBroker as ex:
+            self._fail(ex)
+
+    def queue_delete(self, queue: str, if_unused: bool = False, if_empty: bool = False) -> Method:
+        self._check()
+        try:
+            n = self._broker.queue_delete(queue, if_unused, if_empty)
+        except ChannelClosedByBroker as ex:
+            self._fail(ex)
+        return Method(self.channel_number, QueueSpec.DeleteOk(message_count=n))
+
+    def exchange_delete(self, exchange: Optional[str] = None, if_unused: bool = False) -> None:
+        self._check()
+        try:
+            self._broker.exchange_delete(exchange or "", if_unused)
+        except ChannelClosedByBroker as ex:
+            self._fail(ex)
+
+    def queue_purge(self, queue: str) -> int:
+        self._check()
+        return self._broker.queue_purge(queue)
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0, global_qos: bool = False) -> None:
+        self._check()
+        grew = int(prefetch_count) <= 0 or 0 < self._prefetch < int(prefetch_count)
+        self._prefetch = int(prefetch_count)
+        if grew:
+            self._broker._settle(self, (), requeue=None)  # prefetch tăng: giao tiếp message đang chờ
+
+    def confirm_delivery(self) -> None:
+        self._check()  # publish trong bộ nhớ luôn đồng bộ: không có gì cần confirm
+
+    # --- publish ---
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes,
+                      properties: Optional[pika.BasicProperties] = None, mandatory: bool = False) -> None:
+        self._check()
+        try:
+            self._broker.publish(exchange, routing_key, body, properties)
+        except ChannelClosedByBroker as ex:
+            self._fail(ex)
+
+    # --- consume ---
+    def basic_consume(self, queue: str, on_message_callback: Callable, auto_ack: bool = False,
+                      consumer_tag: Optional[str] = None, arguments: Optional[Dict[str, Any]] = None,
+                      **_: Any) -> str:
+        self._check()
+        if auto_ack:
+            raise NotImplementedError("MemoryChannel only supports manual acks")
+        tag = consumer_tag or f"ctag{self.channel_number}.{next(self._consumer_seq)}"
+        try:
+            self._consumers.add(tag)
+            self._broker._consume(self, queue, tag, on_message_callback,
+                                  int((arguments or {}).get("x-priority", 0)))
+        except ChannelClosedByBroker as ex:
+            self._consumers.discard(tag)
+            self._fail(ex)
+        return tag
+
+    def basic_cancel(self, consumer_tag: str) -> None:
+        self._broker._cancel(self, consumer_tag)
+        self._consumers.discard(consumer_tag)
+        # Như pika: delivery chưa tới callback được trả lại queue
+        with self._broker._lock:
+            tags = [t for t, c in self._undispatched.items() if c == consumer_tag]
+            pending = [self._unacked.pop(t) for t in tags if t in self._unacked]
+            for t in tags:
+                del self._undispatched[t]
+        if pending:
+            self._broker._settle(self, pending, requeue=True)
+
+    def _has_capacity(self) -> bool:
+        return self.is_open and (self._prefetch <= 0 or len(self._unacked) < self._prefetch)
+
+    def _deliver(self, q: _Queue, consumer_tag: str, callback: Callable, msg: _Message) -> None:
+        # Gọi dưới lock của broker; callback chạy trên thread đang start_consuming
+        self._next_tag += 1
+        tag = self._next_tag
+        self._unacked[tag] = (q, msg)
+        self._undispatched[tag] = consumer_tag
+        method = Basic.Deliver(consumer_tag=consumer_tag, delivery_tag=tag, redelivered=msg.redelivered,
+                               exchange=msg.exchange, routing_key=msg.routing_key)
+        self.connection._post(functools.partial(self._on_delivery, callback, method, msg))
+
+    def _on_delivery(self, callback: Callable, method: Basic.Deliver, msg: _Message) -> None:
+        with self._broker._lock:
+            if self._undispatched.pop(method.delivery_tag, None) is None:
+                return  # consumer đã cancel, message đã về queue
+        if method.delivery_tag in self._unacked and self.is_open:
+            callback(self, method, msg.properties, msg.body)
+
+    def _take(self, delivery_tag: int, multiple: bool) -> List[Tuple[_Queue, _Message]]:
+        with self._broker._lock:
+            if multiple:
+                tags = [t for t in self._unacked if delivery_tag == 0 or t <= delivery_tag]
+            elif delivery_tag in self._unacked:
+                tags = [delivery_tag]
+            else:
+                tags = None
+            if tags is None:
+                self._fail(ChannelClosedByBroker(406, f"PRECONDITION_FAILED - unknown delivery tag {delivery_tag}"))
+            return [self._unacked.pop(t) for t in tags]
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False) -> None:
+        self._check()
+        self._broker._settle(self, self._take(delivery_tag, multiple), requeue=None)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True) -> None:
+        self._check()
+        self._broker._settle(self, self._take(delivery_tag, multiple), requeue=bool(requeue))
+
+    def basic_reject(self, delivery_tag: int, requeue: bool = True) -> None:
+        self.basic_nack(delivery_tag, requeue=requeue)
+
+    def start_consuming(self) -> None:
+        self._check()
+        self._consuming = True
+        # Như BlockingChannel: thoát khi không còn consumer nào trên channel
+        self.connection._run(lambda: self._consuming and self.is_open and bool(self._consumers))
+
+    def stop_consuming(self, consumer_tag: Optional[str] = None) -> None:
+        self._consuming = False
+        self.connection._post(lambda: None)  # đánh thức vòng lặp
+
+    def close(self, reply_code: int = 0, reply_text: str = "Normal shutdown") -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._consuming = False
+        self._broker._cancel(self)
+        self._consumers.clear()
+        with self._broker._lock:
+            pending = list(self._unacked.values())
+            self._unacked.clear()
+            self._undispatched.clear()
+        # Message chưa ack được trả lại queue (redelivered=True)
+        self._broker._settle(self, pending, requeue=True)
+        self.connection._post(lambda: None)
+
+
+class MemoryConnection:
+    """Giống BlockingConnection: callback/delivery chạy trên thread gọi start_consuming/process_data_events."""
+
+    def __init__(self, broker: MemoryBroker) -> None:
+        self.broker = broker
+        self._events: "queue.SimpleQueue[Callable[[], None]]" = queue.SimpleQueue()
+        self._timers: List[Tuple[float, int, Callable[[], None]]] = []
+        self._cancelled: Set[int] = set()
+        self._seq = itertools.count(1)
+        self._channels: List[MemoryChannel] = []
+        self._open = True
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    @property
+    def is_closed(self) -> bool:
+        return not self._open
+
+    def channel(self, channel_number: Optional[int] = None) -> MemoryChannel:
+        if not self._open:
+            raise ConnectionWrongStateError("Connection is closed.")
+        ch = MemoryChannel(self, channel_number or len(self._channels) + 1)
+        self._channels.append(ch)
+        return ch
+
+    def close(self, reply_code: int = 200, reply_text: str = "Normal shutdown") -> None:
+        if not self._open:
+            return
+        for ch in self._channels:
+            ch.close()
+        self._open = False
+        self._post(lambda: None)
+
+    # --- event loop ---
+    def _post(self, cb: Callable[[], None]) -> None:
+        self._events.put(cb)
+
+    def add_callback_threadsafe(self, callback: Callable[[], None]) -> None:
+        if not self._open:
+            raise ConnectionWrongStateError("Connection is closed.")
+        self._post(callback)
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> int:
+        handle = next(self._seq)
+        heapq.heappush(self._timers, (time.monotonic() + delay, handle, callback))
+        return handle
+
+    def remove_timeout(self, timeout_id: int) -> None:
+        self._cancelled.add(timeout_id)
+
+    def _run_timers(self) -> Optional[float]:
+        while self._timers:
+            when, handle, cb = self._timers[0]
+            if handle in self._cancelled:
+                heapq.heappop(self._timers)
+                self._cancelled.discard(handle)
+                continue
+            left = when - time.monotonic()
+            if left > 0:
+                return left
+            heapq.heappop(self._timers)
+            cb()
+        return None
+
+    def _run(self, keep_going: Callable[[], bool], time_limit: Optional[float] = None) -> None:
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        while keep_going():
+            wait = self._run_timers()
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                wait = left if wait is None else min(wait, left)
+            try:
+                cb = self._events.get(timeout=wait if wait is not None else 1.0)
+            except queue.Empty:
+                continue
+            cb()
+
+    def process_data_events(self, time_limit: float = 0) -> None:
+        self._run(lambda: self._open, time_limit=time_limit or 0.0)
+
+    def sleep(self, duration: float) -> None:
+        self._run(lambda: self._open, time_limit=duration)
+
+
+class MemoryTransport(Transport):
+    """Transport dùng MemoryBroker; mọi connection của transport dùng chung một broker."""
+    name = "memory"
+    supports_confirms = False
+
+    def __init__(self, broker: Optional[MemoryBroker] = None) -> None:
+        self.broker = broker or MemoryBroker()
+
+    def connect(self) -> MemoryConnection:
+        return MemoryConnection(self.broker)
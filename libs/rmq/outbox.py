@@ -0,0 +1,193 @@
+# libs/rmq/outbox.py
+from __future__ import annotations
+
+"""Transactional outbox for events produced inside a database transaction.
+
+Inside ``with session_scope() as db, outbox.bind(db):`` every ``publish_event``
+call inserts a row into the service's ``event_outbox`` table instead of talking to
+the broker, so the event commits (or rolls back) together with the business
+change. ``OutboxRelay`` drains the table in batches: it locks up to ``batch_size``
+rows with ``FOR UPDATE SKIP LOCKED`` (several replicas can relay side by side),
+publishes them with publisher confirms and deletes the rows the broker acked.
+
+Delivery is at-least-once: a relay crash after publish but before commit
+republishes the batch with the same message_id, which consumer dedup absorbs.
+Table DDL lives in each service's db/migrations (0002_outbox.sql).
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import wait
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from libs.metrics import registry as metrics
+from . import bus
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_TABLE = "event_outbox"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL_MS", "500")) / 1000.0
+OUTBOX_CONFIRM_TIMEOUT = float(os.getenv("OUTBOX_CONFIRM_TIMEOUT", "10"))
+
+_session: contextvars.ContextVar[Optional[Session]] = contextvars.ContextVar("rmq_outbox_session", default=None)
+_wakeup = threading.Event()
+
+
+def _on_commit(_session: Session) -> None:
+    _wakeup.set()  # relay trong process publish ngay, không chờ hết poll interval
+
+
+@contextmanager
+def bind(session: Session) -> Iterator[Session]:
+    """publish_event trong block này ghi vào outbox qua `session` thay vì publish thẳng."""
+    if not event.contains(session, "after_commit", _on_commit):
+        event.listen(session, "after_commit", _on_commit)
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+
+
+def current_session() -> Optional[Session]:
+    return _session.get()
+
+
+def enqueue(session: Session, routing_key: str, payload: Dict[str, Any], *,
+            headers: Optional[Dict[str, Any]] = None, message_id: Optional[str] = None,
+            table: str = OUTBOX_TABLE) -> str:
+    """Ghi 1 event vào outbox trong transaction của `session`; trả về message_id."""
+    message_id = message_id or str(uuid.uuid4())
+    session.execute(
+        text(
+            f"""
+            INSERT INTO {table} (message_id, routing_key, payload, headers)
+            VALUES (:mid, :rk, CAST(:payload AS jsonb), CAST(:headers AS jsonb))
+            """
+        ),
+        {
+            "mid": message_id,
+            "rk": routing_key,
+            "payload": json.dumps(payload, default=str),
+            "headers": json.dumps(headers or {}, default=str),
+        },
+    )
+    return message_id
+
+
+class OutboxRelay:
+    """Drain outbox theo batch trên 1 daemon thread; chạy được song song ở nhiều replica."""
+
+    def __init__(self, engine: Engine, *,
+                 batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 confirm_timeout: float = OUTBOX_CONFIRM_TIMEOUT,
+                 table: str = OUTBOX_TABLE) -> None:
+        self._engine = engine
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.confirm_timeout = confirm_timeout
+        self.table = table
+        self.last_errors = 0
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        """Publish 1 batch; trả về số event đã được broker xác nhận."""
+        with self._engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    f"""
+                    SELECT id, message_id::text AS message_id, routing_key, payload, headers,
+                           EXTRACT(EPOCH FROM now() - created_at) AS age
+                    FROM {self.table}
+                    ORDER BY id
+                    LIMIT :n
+                    FOR UPDATE SKIP LOCKED
+                    """
+                ),
+                {"n": self.batch_size},
+            ).mappings().all()
+            self.last_errors = 0
+            if not rows:
+                metrics.set_gauge("rmq_outbox_lag_seconds", 0)
+                return 0
+            metrics.set_gauge("rmq_outbox_lag_seconds", float(rows[0]["age"]))
+            metrics.observe("rmq_outbox_batch_size", len(rows))
+
+            futures = {}
+            errors: Dict[int, str] = {}
+            for row in rows:
+                try:
+                    futures[row["id"]] = bus.publish(row["routing_key"], row["payload"],
+                                                     headers=row["headers"], message_id=row["message_id"],
+                                                     confirm=True, spool=False)  # outbox là bộ đệm bền rồi
+                except Exception as ex:
+                    errors[row["id"]] = str(ex)
+            wait(list(futures.values()), timeout=self.confirm_timeout)
+            for rid, fut in futures.items():
+                if not fut.done():
+                    errors[rid] = "confirm timeout"
+                elif fut.exception() is not None:
+                    errors[rid] = str(fut.exception())
+            acked = [rid for rid in futures if rid not in errors]
+
+            if acked:
+                conn.execute(text(f"DELETE FROM {self.table} WHERE id = ANY(:ids)"), {"ids": acked})
+            if errors:
+                conn.execute(
+                    text(f"UPDATE {self.table} SET attempts = attempts + 1, last_error = :err WHERE id = ANY(:ids)"),
+                    {"ids": list(errors), "err": next(iter(errors.values()))[:500]},
+                )
+                logger.warning("rmq outbox relay: %s of %s events not confirmed (%s)",
+                               len(errors), len(rows), next(iter(errors.values())))
+        self.last_errors = len(errors)
+        metrics.inc("rmq_outbox_published_total", len(acked))
+        if errors:
+            metrics.inc("rmq_outbox_failed_total", len(errors))
+        return len(acked)
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            _wakeup.clear()
+            try:
+                n = self.run_once()
+                failed = self.last_errors > 0
+            except Exception:
+                logger.exception("rmq outbox relay batch failed")
+                n, failed = 0, True
+            if failed:
+                # Broker/DB lỗi: không wake theo commit, chờ rồi thử lại
+                self._stopping.wait(max(self.poll_interval, 1.0))
+            elif n < self.batch_size:
+                # Hết backlog: chờ commit mới (after_commit) hoặc hết poll interval
+                _wakeup.wait(self.poll_interval)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="rmq-outbox-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        _wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def start_relay(engine: Engine, **kwargs: Any) -> OutboxRelay:
+    relay = OutboxRelay(engine, **kwargs)
+    relay.start()
+    return relay
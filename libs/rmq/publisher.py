@@ -1,17 +1,19 @@
 
 # libs/rmq/publisher.py
 import time
-from typing import Dict, Any, Optional
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Optional
 from .bus import publish
+from . import outbox
 
-def publish_event(
-    routing_key: str,
-    payload: Dict[str, Any],
-    *,
-    event_type: str,
-    idempotency_key: Optional[str] = None,
-    correlation_id: Optional[str] = None
-) -> None:
+# Khoá phân vùng (vd. payment_id): consistent-hash exchange route theo header này (xem sharding.py)
+PARTITION_HEADER = "partition-key"
+
+
+def _event_headers(event_type: str,
+                   idempotency_key: Optional[str] = None,
+                   correlation_id: Optional[str] = None,
+                   partition_key: Optional[str] = None) -> Dict[str, Any]:
     headers = {
         "event-type": event_type,
         "occurred-at": int(time.time() * 1000),
@@ -20,6 +22,27 @@ def publish_event(
         headers["idempotency-key"] = idempotency_key
     if correlation_id:
         headers["correlation-id"] = correlation_id
+    if partition_key:
+        headers[PARTITION_HEADER] = str(partition_key)
+    return headers
 
-    publish(routing_key=routing_key, body=payload, headers=headers)
 
+def publish_event(
+    routing_key: str,
+    payload: Dict[str, Any],
+    *,
+    event_type: str,
+    idempotency_key: Optional[str] = None,
+    correlation_id: Optional[str] = None,
+    partition_key: Optional[str] = None,
+    confirm: Optional[bool] = None,
+    on_confirm: Optional[Callable[[Future], None]] = None,
+) -> Optional[Future]:
+    headers = _event_headers(event_type, idempotency_key, correlation_id, partition_key)
+    session = outbox.current_session()
+    if session is not None:
+        # Trong outbox.bind(db): event commit cùng transaction, relay publish sau
+        outbox.enqueue(session, routing_key, payload, headers=headers)
+        return None
+    return publish(routing_key=routing_key, body=payload, headers=headers,
+                   confirm=confirm, on_confirm=on_confirm)
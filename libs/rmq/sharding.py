@@ -0,0 +1,127 @@
+# libs/rmq/sharding.py
+from __future__ import annotations
+
+"""Consistent-hash sharded queues: scale a consumer out without losing per-key order.
+
+A single queue with a single consumer serialises a whole service. ``ShardedQueue``
+binds the routing keys from the main exchange to an ``x-consistent-hash`` exchange
+(RabbitMQ plugin ``rabbitmq_consistent_hash_exchange``) that hashes the
+``partition-key`` header (``publish_event(partition_key=...)``) onto N queues
+``<name>.shard.<i>``. Every event of one key lands on the same shard, and shards are
+declared with ``x-single-active-consumer`` so exactly one replica consumes a shard
+at a time: per-key ordering holds across instances while throughput grows with the
+number of replicas (up to N).
+
+Replica ``index`` of ``replicas`` owns shards ``i % replicas == index`` and consumes
+them right away at ``OWNER_PRIORITY``. It subscribes to every other shard too, at
+``STANDBY_PRIORITY`` and only after ``standby_delay`` seconds, so the owners register
+first and a shard whose owner dies is taken over by a live replica. When the owner
+comes back, brokers that honour consumer priorities for single active consumer
+(quorum queues) hand the shard back once the standby's unacked messages are
+settled; otherwise the standby keeps it until it restarts.
+
+Retry tiers of a shard dead-letter back into the same shard. The shard count is part
+of the layout: changing N remaps keys, so drain the shards before resizing.
+``retire(keep)`` unbinds the shards from ``keep`` on (after a resize) or, with
+``keep=0``, deletes the hash exchange; drained shards are deleted.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .bus import EXCHANGE, RetryPolicy, _Rmq
+from .consumer import Subscription
+from .flow import AdaptivePrefetch
+from .publisher import PARTITION_HEADER
+from .topology import ExchangeSpec, QueueSpec, registry, retire_exchange, retire_queue
+
+CONSISTENT_HASH = "x-consistent-hash"
+OWNER_PRIORITY = 10
+STANDBY_PRIORITY = 0
+
+
+class ShardedQueue:
+    def __init__(self, name: str, routing_keys: Iterable[str], shards: int, *,
+                 hash_header: str = PARTITION_HEADER,
+                 dead_letter: bool = True,
+                 retry: Optional[RetryPolicy] = None,
+                 exchange: str = EXCHANGE,
+                 queue_options: Optional[Dict[str, Any]] = None) -> None:
+        if shards < 1:
+            raise ValueError(f"sharded queue {name!r}: shards must be >= 1")
+        self.name = name
+        self.routing_keys: List[str] = list(dict.fromkeys(routing_keys))
+        self.shards = int(shards)
+        self.hash_header = hash_header
+        self.dead_letter = dead_letter
+        self.retry = retry
+        self.exchange = exchange
+        self.queue_options = dict(queue_options or {})  # lazy / quorum / arguments (QueueSpec)
+
+    @property
+    def hash_exchange(self) -> str:
+        return f"{self.name}.hash"
+
+    def shard_queue(self, i: int) -> str:
+        return f"{self.name}.shard.{i}"
+
+    @property
+    def queues(self) -> List[str]:
+        return [self.shard_queue(i) for i in range(self.shards)]
+
+    def exchange_spec(self) -> ExchangeSpec:
+        return ExchangeSpec(self.hash_exchange, CONSISTENT_HASH,
+                            arguments={"hash-header": self.hash_header},
+                            bindings=[(self.exchange, rk) for rk in self.routing_keys])
+
+    def queue_specs(self) -> List[QueueSpec]:
+        opts = dict(self.queue_options)
+        arguments = {**opts.pop("arguments", {}), "x-single-active-consumer": True}
+        # Binding key của consistent-hash exchange là trọng số; DLQ mỗi shard dùng key riêng
+        return [QueueSpec(q, ["1"], exchange=self.hash_exchange, dead_letter=self.dead_letter,
+                          dead_letter_key=q, retry=self.retry, arguments=arguments, **opts)
+                for q in self.queues]
+
+    def declare(self) -> None:
+        """Đăng ký hash exchange + các shard vào topology.registry và khai báo ngay."""
+        registry.add_exchange(self.exchange_spec())
+        for spec in self.queue_specs():
+            registry.add(spec)
+        registry.ensure(_Rmq.admin_channel())
+
+    def retire(self, keep: int = 0) -> None:
+        """
+        Gỡ các shard từ `keep` trở đi (vd. sau khi giảm số shard); keep=0 gỡ cả layout và xoá hash
+        exchange. Shard đã rỗng bị xoá, shard còn message chỉ bị unbind (xoá ở lần gọi sau).
+        """
+        if keep <= 0:
+            retire_exchange(self.hash_exchange)
+        i = max(0, keep)
+        # Số shard cũ không được lưu ở đâu: dò tới shard đầu tiên không tồn tại
+        while retire_queue(self.shard_queue(i), ["1"], exchange=self.hash_exchange, retry=self.retry) is not None:
+            i += 1
+
+    def owned(self, index: int, replicas: int) -> List[int]:
+        """Các shard replica `index` (0-based) trên tổng `replicas` consume trước tiên."""
+        replicas = max(1, int(replicas))
+        return [i for i in range(self.shards) if i % replicas == int(index) % replicas]
+
+    def subscriptions(self, handler: Callable[[Dict[str, Any], Dict[str, Any], str], None], *,
+                      index: int = 0,
+                      replicas: int = 1,
+                      standby_delay: float = 15.0,
+                      flow: Optional[Callable[[], Optional[AdaptivePrefetch]]] = None,
+                      **kwargs: Any) -> List[Subscription]:
+        """
+        Một Subscription mỗi shard (chạy bằng consumer.run). `flow`: factory tạo AdaptivePrefetch
+        riêng cho từng shard; kwargs còn lại (prefetch, workers, partition_key, dedup, ...) dùng chung.
+        """
+        self.declare()
+        mine = set(self.owned(index, replicas))
+        return [
+            Subscription(q, "", handler, retry=self.retry, dead_letter=self.dead_letter,
+                         flow=flow() if flow is not None else None,
+                         consumer_priority=OWNER_PRIORITY if i in mine else STANDBY_PRIORITY,
+                         start_delay=0.0 if i in mine else standby_delay,
+                         **kwargs)
+            for i, q in enumerate(self.queues)
+        ]
@@ -0,0 +1,420 @@
+# libs/rmq/spool.py
+from __future__ import annotations
+
+"""Local disk spool for publishes made while the broker is unreachable.
+
+Without it a RabbitMQ blip surfaces as an exception (or a confirm timeout) in
+whatever request handler was publishing, although the state the event describes is
+already written. With a spool enabled (``enable(directory)``, usually from the
+service's startup hook):
+
+- ``bus.publish`` appends the encoded message to an append-only log instead of
+  raising when the publisher pool cannot connect, or when the confirm publisher is
+  disconnected. The caller gets ``None``, or a future that is already resolved. Messages
+  not yet sent when the confirm publisher loses its connection are moved to the spool.
+- While the spool holds anything, every new publish is appended behind it, so events
+  keep their publish order.
+- A relay thread replays the log oldest first in batches of ``batch_size`` with
+  publisher confirms, only while the confirm publisher is connected. It persists a
+  cursor after each confirmed batch and deletes fully replayed segments. A replayed
+  message whose connection drops before the ack fails instead of being spooled again,
+  so it stays at the head of the log and the order is kept across outages.
+
+The log is a sequence of fixed-size, memory-mapped segment files
+(``<seq>.seg``). A record is ``[u32 length][u32 crc32][u32 meta length][meta json][body]``,
+where meta holds the routing key, message id, content type, delivery mode and headers. A
+torn tail (crash mid-write) fails the crc and is cut off on the next open. Writes go
+to the page cache, so a process crash keeps them; a machine crash may lose what was
+not yet flushed (segments are flushed on roll and on ``stop``).
+
+``max_bytes`` bounds the spool. Once full, publish raises ``SpoolFull`` (chained to
+the broker error, if there was one). Replay is at-least-once: a crash between publish and cursor write
+republishes the batch with the same message ids, which consumer dedup absorbs.
+
+One process owns one spool directory (``flock``). A second process on the same
+``directory`` takes ``directory/1``, ``directory/2``, ... and a restarted process
+picks up whichever spool is free, including one left by a dead process.
+
+Metrics: ``rmq_spool_bytes``, ``rmq_spool_records``, ``rmq_spool_oldest_age_seconds``
+(gauges); ``rmq_spooled_total``, ``rmq_spool_replayed_total``, ``rmq_spool_full_total``.
+"""
+
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import Future, wait
+from typing import Any, List, Optional, Tuple
+
+import pika
+
+from libs.metrics import registry as metrics
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = os.getenv("RABBIT_SPOOL_DIR", "")                      # rỗng = tắt spool
+SPOOL_MAX_BYTES = int(float(os.getenv("RABBIT_SPOOL_MAX_MB", "256")) * 1024 * 1024)
+SPOOL_SEGMENT_BYTES = int(float(os.getenv("RABBIT_SPOOL_SEGMENT_MB", "16")) * 1024 * 1024)
+SPOOL_BATCH_SIZE = int(os.getenv("RABBIT_SPOOL_BATCH_SIZE", "500"))
+SPOOL_CONFIRM_TIMEOUT = float(os.getenv("RABBIT_SPOOL_CONFIRM_TIMEOUT", "10"))
+
+_HEADER = struct.Struct("<II")   # length, crc32 (của phần sau header)
+_META = struct.Struct("<I")      # độ dài meta json
+
+Record = Tuple[str, bytes, pika.BasicProperties]
+
+
+class SpoolFull(Exception):
+    """Spool đã đạt max_bytes; message không được ghi."""
+
+
+def _encode(routing_key: str, body: bytes, props: pika.BasicProperties) -> bytes:
+    meta = json.dumps({
+        "rk": routing_key,
+        "id": props.message_id,
+        "ct": props.content_type,
+        "dm": props.delivery_mode,
+        "h": props.headers or {},
+        "ts": time.time(),
+    }, separators=(",", ":")).encode("utf-8")
+    payload = _META.pack(len(meta)) + meta + body
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _decode(payload: bytes) -> Tuple[Record, float]:
+    (n,) = _META.unpack_from(payload)
+    meta = json.loads(payload[_META.size:_META.size + n])
+    props = pika.BasicProperties(content_type=meta["ct"], delivery_mode=meta["dm"],
+                                 headers=meta["h"], message_id=meta["id"])
+    return (meta["rk"], payload[_META.size + n:], props), float(meta.get("ts", 0.0))
+
+
+class _Segment:
+    def __init__(self, path: str, seq: int, size: int) -> None:
+        self.path = path
+        self.seq = seq
+        exists = os.path.exists(path)
+        self._f = open(path, "r+b" if exists else "w+b")
+        if not exists or os.path.getsize(path) < size:
+            self._f.truncate(size)
+        self.size = os.path.getsize(path)
+        self.mm = mmap.mmap(self._f.fileno(), self.size)
+        self.end = 0
+
+    def scan(self, offset: int = 0) -> Tuple[int, int]:
+        """Duyệt record từ `offset` tới hết phần hợp lệ; đặt `end`, trả về (số record, số byte)."""
+        count = nbytes = 0
+        pos = offset
+        while True:
+            rec = self.read(pos)
+            if rec is None:
+                break
+            count += 1
+            nbytes += rec[1] - pos
+            pos = rec[1]
+        self.end = pos
+        return count, nbytes
+
+    def read(self, offset: int) -> Optional[Tuple[bytes, int]]:
+        """(payload, offset kế tiếp) hoặc None ở cuối phần đã ghi / record hỏng."""
+        if offset + _HEADER.size > self.size:
+            return None
+        length, crc = _HEADER.unpack_from(self.mm, offset)
+        start = offset + _HEADER.size
+        if length == 0 or start + length > self.size:
+            return None
+        payload = bytes(self.mm[start:start + length])
+        if zlib.crc32(payload) != crc:
+            return None
+        return payload, start + length
+
+    def append(self, record: bytes) -> bool:
+        if self.end + len(record) + _HEADER.size > self.size:  # chừa chỗ cho header 0 kết thúc
+            return False
+        self.mm[self.end:self.end + len(record)] = record
+        self.end += len(record)
+        return True
+
+    def flush(self) -> None:
+        self.mm.flush()
+
+    def close(self, *, delete: bool = False) -> None:
+        try:
+            self.mm.flush()
+            self.mm.close()
+        finally:
+            self._f.close()
+        if delete:
+            os.remove(self.path)
+
+
+class PublishSpool:
+    def __init__(self, directory: str, *,
+                 max_bytes: int = SPOOL_MAX_BYTES,
+                 segment_bytes: int = SPOOL_SEGMENT_BYTES,
+                 batch_size: int = SPOOL_BATCH_SIZE,
+                 retry_interval: float = 1.0) -> None:
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.batch_size = max(1, batch_size)
+        self.retry_interval = retry_interval
+        self.directory, self._lockf = self._claim(directory)
+        self._lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        self._read_pos = 0           # offset đọc trong segment đầu tiên
+        self._next_seq = 0
+        self._records = 0
+        self._bytes = 0
+        self._oldest: Optional[float] = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._load()
+
+    # --- storage ---
+    @staticmethod
+    def _claim(directory: str) -> Tuple[str, Any]:
+        for i in range(64):
+            path = directory if i == 0 else os.path.join(directory, str(i))
+            os.makedirs(path, exist_ok=True)
+            f = open(os.path.join(path, "lock"), "a+")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return path, f
+            except OSError:
+                f.close()
+        raise RuntimeError(f"no free publish spool slot under {directory}")
+
+    def _cursor_path(self) -> str:
+        return os.path.join(self.directory, "cursor")
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}.seg")
+
+    def _load(self) -> None:
+        seqs = sorted(int(n[:-4]) for n in os.listdir(self.directory) if n.endswith(".seg") and n[:-4].isdigit())
+        cur_seq, cur_off = -1, 0
+        try:
+            with open(self._cursor_path()) as f:
+                cur_seq, cur_off = (int(x) for x in f.read().split())
+        except (OSError, ValueError):
+            pass
+        self._next_seq = max([cur_seq, *(s + 1 for s in seqs), 0])
+        for seq in seqs:
+            if seq < cur_seq:
+                os.remove(self._segment_path(seq))  # đã replay hết, chưa kịp xoá
+                continue
+            seg = _Segment(self._segment_path(seq), seq, self.segment_bytes)
+            offset = cur_off if seq == cur_seq else 0
+            if not self._segments:
+                self._read_pos = offset
+            count, nbytes = seg.scan(offset)
+            self._records += count
+            self._bytes += nbytes
+            self._segments.append(seg)
+        if self._segments and self._records:
+            rec = self._segments[0].read(self._read_pos)
+            self._oldest = _decode(rec[0])[1] if rec else None
+            logger.warning("rmq publish spool %s: %d message(s) left from a previous run", self.directory,
+                           self._records)
+        self._gauges()
+
+    def _write_cursor(self, seq: int, offset: int) -> None:
+        tmp = self._cursor_path() + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{seq} {offset}")
+        os.replace(tmp, self._cursor_path())
+
+    def _gauges(self) -> None:
+        metrics.set_gauge("rmq_spool_bytes", self._bytes)
+        metrics.set_gauge("rmq_spool_records", self._records)
+        metrics.set_gauge("rmq_spool_oldest_age_seconds",
+                          max(0.0, time.time() - self._oldest) if self._oldest else 0.0)
+
+    def pending(self) -> bool:
+        return self._records > 0
+
+    def __len__(self) -> int:
+        return self._records
+
+    def append(self, routing_key: str, body: bytes, props: pika.BasicProperties) -> None:
+        record = _encode(routing_key, body, props)
+        with self._lock:
+            if self._bytes + len(record) > self.max_bytes:
+                metrics.inc("rmq_spool_full_total")
+                raise SpoolFull(f"publish spool {self.directory} is full ({self._bytes} bytes)")
+            seg = self._segments[-1] if self._segments else None
+            if seg is None or not seg.append(record):
+                if seg is not None:
+                    seg.flush()
+                seq, self._next_seq = self._next_seq, self._next_seq + 1
+                seg = _Segment(self._segment_path(seq), seq, max(self.segment_bytes, len(record) + _HEADER.size))
+                if not self._segments:
+                    self._read_pos = 0
+                self._segments.append(seg)
+                seg.append(record)
+            self._records += 1
+            self._bytes += len(record)
+            if self._oldest is None:
+                self._oldest = time.time()
+            self._gauges()
+        metrics.inc("rmq_spooled_total", routing_key=routing_key)
+        self._wakeup.set()
+
+    def accept(self, routing_key: str, body: bytes, props: pika.BasicProperties,
+               confirm: bool = False, on_confirm: Optional[Any] = None) -> Optional[Future]:
+        """Ghi vào spool thay cho publish; future (nếu confirm) resolve ngay vì message đã bền trên đĩa."""
+        self.append(routing_key, body, props)
+        if not confirm:
+            return None
+        fut: Future = Future()
+        if on_confirm is not None:
+            fut.add_done_callback(on_confirm)
+        fut.set_result(None)
+        return fut
+
+    def read_batch(self, limit: int) -> Tuple[List[Record], Tuple[int, int]]:
+        """Tối đa `limit` record cũ nhất và vị trí (segment index, offset) ngay sau record cuối."""
+        out: List[Record] = []
+        with self._lock:
+            idx, pos = 0, self._read_pos
+            while idx < len(self._segments) and len(out) < limit:
+                rec = self._segments[idx].read(pos)
+                if rec is None:
+                    if idx == len(self._segments) - 1:
+                        break
+                    idx, pos = idx + 1, 0
+                    continue
+                out.append(_decode(rec[0])[0])
+                pos = rec[1]
+        return out, (idx, pos)
+
+    def commit(self, count: int, position: Tuple[int, int]) -> None:
+        """Bỏ `count` record đầu (đã được broker confirm) tới `position` của read_batch."""
+        idx, pos = position
+        with self._lock:
+            freed = 0
+            for seg in self._segments[:idx]:
+                freed += seg.end - (self._read_pos if seg is self._segments[0] else 0)
+                seg.close(delete=True)
+            if idx:
+                self._read_pos = 0
+            self._segments = self._segments[idx:]
+            freed += pos - self._read_pos
+            self._read_pos = pos
+            self._records -= count
+            self._bytes -= freed
+            if self._records == 0 and self._segments:
+                # Rỗng: xoá luôn segment hiện tại, lần spool sau bắt đầu segment mới
+                last = self._segments.pop()
+                last.close(delete=True)
+                self._read_pos = 0
+                self._oldest = None
+                self._bytes = 0
+                self._write_cursor(self._next_seq, 0)
+            else:
+                self._write_cursor(self._segments[0].seq if self._segments else self._next_seq, self._read_pos)
+                rec = self._segments[0].read(self._read_pos) if self._segments else None
+                self._oldest = _decode(rec[0])[1] if rec else None
+            self._gauges()
+        metrics.inc("rmq_spool_replayed_total", count)
+
+    # --- replay ---
+    def replay_once(self) -> int:
+        """Publish một batch (có confirm) rồi commit phần đầu liên tiếp đã được ack; trả về số message đã commit."""
+        from .bus import _publish_raw
+        batch, end = self.read_batch(self.batch_size)
+        if not batch:
+            return 0
+        futures: List[Future] = []
+        error: Optional[BaseException] = None
+        for routing_key, body, props in batch:
+            try:
+                futures.append(_publish_raw(routing_key, body, props, confirm=True, spool=False))
+            except Exception as ex:
+                error = ex
+                break
+        wait(futures, timeout=SPOOL_CONFIRM_TIMEOUT)
+        done = 0
+        for fut in futures:
+            if not fut.done() or fut.exception() is not None:
+                error = error or (fut.exception() if fut.done() else TimeoutError("publish confirm timed out"))
+                break
+            done += 1
+        if done == len(batch):
+            self.commit(done, end)
+        elif done:
+            # Commit phần đầu đã ack: đọc lại vị trí của record thứ `done`
+            _, partial = self.read_batch(done)
+            self.commit(done, partial)
+        if error is not None:
+            logger.warning("rmq publish spool replay stopped after %d/%d: %s", done, len(batch), error)
+        return done
+
+    @staticmethod
+    def _broker_ready() -> bool:
+        from .transport import get_transport
+        if not get_transport().supports_confirms:
+            return True  # publish đồng bộ qua pool: broker down thì replay_once dừng ngay ở record đầu
+        from .confirms import get_confirm_publisher
+        return get_confirm_publisher().connected()
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            if not self.pending():
+                self._wakeup.wait(self.retry_interval)
+                continue
+            if not self._broker_ready():
+                self._stopping.wait(self.retry_interval)
+                continue
+            try:
+                n = self.replay_once()
+            except Exception:
+                logger.exception("rmq publish spool replay failed")
+                n = 0
+            if n == 0:
+                self._stopping.wait(self.retry_interval)  # broker vẫn chưa sẵn sàng
+
+    def start(self) -> "PublishSpool":
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="rmq-publish-spool", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            for seg in self._segments:
+                seg.flush()
+
+
+def enable(directory: str = SPOOL_DIR, **kwargs: Any) -> Optional[PublishSpool]:
+    """Bật spool cho bus.publish của process và chạy relay; directory rỗng -> None (tắt)."""
+    if not directory:
+        return None
+    from . import bus
+    spool = PublishSpool(directory, **kwargs).start()
+    bus.set_spool(spool)
+    logger.info("rmq publish spool at %s (max %d MB)", spool.directory, spool.max_bytes // (1024 * 1024))
+    return spool
+
+
+def disable(spool: Optional[PublishSpool], timeout: float = 5.0) -> None:
+    """Tắt spool (shutdown): message còn lại nằm trên đĩa, lần khởi động sau replay tiếp."""
+    from . import bus
+    if spool is None:
+        return
+    if bus.get_spool() is spool:
+        bus.set_spool(None)
+    spool.stop(timeout)
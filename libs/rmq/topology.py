@@ -0,0 +1,311 @@
+# libs/rmq/topology.py
+from __future__ import annotations
+
+"""Declarative RabbitMQ topology, declared once per connection.
+
+Services register a ``QueueSpec`` per queue (routing keys, DLQ, retry tiers and
+queue arguments such as lazy / quorum / max-priority) and an ``ExchangeSpec`` for
+any extra exchange bound to the main one (e.g. the consistent-hash exchange of a
+sharded queue, see sharding.py). ``Topology.ensure(ch)``
+declares the exchanges and every registered queue the first time a connection is
+used and again only after the registry changed, so publish and consume paths never
+re-declare anything on the hot path. Publisher connections pass ``queues=False``:
+they only need the exchanges, queues are declared by consumers and ``declare()``.
+
+Declarations are idempotent on the broker; changing the arguments of an existing
+queue is rejected by RabbitMQ (406), so new arguments need a new queue name. A
+declaration the broker rejects is logged (``rmq_topology_errors_total``) and skipped;
+the rest of the topology is still declared on a fresh channel, and the caller's
+channel stays usable.
+
+A queue dropped from a service's layout keeps its bindings on the broker and keeps
+receiving copies of every event. ``retire_queue`` unbinds it and deletes it once it
+is drained; ``retire_exchange`` removes an extra exchange with its bindings.
+"""
+
+import logging
+import threading
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pika
+
+from libs.metrics import registry as metrics
+from .bus import DLX, EXCHANGE, RetryPolicy, retry_queue_name
+
+logger = logging.getLogger(__name__)
+
+
+class QueueSpec:
+    def __init__(self, name: str, routing_keys: Iterable[str] = (), *,
+                 dead_letter: bool = True,
+                 retry: Optional[RetryPolicy] = None,
+                 lazy: bool = False,
+                 quorum: bool = False,
+                 max_priority: Optional[int] = None,
+                 arguments: Optional[Dict[str, Any]] = None,
+                 exchange: str = EXCHANGE,
+                 dead_letter_key: Optional[str] = None) -> None:
+        if quorum and (lazy or max_priority):
+            raise ValueError(f"queue {name!r}: quorum queues support neither lazy mode nor priorities")
+        self.name = name
+        self.routing_keys: List[str] = list(dict.fromkeys(routing_keys))
+        self.dead_letter = dead_letter
+        self.retry = retry
+        self.lazy = lazy
+        self.quorum = quorum
+        self.max_priority = max_priority
+        self.extra_arguments = dict(arguments or {})
+        self.exchange = exchange
+        self._dead_letter_key = dead_letter_key
+
+    @property
+    def dlq(self) -> str:
+        return f"{self.name}.dlq"
+
+    @property
+    def dead_letter_key(self) -> str:
+        if self._dead_letter_key:
+            return self._dead_letter_key
+        return self.routing_keys[0] if self.routing_keys else self.name
+
+    def arguments(self) -> Dict[str, Any]:
+        args: Dict[str, Any] = {}
+        if self.dead_letter:
+            # Fail -> DLX với routing key chính; DLQ bind theo cùng key
+            args["x-dead-letter-exchange"] = DLX
+            args["x-dead-letter-routing-key"] = self.dead_letter_key
+        if self.lazy:
+            args["x-queue-mode"] = "lazy"
+        if self.quorum:
+            args["x-queue-type"] = "quorum"
+        if self.max_priority:
+            args["x-max-priority"] = int(self.max_priority)
+        args.update(self.extra_arguments)
+        return args
+
+    def _identity(self) -> Tuple[Any, ...]:
+        return (self.exchange, self.dead_letter, self._dead_letter_key, self.lazy, self.quorum, self.max_priority,
+                sorted(self.extra_arguments.items()),
+                tuple(self.retry.tiers_ms) if self.retry is not None else None)
+
+    def declare(self, ch: Any) -> None:
+        ch.queue_declare(queue=self.name, durable=True, arguments=self.arguments())
+        for rk in self.routing_keys:
+            ch.queue_bind(queue=self.name, exchange=self.exchange, routing_key=rk)
+        if self.dead_letter:
+            ch.queue_declare(queue=self.dlq, durable=True)
+            ch.queue_bind(queue=self.dlq, exchange=DLX, routing_key=self.dead_letter_key)
+        if self.retry is not None:
+            # Mỗi tầng 1 queue: publish qua default exchange, hết TTL dead-letter thẳng về queue gốc
+            for ttl in sorted(set(self.retry.tiers_ms)):
+                ch.queue_declare(queue=retry_queue_name(self.name, ttl), durable=True, arguments={
+                    "x-message-ttl": ttl,
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": self.name,
+                })
+
+
+class ExchangeSpec:
+    """Exchange phụ + các binding exchange-to-exchange (source, routing_key) trỏ vào nó."""
+
+    def __init__(self, name: str, kind: str, *,
+                 arguments: Optional[Dict[str, Any]] = None,
+                 bindings: Iterable[Tuple[str, str]] = ()) -> None:
+        self.name = name
+        self.kind = kind
+        self.arguments = dict(arguments or {})
+        self.bindings: List[Tuple[str, str]] = list(dict.fromkeys(bindings))
+
+    def _identity(self) -> Tuple[Any, ...]:
+        return (self.kind, sorted(self.arguments.items()))
+
+    def declare(self, ch: Any) -> None:
+        ch.exchange_declare(exchange=self.name, exchange_type=self.kind, durable=True,
+                            arguments=self.arguments or None)
+        for source, rk in self.bindings:
+            ch.exchange_bind(destination=self.name, source=source, routing_key=rk)
+
+
+class Topology:
+    def __init__(self, exchanges: Iterable[Tuple[str, str]] = ((EXCHANGE, "topic"), (DLX, "topic"))) -> None:
+        self._exchanges = list(exchanges)
+        self._extra: Dict[str, ExchangeSpec] = {}
+        self._queues: Dict[str, QueueSpec] = {}
+        self._lock = threading.Lock()
+        self._version = 1
+        # connection -> (version, đã khai báo cả queue chưa)
+        self._applied: "weakref.WeakKeyDictionary[Any, Tuple[int, bool]]" = weakref.WeakKeyDictionary()
+
+    def add(self, spec: QueueSpec) -> QueueSpec:
+        """
+        Đăng ký queue; đăng ký lại cùng tên thì gộp routing key (các thuộc tính khác phải giống,
+        nếu không sẽ raise ValueError thay vì để broker trả 406 lúc chạy).
+        """
+        with self._lock:
+            cur = self._queues.get(spec.name)
+            if cur is None:
+                self._queues[spec.name] = spec
+                self._version += 1
+                return spec
+            if cur._identity() != spec._identity():
+                raise ValueError(f"queue {spec.name!r} already registered with different options")
+            new_keys = [rk for rk in spec.routing_keys if rk not in cur.routing_keys]
+            if new_keys:
+                cur.routing_keys.extend(new_keys)
+                self._version += 1
+            return cur
+
+    def add_exchange(self, spec: ExchangeSpec) -> ExchangeSpec:
+        """Như add() cho exchange phụ: đăng ký lại thì gộp binding, khác kind/arguments thì ValueError."""
+        with self._lock:
+            cur = self._extra.get(spec.name)
+            if cur is None:
+                self._extra[spec.name] = spec
+                self._version += 1
+                return spec
+            if cur._identity() != spec._identity():
+                raise ValueError(f"exchange {spec.name!r} already registered with different options")
+            new = [b for b in spec.bindings if b not in cur.bindings]
+            if new:
+                cur.bindings.extend(new)
+                self._version += 1
+            return cur
+
+    def bind(self, queue: str, routing_key: str) -> None:
+        with self._lock:
+            spec = self._queues[queue]
+            if routing_key not in spec.routing_keys:
+                spec.routing_keys.append(routing_key)
+                self._version += 1
+
+    def get(self, queue: str) -> Optional[QueueSpec]:
+        return self._queues.get(queue)
+
+    def specs(self) -> List[QueueSpec]:
+        with self._lock:
+            return list(self._queues.values())
+
+    def ensure(self, ch: Any, *, queues: bool = True) -> None:
+        """
+        Khai báo exchange (+ queue nếu `queues`) trên connection của `ch` nếu registry đổi
+        kể từ lần trước. Chạy trên một channel riêng: spec bị broker từ chối chỉ làm đóng
+        channel đó, được log rồi bỏ qua.
+        """
+        conn = ch.connection
+        version = self._version
+        applied = self._applied.get(conn)
+        if applied is not None and applied[0] == version and (applied[1] or not queues):
+            return
+        steps: List[Tuple[str, Callable[[Any], None]]] = [
+            (f"exchange {name}", lambda c, name=name, kind=kind: c.exchange_declare(
+                exchange=name, exchange_type=kind, durable=True))
+            for name, kind in self._exchanges
+        ]
+        with self._lock:
+            extra = list(self._extra.values())
+        steps += [(f"exchange {ex.name}", ex.declare) for ex in extra]
+        if queues:
+            steps += [(f"queue {spec.name}", spec.declare) for spec in self.specs()]
+
+        decl = conn.channel()
+        try:
+            for what, step in steps:
+                if not decl.is_open:
+                    decl = conn.channel()
+                try:
+                    step(decl)
+                except pika.exceptions.AMQPChannelError as ex:
+                    metrics.inc("rmq_topology_errors_total")
+                    logger.error("rmq topology: cannot declare %s, skipped: %s", what, ex)
+        finally:
+            if decl.is_open:
+                decl.close()
+        self._applied[conn] = (version, queues)
+
+
+registry = Topology()
+
+
+def declare(spec: QueueSpec) -> QueueSpec:
+    """Đăng ký `spec` vào registry của process và khai báo ngay trên connection của thread hiện tại."""
+    from .bus import _Rmq
+    spec = registry.add(spec)
+    registry.ensure(_Rmq.admin_channel())
+    return spec
+
+
+class _Scratch:
+    """Channel tạm cho các lệnh broker có thể từ chối (404/406): mở lại channel sau mỗi lần bị đóng."""
+
+    def __init__(self, conn: Any) -> None:
+        self.conn = conn
+        self.ch: Any = None
+        self.error: Optional[BaseException] = None
+
+    def __call__(self, fn: Callable[[Any], Any]) -> Any:
+        """Kết quả của fn(channel); lỗi channel -> None và lưu vào self.error."""
+        if self.ch is None or not self.ch.is_open:
+            self.ch = self.conn.channel()
+        self.error = None
+        try:
+            return fn(self.ch)
+        except pika.exceptions.AMQPChannelError as ex:
+            self.error = ex
+            return None
+
+    def close(self) -> None:
+        if self.ch is not None and self.ch.is_open:
+            self.ch.close()
+
+
+def retire_queue(queue: str, routing_keys: Iterable[str] = (), *,
+                 exchange: str = EXCHANGE,
+                 retry: Optional[RetryPolicy] = None) -> Optional[bool]:
+    """
+    Gỡ một queue không còn nằm trong layout: unbind `routing_keys` khỏi `exchange` để queue
+    không nhận thêm bản copy của event, rồi xoá queue cùng các retry tier nếu tất cả đã rỗng
+    và queue không còn consumer. DLQ được giữ lại để tra cứu.
+
+    Trả về None nếu queue không tồn tại, True nếu đã xoá, False nếu còn message / consumer
+    (lần gọi sau, khi queue đã được drain, sẽ xoá).
+    """
+    from .bus import _Rmq
+    run = _Scratch(_Rmq.connection())
+    try:
+        ok = run(lambda c: c.queue_declare(queue=queue, passive=True))
+        if ok is None:
+            return None
+        for rk in routing_keys:
+            run(lambda c, rk=rk: c.queue_unbind(queue=queue, exchange=exchange, routing_key=rk))
+        tiers = [retry_queue_name(queue, ttl) for ttl in sorted(set(retry.tiers_ms))] if retry else []
+        depth = ok.method.message_count
+        for name in tiers:
+            tier = run(lambda c, name=name: c.queue_declare(queue=name, passive=True))
+            depth += tier.method.message_count if tier is not None else 0
+        if depth or ok.method.consumer_count:
+            logger.warning("rmq topology: %s is no longer bound (%d message(s), %d consumer(s) left); "
+                           "move or purge them; it is deleted on a later start once empty",
+                           queue, depth, ok.method.consumer_count)
+            return False
+        for name in tiers + [queue]:
+            run(lambda c, name=name: c.queue_delete(queue=name, if_unused=True, if_empty=True))
+            if run.error is not None:
+                logger.warning("rmq topology: cannot delete %s: %s", name, run.error)
+                return False
+        logger.info("rmq topology: deleted retired queue %s", queue)
+        return True
+    finally:
+        run.close()
+
+
+def retire_exchange(name: str) -> None:
+    """Xoá một exchange phụ không còn dùng (vd. hash exchange của sharded queue); mọi binding của nó mất theo."""
+    from .bus import _Rmq
+    run = _Scratch(_Rmq.connection())
+    try:
+        run(lambda c: c.exchange_delete(exchange=name))
+        if run.error is not None:
+            logger.warning("rmq topology: cannot delete exchange %s: %s", name, run.error)
+    finally:
+        run.close()
@@ -0,0 +1,78 @@
+# libs/rmq/transport.py
+from __future__ import annotations
+
+"""Pluggable transport behind bus.publish / declare_queue / start_consume.
+
+A transport only has to hand out connections that behave like pika's
+``BlockingConnection`` (``channel()``, ``add_callback_threadsafe``, ``call_later``,
+``remove_timeout``, ``close()``) with channels that implement the subset of
+``BlockingChannel`` the bus uses. ``RABBIT_TRANSPORT=memory`` swaps RabbitMQ for
+the in-process broker in memory.py, e.g. to run the payment saga end to end in a
+single process.
+"""
+
+import os
+import threading
+from typing import Any, Optional
+
+import pika
+
+RABBIT_TRANSPORT = os.getenv("RABBIT_TRANSPORT", "pika")  # pika | memory
+
+
+class Transport:
+    name: str = ""
+    # False: publishes are settled synchronously, confirm=True just returns a done Future
+    supports_confirms: bool = False
+
+    def connect(self) -> Any:
+        raise NotImplementedError
+
+
+class PikaTransport(Transport):
+    """RabbitMQ over pika's BlockingConnection (the default)."""
+    name = "pika"
+    supports_confirms = True
+
+    def __init__(self, url: str, *, heartbeat: int = 0, blocked_connection_timeout: float = 60) -> None:
+        self.url = url
+        self.heartbeat = heartbeat
+        self.blocked_connection_timeout = blocked_connection_timeout
+
+    def connect(self) -> pika.BlockingConnection:
+        params = pika.URLParameters(self.url)
+        params.heartbeat = self.heartbeat
+        params.blocked_connection_timeout = self.blocked_connection_timeout
+        return pika.BlockingConnection(params)
+
+
+_transport: Optional[Transport] = None
+_lock = threading.Lock()
+
+
+def _default() -> Transport:
+    from .bus import RABBIT_URL, HEARTBEAT
+    if RABBIT_TRANSPORT == "memory":
+        from .memory import MemoryTransport
+        return MemoryTransport()
+    if RABBIT_TRANSPORT != "pika":
+        raise ValueError(f"unknown RABBIT_TRANSPORT={RABBIT_TRANSPORT!r} (expected 'pika' or 'memory')")
+    return PikaTransport(RABBIT_URL, heartbeat=HEARTBEAT)
+
+
+def get_transport() -> Transport:
+    global _transport
+    with _lock:
+        if _transport is None:
+            _transport = _default()
+        return _transport
+
+
+def set_transport(transport: Optional[Transport]) -> None:
+    """
+    Đổi transport cho cả process (None = quay về mặc định theo RABBIT_TRANSPORT).
+    Gọi trước khi mở connection đầu tiên; connection đã mở vẫn dùng transport cũ.
+    """
+    global _transport
+    with _lock:
+        _transport = transport
@@ -0,0 +1,263 @@
+# libs/rmq/worker.py
+from __future__ import annotations
+
+"""Run a service's consumers in their own processes, away from the web server.
+
+    python -m libs.rmq.worker payment_service --processes 4 [--metrics-port 9100]
+
+In the services, consumers share one CPython process (and GIL) with uvicorn: a busy
+consumer slows the API down and a service never uses more than one core. This runner
+starts ``--processes`` child processes (spawn, so no pika connection or lock is
+inherited). Each child imports the target and calls it; the target starts
+subscriptions through ``consumer.run`` (``<service>.app.messaging.consumer:start_consumers``,
+or any ``module:function``). The child then blocks until SIGTERM/SIGINT and drains
+with ``consumer.stop``. Set ``CONSUMERS_IN_WEB=false`` on the web processes so they only
+serve HTTP.
+
+The parent supervises the children. A child that dies is restarted with exponential
+backoff, reset once it has stayed up for ``STABLE_AFTER_SEC``. On SIGTERM the parent
+forwards it to every child, waits for the drain and kills what is left.
+
+Children of one queue compete for messages, so per-key ordering (``partition_key``)
+holds only inside a process. Use sharded queues (``ShardedQueue``) to keep it:
+``worker_index()`` / ``worker_count()`` tell a target which slot it runs in. With
+``--processes`` > 1, ``consumer.run`` refuses a subscription that has a
+``partition_key`` on a queue that is not single-active-consumer: the child exits with
+``EX_CONFIG`` and the pool stops instead of restarting it. ``--allow-unordered`` turns
+the refusal into a warning. With
+``--metrics-port P`` child ``i`` serves ``/metrics`` and ``/health`` on port ``P + i``.
+
+Children enable the publish spool from the service's ``PUBLISH_SPOOL_DIR`` /
+``PUBLISH_SPOOL_MAX_MB`` settings, like its web process (``RABBIT_SPOOL_DIR`` for a
+target without them). Every process claims its own subdirectory of that spool, and
+a restarted process replays whichever one is free, so spooled events are not
+stranded in a directory nobody reads.
+"""
+
+import argparse
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .bus import DRAIN_TIMEOUT, RECONNECT_MAX_DELAY
+
+logger = logging.getLogger("libs.rmq.worker")  # __name__ là __main__ khi chạy bằng -m
+
+WORKER_INDEX_ENV = "RMQ_WORKER_INDEX"
+WORKER_COUNT_ENV = "RMQ_WORKER_PROCESSES"
+ALLOW_UNORDERED_ENV = "RMQ_WORKER_ALLOW_UNORDERED"
+EX_CONFIG = 78              # sysexits.h: cấu hình sai, restart cũng vô ích
+STABLE_AFTER_SEC = 30.0     # child sống lâu hơn mức này thì reset backoff restart
+KILL_GRACE_SEC = 5.0        # sau drain timeout: chờ thêm rồi mới SIGKILL
+
+
+def worker_index() -> int:
+    """Chỉ số (0-based) của process worker hiện tại; 0 khi chạy trong web process."""
+    return int(os.getenv(WORKER_INDEX_ENV, "0"))
+
+
+def worker_count() -> int:
+    """Số process worker của service; 1 khi chạy trong web process."""
+    return max(1, int(os.getenv(WORKER_COUNT_ENV, "1")))
+
+
+def resolve(target: str) -> Callable[[], None]:
+    """`payment_service` -> payment_service.app.messaging.consumer:start_consumers; hoặc `module:function`."""
+    module, _, attr = target.partition(":")
+    if not attr:
+        module, attr = f"{target}.app.messaging.consumer", "start_consumers"
+    fn = getattr(importlib.import_module(module), attr)
+    if not callable(fn):
+        raise TypeError(f"{target!r} is not callable")
+    return fn
+
+
+def _spool_config(target: str) -> Tuple[str, Dict[str, Any]]:
+    """Thư mục + kwargs spool theo settings của service (giống web process); không có thì RABBIT_SPOOL_DIR."""
+    from .spool import SPOOL_DIR
+    service = target.partition(":")[0].split(".")[0]
+    try:
+        settings = importlib.import_module(f"{service}.app.settings").settings
+    except (ImportError, AttributeError):
+        return SPOOL_DIR, {}
+    directory = getattr(settings, "PUBLISH_SPOOL_DIR", None)
+    if directory is None:
+        return SPOOL_DIR, {}
+    max_mb = getattr(settings, "PUBLISH_SPOOL_MAX_MB", None)
+    return directory, ({"max_bytes": int(max_mb) * 1024 * 1024} if max_mb else {})
+
+
+def _serve_metrics(port: int) -> ThreadingHTTPServer:
+    from libs.metrics import prometheus
+    from . import consumer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path == "/metrics":
+                code, ctype, body = 200, prometheus.CONTENT_TYPE, prometheus.render()
+            elif self.path == "/health":
+                ok = consumer.healthy()
+                code, ctype, body = (200 if ok else 503), "text/plain", "ok\n" if ok else "degraded\n"
+            else:
+                code, ctype, body = 404, "text/plain", "not found\n"
+            data = body.encode()
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt: str, *args) -> None:
+            pass  # scrape mỗi vài giây, không cần access log
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    threading.Thread(target=server.serve_forever, name="rmq-worker-metrics", daemon=True).start()
+    return server
+
+
+def _child(target: str, index: int, count: int, drain_timeout: float, metrics_port: Optional[int],
+           allow_unordered: bool = False) -> None:
+    """Entry point của process con: chạy target, chờ tín hiệu dừng rồi drain consumer."""
+    os.environ[WORKER_INDEX_ENV] = str(index)
+    os.environ[WORKER_COUNT_ENV] = str(count)
+    if allow_unordered:
+        os.environ[ALLOW_UNORDERED_ENV] = "1"
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO,
+                            format=f"%(asctime)s worker-{index} %(levelname)s %(name)s: %(message)s")
+    stopping = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.set())
+
+    from . import consumer, spool
+    directory, spool_kwargs = _spool_config(target)
+    publish_spool = spool.enable(directory, **spool_kwargs)  # mỗi process tự nhận một thư mục con riêng
+    server = _serve_metrics(metrics_port + index) if metrics_port else None
+    try:
+        resolve(target)()
+    except consumer.PartitionOrderError as ex:
+        logger.error("rmq worker %d refuses to start: %s", index, ex)
+        raise SystemExit(EX_CONFIG)
+    logger.info("rmq worker %d/%d (pid %d) consuming for %s", index, count, os.getpid(), target)
+    while not stopping.wait(1.0):
+        pass
+    drained = consumer.stop(timeout=drain_timeout)
+    spool.disable(publish_spool)
+    if server is not None:
+        server.shutdown()
+    logger.info("rmq worker %d stopped (drained=%s)", index, drained)
+
+
+class WorkerPool:
+    """N process con chạy cùng target; restart process chết, dừng có drain."""
+
+    def __init__(self, target: str, processes: int = 1, *,
+                 drain_timeout: float = DRAIN_TIMEOUT,
+                 metrics_port: Optional[int] = None,
+                 allow_unordered: bool = False) -> None:
+        if processes < 1:
+            raise ValueError("processes must be >= 1")
+        self.target = target
+        self.processes = int(processes)
+        self.drain_timeout = drain_timeout
+        self.metrics_port = metrics_port
+        self.allow_unordered = allow_unordered
+        self.exitcode = 0  # EX_CONFIG khi một child từ chối chạy (pool đã dừng)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: List[Optional[multiprocessing.process.BaseProcess]] = [None] * self.processes
+        self._started = [0.0] * self.processes
+        self._delay = [0.5] * self.processes
+        self._restart_at = [0.0] * self.processes
+        self._stopping = threading.Event()
+
+    def _spawn(self, index: int) -> None:
+        p = self._ctx.Process(target=_child, name=f"rmq-worker-{index}",
+                              args=(self.target, index, self.processes, self.drain_timeout, self.metrics_port,
+                                    self.allow_unordered))
+        p.start()
+        self._procs[index] = p
+        self._started[index] = time.monotonic()
+
+    def start(self) -> None:
+        resolve(self.target)  # import lỗi thì fail ngay ở parent thay vì restart vô hạn
+        for i in range(self.processes):
+            self._spawn(i)
+
+    def _check(self) -> None:
+        now = time.monotonic()
+        for i, p in enumerate(self._procs):
+            if p is not None and p.is_alive():
+                continue
+            if p is not None and p.exitcode == EX_CONFIG:
+                logger.error("rmq worker %d exited with a configuration error; stopping the pool", i)
+                self._procs[i] = None
+                self.exitcode = EX_CONFIG
+                self.stop()
+                return
+            if p is not None:
+                if now - self._started[i] > STABLE_AFTER_SEC:
+                    self._delay[i] = 0.5
+                logger.warning("rmq worker %d (pid %s) exited with %s; restarting in %.1fs",
+                               i, p.pid, p.exitcode, self._delay[i])
+                self._restart_at[i] = now + self._delay[i]
+                self._delay[i] = min(self._delay[i] * 2, RECONNECT_MAX_DELAY)
+                self._procs[i] = None
+            elif now >= self._restart_at[i]:
+                self._spawn(i)
+
+    def run(self) -> None:
+        """Start rồi giám sát tới khi stop() (hoặc SIGTERM/SIGINT nếu chạy qua main())."""
+        self.start()
+        while not self._stopping.wait(0.5):
+            self._check()
+        self._shutdown()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _shutdown(self) -> None:
+        procs = [p for p in self._procs if p is not None and p.is_alive()]
+        for p in procs:
+            p.terminate()  # SIGTERM -> child drain
+        deadline = time.monotonic() + self.drain_timeout + KILL_GRACE_SEC
+        for p in procs:
+            p.join(max(0.0, deadline - time.monotonic()))
+        for p in procs:
+            if p.is_alive():
+                logger.warning("rmq worker pid %s did not drain in time; killing", p.pid)
+                p.kill()
+                p.join()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("target", help="service package (payment_service) or module:function starting the consumers")
+    ap.add_argument("--processes", "-n", type=int, default=1, help="consumer processes (default 1)")
+    ap.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT,
+                    help="seconds in-flight handlers get on shutdown")
+    ap.add_argument("--metrics-port", type=int, default=None,
+                    help="serve /metrics and /health of worker i on this port + i")
+    ap.add_argument("--allow-unordered", action="store_true",
+                    help="run --processes > 1 even when a partition_key queue is not sharded (warn only)")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    pool = WorkerPool(args.target, args.processes, drain_timeout=args.drain_timeout,
+                      metrics_port=args.metrics_port, allow_unordered=args.allow_unordered)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: pool.stop())
+    logger.info("rmq worker pool: %d process(es) for %s", args.processes, args.target)
+    pool.run()
+    if pool.exitcode:
+        sys.exit(pool.exitcode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# libs/rmq/workers.py
+import asyncio, itertools, logging, queue, threading, zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedWorkerPool:
+    """
+    Thread pool giữ thứ tự theo key: mọi task cùng key (vd. payment_id) luôn vào cùng
+    một worker nên chạy tuần tự đúng thứ tự nhận; các key khác nhau chạy song song.
+    Task không có key được chia round-robin.
+    """
+
+    def __init__(self, size: int, *, name: str = "rmq-worker") -> None:
+        self._queues: List["queue.SimpleQueue[Optional[tuple]]"] = [queue.SimpleQueue() for _ in range(max(1, size))]
+        self._rr = itertools.count()
+        self._threads = [
+            threading.Thread(target=self._work, args=(q,), name=f"{name}-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, key: Optional[str], fn: Callable[..., Any], *args: Any) -> None:
+        if key:
+            idx = zlib.crc32(str(key).encode("utf-8")) % len(self._queues)
+        else:
+            idx = next(self._rr) % len(self._queues)
+        self._queues[idx].put((fn, args))
+
+    @staticmethod
+    def _work(q: "queue.SimpleQueue[Optional[tuple]]") -> None:
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            fn, args = item
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception("rmq worker task failed")
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        for q in self._queues:
+            q.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+
+class KeyedAsyncRunner:
+    """
+    Event loop trên thread riêng chạy coroutine handler: tối đa `concurrency` coroutine cùng lúc
+    (semaphore), coroutine cùng key chạy tuần tự theo thứ tự submit, các key khác nhau chạy xen kẽ.
+    submit() gọi được từ thread khác (I/O thread của pika).
+    """
+
+    def __init__(self, concurrency: int, *, name: str = "rmq-aio") -> None:
+        self.concurrency = max(1, int(concurrency))
+        self.loop = asyncio.new_event_loop()
+        self._sem = asyncio.BoundedSemaphore(self.concurrency)
+        self._tails: Dict[str, "asyncio.Task[Any]"] = {}
+        self._tasks: Set["asyncio.Task[Any]"] = set()
+        self._thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def submit(self, key: Optional[str], fn: Callable[..., Awaitable[Any]], *args: Any) -> None:
+        self.loop.call_soon_threadsafe(self._start, key, fn, args)
+
+    def _start(self, key: Optional[str], fn: Callable[..., Awaitable[Any]], args: tuple) -> None:
+        prev = self._tails.get(key) if key else None
+        task = self.loop.create_task(self._run(prev, fn, args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if key:
+            self._tails[key] = task
+            task.add_done_callback(lambda t, k=key: self._tails.pop(k) if self._tails.get(k) is t else None)
+
+    async def _run(self, prev: Optional["asyncio.Task[Any]"], fn: Callable[..., Awaitable[Any]], args: tuple) -> None:
+        if prev is not None:
+            await asyncio.wait([prev])  # chờ message trước cùng key, kể cả khi nó fail
+        async with self._sem:
+            try:
+                await fn(*args)
+            except Exception:
+                logger.exception("rmq async task failed")
+
+    async def _close(self) -> None:
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+        self.loop.stop()
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        """Chạy nốt các coroutine đã submit rồi dừng loop."""
+        try:
+            self.loop.call_soon_threadsafe(lambda: self.loop.create_task(self._close()))
+        except RuntimeError:
+            return  # loop đã đóng
+        if wait:
+            self._thread.join()
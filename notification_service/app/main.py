@@ -3,7 +3,10 @@ import sys
 import threading
 from fastapi import FastAPI
 
+from libs.http import client_registry
+from libs.rmq import consumer as rmq_consumer
 from notification_service.app.messaging.consumer import start_consumers
+from notification_service.app.settings import settings
 
 logger = logging.getLogger("notification_service")
 logger.setLevel(logging.INFO)
@@ -26,6 +29,9 @@ def create_app() -> FastAPI:
     def _startup() -> None:
         # Start RMQ consumers in a daemon thread. If this fails we still want the
         # exception to bubble so deployment can fail fast.
+        if not settings.CONSUMERS_IN_WEB:
+            logger.info("Notification consumers run in libs.rmq.worker processes.")
+            return
         try:
             threading.Thread(target=start_consumers, name="notification-consumer", daemon=True).start()
             logger.info("Notification consumers started.")
@@ -33,6 +39,9 @@ def create_app() -> FastAPI:
             logger.exception("Failed to start notification consumers", exc_info=exc)
             raise
 
+    # The batch being collected goes back to the queue on drain; pooled HTTP clients close after it
+    rmq_consumer.mount_ops(app, settings, after_drain=[client_registry.close])
+
     return app
 
 
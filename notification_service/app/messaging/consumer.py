@@ -4,18 +4,34 @@ import logging
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 import os
-from libs.rmq import bus as rmq_bus
+from libs.rmq import consumer as rmq_consumer
+from libs.rmq.bus import BatchMessage, RetryPolicy
 from notification_service.app.settings import settings
-from libs.http.client import HttpClient
+from libs.http.cache import ResponseCache
+from libs.http.client import pooled_client
 
 logger = logging.getLogger(__name__)
 
+# Một user nhận OTP rồi biên lai trong vài phút: email tra một lần, các lần sau lấy từ cache
+_account_cache: Optional[ResponseCache] = None
+if settings.ACCOUNT_LOOKUP_CACHE_SEC > 0:
+    _account_cache = ResponseCache(max_entries=settings.ACCOUNT_LOOKUP_CACHE_SIZE)
+    _account_cache.route("/accounts/me", ttl=settings.ACCOUNT_LOOKUP_CACHE_SEC)
 
-def _send_email(to: str, subject: str, body: str) -> None:
-    """Send HTML email via SMTP"""
+
+def _smtp_session() -> smtplib.SMTP:
+    server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT)
+    server.starttls()
+    if settings.SMTP_USER and settings.SMTP_PASSWORD:
+        server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+    return server
+
+
+def _send_email(to: str, subject: str, body: str, server: Optional[smtplib.SMTP] = None) -> None:
+    """Send HTML email via SMTP (reuses `server` when given, e.g. for a whole batch)"""
     if settings.DRY_RUN:
         logger.info("[DRY RUN] email to=%s subject=%s", to, subject)
         return
@@ -27,11 +43,11 @@ def _send_email(to: str, subject: str, body: str) -> None:
         msg["To"] = to
         msg.attach(MIMEText(body, "html", "utf-8"))
         
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-            server.starttls()
-            if settings.SMTP_USER and settings.SMTP_PASSWORD:
-                server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        if server is not None:
             server.sendmail(settings.EMAIL_FROM, to, msg.as_string())
+        else:
+            with _smtp_session() as own:
+                own.sendmail(settings.EMAIL_FROM, to, msg.as_string())
         
         logger.info("Email sent to %s subject=%s", to, subject)
     except Exception as e:
@@ -39,7 +55,8 @@ def _send_email(to: str, subject: str, body: str) -> None:
         raise
 
 
-def _on_message(payload: Dict[str, Any], headers: Dict[str, Any], message_id: str) -> None:
+def _on_message(payload: Dict[str, Any], headers: Dict[str, Any], message_id: str,
+                server: Optional[smtplib.SMTP] = None) -> None:
     """Handle notification events"""
     event_type = (headers or {}).get("event-type", "")
     user_id = payload.get("user_id")
@@ -68,7 +85,7 @@ def _on_message(payload: Dict[str, Any], headers: Dict[str, Any], message_id: st
     if not user_email:
         try:
             base_url = os.getenv("ACCOUNT_SERVICE_URL", "http://account_service:8080")
-            client = HttpClient(base_url=base_url)
+            client = pooled_client(base_url, cache=_account_cache)
             corr_id = (headers or {}).get("correlation-id")
             resp = client.get(
                 "/accounts/me",
@@ -99,7 +116,8 @@ def _on_message(payload: Dict[str, Any], headers: Dict[str, Any], message_id: st
             <p>Your OTP code is: <strong style="font-size: 24px;">{otp}</strong></p>
             <p>Payment ID: {payment_id}</p>
             <p>This code expires in 5 minutes.</p>
-            """
+            """,
+            server=server,
         )
         logger.info("notification_service delivered otp email payment_id=%s to=%s", payment_id, user_email)
     
@@ -115,28 +133,90 @@ def _on_message(payload: Dict[str, Any], headers: Dict[str, Any], message_id: st
             <p>Payment ID: {payment_id}</p>
             <p>Amount: ${amount:,.2f}</p>
             <p>Thank you for your payment!</p>
-            """
+            """,
+            server=server,
         )
         logger.info("notification_service delivered receipt email payment_id=%s to=%s", payment_id, user_email)
     else:
         logger.debug("notification_service ignoring event_type=%s", event_type)
 
 
+def _session_broken(ex: Exception) -> bool:
+    # SMTPException kế thừa OSError: lỗi của riêng một email (recipient bị từ chối...) không làm hỏng session
+    if isinstance(ex, smtplib.SMTPException):
+        return isinstance(ex, smtplib.SMTPServerDisconnected) or (
+            isinstance(ex, smtplib.SMTPResponseException) and ex.smtp_code == 421)
+    return isinstance(ex, OSError)
+
+
+def _close(server: Optional[smtplib.SMTP]) -> None:
+    if server is None:
+        return
+    try:
+        server.quit()
+    except Exception:
+        server.close()
+
+
+def _open_session() -> Optional[smtplib.SMTP]:
+    if settings.DRY_RUN:
+        return None
+    try:
+        return _smtp_session()
+    except Exception as e:
+        # Fall back to one connection per email
+        logger.warning("notification_service SMTP session failed, sending individually: %s", e)
+        return None
+
+
+def _on_batch(messages: List[BatchMessage]) -> List[BatchMessage]:
+    """
+    Handle a batch of notification events over one SMTP session; return the failed ones.
+    If the session breaks (disconnect, 421, socket error) it is reopened once and the message
+    is sent again on the new one; a second break sends the rest of the batch individually.
+    """
+    server = _open_session()
+    reopened = False
+    failed: List[BatchMessage] = []
+    try:
+        for m in messages:
+            try:
+                _on_message(m.payload, m.headers, m.message_id, server=server)
+                continue
+            except Exception as e:
+                if server is None or not _session_broken(e):
+                    failed.append(m)
+                    continue
+                _close(server)
+                server = None
+                if reopened:
+                    logger.warning("notification_service SMTP session broke again, sending individually: %s", e)
+                else:
+                    logger.warning("notification_service SMTP session broke, reopening: %s", e)
+                    reopened = True
+                    server = _open_session()
+            try:
+                _on_message(m.payload, m.headers, m.message_id, server=server)
+            except Exception:
+                failed.append(m)
+    finally:
+        _close(server)
+    return failed
+
+
 def start_consumers() -> None:
-    """Start notification consumer"""
-    rmq_bus.declare_queue(
-        settings.NOTIFICATION_QUEUE,
-        settings.RK_OTP_GENERATED,
-        dead_letter=True,
-        prefetch=settings.CONSUMER_PREFETCH
-    )
-    
-    ch = rmq_bus._Rmq.channel()
-    ch.queue_bind(
-        queue=settings.NOTIFICATION_QUEUE,
-        exchange=settings.EVENT_EXCHANGE,
-        routing_key=settings.RK_PAYMENT_COMPLETED
-    )
-    
+    """Start notification consumer (supervised: reconnects and resubscribes on broker loss)"""
     logger.info("Starting notification consumer on %s", settings.NOTIFICATION_QUEUE)
-    rmq_bus.start_consume(settings.NOTIFICATION_QUEUE, _on_message)
+    subs = [
+        rmq_consumer.BatchSubscription(
+            settings.NOTIFICATION_QUEUE,
+            settings.RK_OTP_GENERATED,
+            _on_batch,
+            routing_keys=[settings.RK_PAYMENT_COMPLETED],
+            max_batch=settings.NOTIFICATION_BATCH_SIZE,
+            max_wait_ms=settings.NOTIFICATION_BATCH_WAIT_MS,
+            prefetch=settings.CONSUMER_PREFETCH,
+            retry=RetryPolicy.parse(settings.CONSUMER_RETRY_TIERS_MS),
+        )
+    ]
+    rmq_consumer.run(subs, join=False)
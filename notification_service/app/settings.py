@@ -14,8 +14,17 @@ class Settings(BaseSettings):
     # Queue/routing keys
     NOTIFICATION_QUEUE: str = Field(default="notification.events.q")
     CONSUMER_PREFETCH: int = Field(default=32)
+    CONSUMER_RETRY_TIERS_MS: str = Field(default="1000,10000,60000", description="Delayed-retry tiers in ms before the DLQ (empty = no retry)")
+    CONSUMERS_IN_WEB: bool = Field(default=True, description="Run RMQ consumers inside the web process (false: run them with `python -m libs.rmq.worker notification_service`)")
+    CONSUMER_DRAIN_TIMEOUT_SEC: float = Field(default=8.0, description="On shutdown, how long in-flight handlers may run before the consumer connection is closed")
+    NOTIFICATION_BATCH_SIZE: int = Field(default=20)
+    NOTIFICATION_BATCH_WAIT_MS: int = Field(default=200)
     RK_OTP_GENERATED: str = Field(default="otp.v1.generated")
     RK_PAYMENT_COMPLETED: str = Field(default="payment.v1.completed")
+
+    # Email lookup (account service /accounts/me)
+    ACCOUNT_LOOKUP_CACHE_SEC: float = Field(default=60.0, description="TTL of cached account lookups unless Cache-Control says otherwise (0 = no cache)")
+    ACCOUNT_LOOKUP_CACHE_SIZE: int = Field(default=4096)
     
     # Email (SMTP)
     SMTP_HOST: str = Field(default="smtp.gmail.com")
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException, status, Header
 
-from otp_service.app.cache import get_otp, del_otp
+from otp_service.app.cache import get_otp_async, del_otp_async
 from otp_service.app.settings import settings
-from otp_service.app.messaging.publisher import publish_otp_succeed
+from otp_service.app.messaging.publisher import publish_otp_succeed_async
 from otp_service.app.schemas import VerifyOTPRequest
 
 
@@ -10,12 +10,12 @@ router = APIRouter()
 
 
 @router.post("/otp/verify")
-def verify_otp(body: VerifyOTPRequest, x_user_id: str | None = Header(default=None, alias="X-User-Id")) -> dict:
+async def verify_otp(body: VerifyOTPRequest, x_user_id: str | None = Header(default=None, alias="X-User-Id")) -> dict:
     # Gateway should have verified JWT and injected X-User-Id
     if not x_user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing user context")
 
-    rec = get_otp(body.payment_id)
+    rec = await get_otp_async(body.payment_id)
     if not rec:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="OTP not found or expired")
 
@@ -24,8 +24,8 @@ def verify_otp(body: VerifyOTPRequest, x_user_id: str | None = Header(default=No
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid OTP")
 
     # Success: clear cache and notify
-    del_otp(body.payment_id)
-    publish_otp_succeed(
+    await del_otp_async(body.payment_id)
+    await publish_otp_succeed_async(
         payment_id=body.payment_id,
         user_id=rec.get("user_id"),
         tuition_id=rec.get("tuition_id"),
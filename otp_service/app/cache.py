@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import time
+import weakref
 from functools import lru_cache
 from typing import Any, Dict, Optional
 
 import redis
+import redis.asyncio as aioredis
 
 from otp_service.app.settings import settings
 
@@ -22,15 +25,45 @@ def _redis() -> redis.Redis:
     )
 
 
+_aclients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = weakref.WeakKeyDictionary()
+
+
+def _aredis() -> aioredis.Redis:
+    # redis.asyncio connections belong to the loop that opened them: the API (uvicorn loop) and the
+    # async consumer (its own loop, see libs.rmq.workers.KeyedAsyncRunner) each get a client
+    loop = asyncio.get_running_loop()
+    client = _aclients.get(loop)
+    if client is None:
+        # Blocking pool: concurrent handlers wait for a free connection instead of failing
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            max_connections=settings.REDIS_POOL_SIZE,
+            timeout=5,
+            socket_connect_timeout=5,
+            socket_timeout=5,
+            retry_on_timeout=True,
+        )
+        client = _aclients[loop] = aioredis.Redis(connection_pool=pool)
+    return client
+
+
 def _key(payment_id: str) -> str:
     return f"otp:{payment_id}"
 
 
-def set_otp(payment_id: str, data: Dict[str, Any], ttl_sec: int) -> None:
-    expires_at = int(time.time()) + int(ttl_sec)
+def _otp_record(data: Dict[str, Any], ttl_sec: int) -> Dict[str, Any]:
     record = dict(data)
-    record["expires_at"] = expires_at
-    _redis().setex(_key(payment_id), ttl_sec, json.dumps(record))
+    record["expires_at"] = int(time.time()) + int(ttl_sec)
+    return record
+
+
+def set_otp(payment_id: str, data: Dict[str, Any], ttl_sec: int) -> None:
+    _redis().setex(_key(payment_id), ttl_sec, json.dumps(_otp_record(data, ttl_sec)))
+
+
+async def set_otp_async(payment_id: str, data: Dict[str, Any], ttl_sec: int) -> None:
+    await _aredis().setex(_key(payment_id), ttl_sec, json.dumps(_otp_record(data, ttl_sec)))
 
 
 def get_otp(payment_id: str) -> Optional[Dict[str, Any]]:
@@ -47,4 +80,18 @@ def del_otp(payment_id: str) -> None:
     _redis().delete(_key(payment_id))
 
 
+async def get_otp_async(payment_id: str) -> Optional[Dict[str, Any]]:
+    raw = await _aredis().get(_key(payment_id))
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except Exception:
+        return None
+
+
+async def del_otp_async(payment_id: str) -> None:
+    await _aredis().delete(_key(payment_id))
+
+
 # No attempt counting; UI handles rate limiting/throttling.
@@ -2,8 +2,11 @@ import logging
 import threading
 from fastapi import FastAPI
 
+from libs.rmq import consumer as rmq_consumer
+from libs.rmq import spool as rmq_spool
 from otp_service.app.api import router as api_router
 from otp_service.app.messaging.consumer import start_consumers
+from otp_service.app.settings import settings
 
 
 logging.basicConfig(level=logging.INFO)
@@ -15,12 +18,24 @@ def create_app() -> FastAPI:
 
     @app.on_event("startup")
     def _startup() -> None:
+        # Broker blips: verify_otp's otp_succeed goes to the local spool instead of failing the request
+        app.state.publish_spool = rmq_spool.enable(
+            settings.PUBLISH_SPOOL_DIR, max_bytes=settings.PUBLISH_SPOOL_MAX_MB * 1024 * 1024
+        )
+
         # Start RMQ consumers in a daemon thread so FastAPI can finish booting
-        try:
-            threading.Thread(target=start_consumers, name="rmq-consumer", daemon=True).start()
-        except Exception:
-            # Do not crash API startup if consumers fail; they can be restarted.
-            pass
+        # (unless they run in separate worker processes, see libs.rmq.worker)
+        if settings.CONSUMERS_IN_WEB:
+            try:
+                threading.Thread(target=start_consumers, name="rmq-consumer", daemon=True).start()
+            except Exception:
+                # Do not crash API startup if consumers fail; they can be restarted.
+                pass
+
+    rmq_consumer.mount_ops(app, settings, after_drain=[
+        # Events still spooled stay on disk and are replayed by the next process using the directory
+        lambda: rmq_spool.disable(app.state.publish_spool),
+    ])
 
     return app
 
@@ -3,14 +3,16 @@ import logging
 import random
 from typing import Dict, Any
 
+from libs.rmq.bus import RetryPolicy
+from libs.rmq.flow import AdaptivePrefetch
+from libs.rmq.dedup import DedupStore
 from libs.rmq.consumer import run, Subscription
 from otp_service.app.messaging.publisher import (
-    publish_otp_generated,
+    publish_otp_generated_async,
     publish_otp_succeed,
     publish_otp_expired,
 )
-from libs.rmq import bus as rmq_bus
-from otp_service.app.cache import set_otp
+from otp_service.app.cache import set_otp_async
 from otp_service.app.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -20,7 +22,7 @@ def _gen_otp(length: int) -> str:
     return "".join(str(random.randint(0, 9)) for _ in range(max(4, length)))
 
 
-def on_payment_processing(payload: Dict[str, Any], headers: Dict[str, Any], message_id: str) -> None:
+async def on_payment_processing(payload: Dict[str, Any], headers: Dict[str, Any], message_id: str) -> None:
     payment_id = payload.get("payment_id") 
     user_id = payload.get("user_id")
     tuition_id = payload.get("tuition_id")
@@ -43,14 +45,15 @@ def on_payment_processing(payload: Dict[str, Any], headers: Dict[str, Any], mess
         tuition_id,
     )
 
+    # Async handler: libs.rmq runs it on the consumer's event loop, many payments in flight at once
     otp_code = _gen_otp(settings.OTP_LENGTH)
-    set_otp(
+    await set_otp_async(
         payment_id,
         {"otp": otp_code, "user_id": user_id, "tuition_id": tuition_id, "amount": amount, "email": email},
         ttl_sec=settings.OTP_TTL_SEC,
     )
 
-    publish_otp_generated(
+    await publish_otp_generated_async(
         payment_id=payment_id,
         user_id=user_id,
         tuition_id=tuition_id,
@@ -67,8 +70,29 @@ def on_payment_processing(payload: Dict[str, Any], headers: Dict[str, Any], mess
     )
 
 
+def _dedup_store() -> DedupStore | None:
+    # Redelivered messages that were already handled are acked without re-running the handler
+    if settings.CONSUMER_DEDUP_TTL_SEC <= 0:
+        return None
+    return DedupStore.from_url(settings.REDIS_URL, ttl_sec=settings.CONSUMER_DEDUP_TTL_SEC)
+
+
+def _flow() -> AdaptivePrefetch | None:
+    # Prefetch follows observed handler latency and pauses on DB pool / Redis saturation
+    if settings.CONSUMER_PREFETCH_MAX <= 0:
+        return None
+    return AdaptivePrefetch(settings.CONSUMER_PREFETCH, max_prefetch=settings.CONSUMER_PREFETCH_MAX,
+                            target_latency=settings.CONSUMER_TARGET_LATENCY_MS / 1000.0)
+
+
 def start_consumers() -> None:
-    # Ensure queue exists and bound to payment processing key
-    rmq_bus.declare_queue(settings.OTP_QUEUE, settings.RK_PAYMENT_PROCESSING, dead_letter=True, prefetch=settings.CONSUMER_PREFETCH)
-    subs: list[Subscription] = [Subscription(settings.OTP_QUEUE, settings.RK_PAYMENT_PROCESSING, on_payment_processing)]
+    # Queue is declared (and re-declared after reconnects) by the consumer supervisor
+    subs: list[Subscription] = [
+        Subscription(settings.OTP_QUEUE, settings.RK_PAYMENT_PROCESSING, on_payment_processing,
+                     prefetch=settings.CONSUMER_PREFETCH,
+                     workers=settings.CONSUMER_CONCURRENCY,
+                     retry=RetryPolicy.parse(settings.CONSUMER_RETRY_TIERS_MS),
+                     dedup=_dedup_store(),
+                     flow=_flow())
+    ]
     run(subs, join=False)
@@ -3,6 +3,7 @@ from __future__ import annotations
 import logging
 from typing import Optional
 
+from libs.rmq import aio as rmq_aio
 from libs.rmq.publisher import publish_event
 from otp_service.app.settings import settings
 
@@ -31,6 +32,34 @@ def publish_otp_generated(
             "email": email,
         },
         event_type="otp_generated",
+        partition_key=payment_id,
+        correlation_id=correlation_id,
+    )
+    logger.info("otp_service published otp_generated payment_id=%s user_id=%s", payment_id, user_id)
+
+
+async def publish_otp_generated_async(
+    *,
+    payment_id: str,
+    user_id: str,
+    tuition_id: Optional[str],
+    amount: int,
+    otp: str,
+    email: Optional[str] = None,
+    correlation_id: Optional[str] = None,
+) -> None:
+    await rmq_aio.publish_event(
+        routing_key=settings.RK_OTP_GENERATED,
+        payload={
+            "payment_id": payment_id,
+            "user_id": user_id,
+            "tuition_id": tuition_id,
+            "amount": amount,
+            "otp": otp,
+            "email": email,
+        },
+        event_type="otp_generated",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.info("otp_service published otp_generated payment_id=%s user_id=%s", payment_id, user_id)
@@ -47,6 +76,24 @@ def publish_otp_succeed(*, payment_id: str, user_id: str, tuition_id: Optional[s
             "email": email,
         },
         event_type="otp_succeed",
+        partition_key=payment_id,
+        correlation_id=correlation_id,
+    )
+    logger.info("otp_service published otp_succeed payment_id=%s user_id=%s", payment_id, user_id)
+
+
+async def publish_otp_succeed_async(*, payment_id: str, user_id: str, tuition_id: Optional[str], amount: int, email: Optional[str] = None, correlation_id: Optional[str] = None) -> None:
+    await rmq_aio.publish_event(
+        routing_key=settings.RK_OTP_SUCCEED,
+        payload={
+            "payment_id": payment_id,
+            "user_id": user_id,
+            "tuition_id": tuition_id,
+            "amount": amount,
+            "email": email,
+        },
+        event_type="otp_succeed",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.info("otp_service published otp_succeed payment_id=%s user_id=%s", payment_id, user_id)
@@ -65,6 +112,7 @@ def publish_otp_expired(*, payment_id: str, user_id: str, tuition_id: Optional[s
             "email": email,
         },
         event_type="otp_expired",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.info(
@@ -77,6 +125,8 @@ def publish_otp_expired(*, payment_id: str, user_id: str, tuition_id: Optional[s
 
 __all__ = [
     "publish_otp_generated",
+    "publish_otp_generated_async",
     "publish_otp_succeed",
+    "publish_otp_succeed_async",
     "publish_otp_expired",
 ]
@@ -11,6 +11,15 @@ class Settings(BaseSettings):
     # Queue/routing keys
     OTP_QUEUE: str = Field(default="otp.payment.q")
     CONSUMER_PREFETCH: int = Field(default=32)
+    CONSUMER_PREFETCH_MAX: int = Field(default=256, description="Upper bound of the adaptive prefetch (0 = static CONSUMER_PREFETCH)")
+    CONSUMER_TARGET_LATENCY_MS: int = Field(default=250, description="Adaptive prefetch target: max wait of a prefetched message before its handler runs")
+    CONSUMER_CONCURRENCY: int = Field(default=0, description="Async handlers in flight at once on the consumer event loop (0 = prefetch)")
+    CONSUMER_RETRY_TIERS_MS: str = Field(default="1000,10000,60000", description="Delayed-retry tiers in ms before the DLQ (empty = no retry)")
+    CONSUMERS_IN_WEB: bool = Field(default=True, description="Run RMQ consumers inside the web process (false: run them with `python -m libs.rmq.worker otp_service`)")
+    CONSUMER_DRAIN_TIMEOUT_SEC: float = Field(default=8.0, description="On shutdown, how long in-flight handlers may run before the consumer connection is closed")
+    CONSUMER_DEDUP_TTL_SEC: int = Field(default=86400, description="How long processed message ids are remembered in Redis (0 = dedup off)")
+    PUBLISH_SPOOL_DIR: str = Field(default="", description="Local directory buffering events while RabbitMQ is unreachable, replayed in order once it is back (empty = off)")
+    PUBLISH_SPOOL_MAX_MB: int = Field(default=256, description="Spool size limit; publishes fail again once it is full")
     RK_PAYMENT_PROCESSING: str = Field(default="payment.v1.processing")
     RK_OTP_GENERATED: str = Field(default="otp.v1.generated")
     RK_OTP_SUCCEED: str = Field(default="otp.v1.succeed")
@@ -1,15 +1,19 @@
 from fastapi import APIRouter, HTTPException, status, Header
-import uuid, datetime as dt
+import asyncio, logging, uuid, datetime as dt
+from pika.exceptions import AMQPError
 
+from libs.rmq import PublishNacked, PublishNotSent, PublishUnconfirmed
+from libs.rmq.spool import SpoolFull
 from payment_service.app.settings import settings
 from payment_service.app.schemas import PaymentInitRequest, PaymentInitResponse
-from payment_service.app.cache import set_intent
-from payment_service.app.messaging.publisher import publish_payment_initiated
+from payment_service.app.cache import del_intent_async, set_intent_async
+from payment_service.app.messaging.publisher import publish_payment_initiated_async
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.post("/payments/init", response_model=PaymentInitResponse)
-def init_payment(body: PaymentInitRequest, x_user_id: str | None = Header(None, alias="X-User-Id")) -> PaymentInitResponse:
+async def init_payment(body: PaymentInitRequest, x_user_id: str | None = Header(None, alias="X-User-Id")) -> PaymentInitResponse:
     if not x_user_id or body.amount <= 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid request")
 
@@ -17,7 +21,7 @@ def init_payment(body: PaymentInitRequest, x_user_id: str | None = Header(None,
     expires_at = (dt.datetime.utcnow() + dt.timedelta(minutes=15)).isoformat()
 
     # Save intent in Redis (stateless DB until completed)
-    set_intent(payment_id, {
+    await set_intent_async(payment_id, {
         "user_id": x_user_id,
         "tuition_id": body.tuition_id,
         "amount": body.amount,
@@ -27,13 +31,28 @@ def init_payment(body: PaymentInitRequest, x_user_id: str | None = Header(None,
     }, ttl_sec=15*60)
 
     # Publish PaymentInitiated once; both Account and Tuition receive it
-    publish_payment_initiated(
-        payment_id=payment_id,
-        user_id=x_user_id,
-        tuition_id=body.tuition_id,
-        amount=body.amount,
-        term=body.term_no,
-        student_id=body.student_id,
-    )
+    try:
+        await publish_payment_initiated_async(
+            payment_id=payment_id,
+            user_id=x_user_id,
+            tuition_id=body.tuition_id,
+            amount=body.amount,
+            term=body.term_no,
+            student_id=body.student_id,
+        )
+    except (PublishNotSent, SpoolFull):
+        # The event never reached the broker (still queued at PUBLISH_CONFIRM_TIMEOUT_SEC, or spool full):
+        # fail fast with 503 and drop the intent so a retried request starts clean
+        await del_intent_async(payment_id)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Payment service temporarily unavailable, please retry",
+            headers={"Retry-After": "5"},
+        )
+    except (asyncio.TimeoutError, PublishNacked, PublishUnconfirmed, AMQPError) as e:
+        # Ambiguous: the event was handed to the channel and may still be confirmed, so Account and
+        # Tuition may run the saga. Keep the intent (its TTL / the saga's compensation clean it up)
+        # and answer PROCESSING, so the client waits for the OTP instead of starting a second payment.
+        logger.warning("payment_initiated unconfirmed payment_id=%s: %r", payment_id, e)
 
     return PaymentInitResponse(payment_id=payment_id, status="PROCESSING")
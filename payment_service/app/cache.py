@@ -6,6 +6,7 @@ from functools import lru_cache
 from typing import Any, Dict, Optional
 
 import redis
+import redis.asyncio as aioredis
 
 from payment_service.app.settings import settings
 
@@ -15,7 +16,19 @@ def _redis() -> redis.Redis:
     return redis.from_url(
         settings.REDIS_URL,
         decode_responses=True,
-        max_connections=settings.DB_POOL_SIZE,
+        max_connections=settings.REDIS_POOL_SIZE,
+        socket_connect_timeout=5,
+        socket_timeout=5,
+        retry_on_timeout=True,
+    )
+
+
+@lru_cache()
+def _aredis() -> aioredis.Redis:
+    return aioredis.from_url(
+        settings.REDIS_URL,
+        decode_responses=True,
+        max_connections=settings.REDIS_POOL_SIZE,
         socket_connect_timeout=5,
         socket_timeout=5,
         retry_on_timeout=True,
@@ -26,12 +39,20 @@ def _key(payment_id: str) -> str:
     return f"payment:{payment_id}"
 
 
-def set_intent(payment_id: str, data: Dict[str, Any], ttl_sec: int) -> None:
+def _intent_record(data: Dict[str, Any], ttl_sec: int) -> Dict[str, Any]:
     expires_at = int(time.time()) + int(ttl_sec)
     record = dict(data)
     record.setdefault("status", "PROCESSING")
     record["expires_at"] = expires_at
-    _redis().setex(_key(payment_id), ttl_sec, json.dumps(record))
+    return record
+
+
+def set_intent(payment_id: str, data: Dict[str, Any], ttl_sec: int) -> None:
+    _redis().setex(_key(payment_id), ttl_sec, json.dumps(_intent_record(data, ttl_sec)))
+
+
+async def set_intent_async(payment_id: str, data: Dict[str, Any], ttl_sec: int) -> None:
+    await _aredis().setex(_key(payment_id), ttl_sec, json.dumps(_intent_record(data, ttl_sec)))
 
 
 def get_intent(payment_id: str) -> Optional[Dict[str, Any]]:
@@ -71,3 +92,7 @@ def update_intent(payment_id: str, patch: Dict[str, Any]) -> Optional[Dict[str,
 def del_intent(payment_id: str) -> None:
     _redis().delete(_key(payment_id))
 
+
+async def del_intent_async(payment_id: str) -> None:
+    await _aredis().delete(_key(payment_id))
+
@@ -2,8 +2,13 @@
 import threading
 from fastapi import FastAPI
 
+from libs.rmq import consumer as rmq_consumer
+from libs.rmq import outbox as rmq_outbox
+from libs.rmq import spool as rmq_spool
 from payment_service.app.api import router as api_router
+from payment_service.app.db import engine
 from payment_service.app.messaging.consumer import start_consumers
+from payment_service.app.settings import settings
 
 
 logging.basicConfig(level=logging.INFO)
@@ -15,12 +20,33 @@ def create_app() -> FastAPI:
 
     @app.on_event("startup")
     def _startup() -> None:
+        # Broker blips: init_payment's payment_initiated goes to the local spool instead of failing the request
+        app.state.publish_spool = rmq_spool.enable(
+            settings.PUBLISH_SPOOL_DIR, max_bytes=settings.PUBLISH_SPOOL_MAX_MB * 1024 * 1024
+        )
+
         # Start RMQ consumers on a daemon thread so FastAPI can finish starting
-        try:
-            threading.Thread(target=start_consumers, name="rmq-consumer", daemon=True).start()
-        except Exception:
-            # Do not crash API startup if consumers fail; they can be restarted.
-            pass
+        # (unless they run in separate worker processes, see libs.rmq.worker)
+        if settings.CONSUMERS_IN_WEB:
+            try:
+                threading.Thread(target=start_consumers, name="rmq-consumer", daemon=True).start()
+            except Exception:
+                # Do not crash API startup if consumers fail; they can be restarted.
+                pass
+
+        # Relay events committed to the outbox table (see libs.rmq.outbox)
+        app.state.outbox_relay = rmq_outbox.start_relay(
+            engine,
+            batch_size=settings.OUTBOX_BATCH_SIZE,
+            poll_interval=settings.OUTBOX_POLL_INTERVAL_MS / 1000.0,
+        )
+
+    rmq_consumer.mount_ops(app, settings, after_drain=[
+        # Events enqueued by the drained handlers stay in the outbox table for the next relay
+        lambda: app.state.outbox_relay.stop(),
+        # Events still spooled stay on disk and are replayed by the next process using the directory
+        lambda: rmq_spool.disable(app.state.publish_spool),
+    ])
 
     return app
 
@@ -4,7 +4,15 @@ import datetime as dt
 import logging
 from typing import Any, Dict
 
-from libs.rmq import bus as rmq_bus
+from libs.rmq import consumer as rmq_consumer
+from libs.rmq import outbox
+from libs.rmq.bus import RetryPolicy
+from libs.rmq.flow import AdaptivePrefetch
+from libs.rmq.lag import start_monitor
+from libs.rmq.sharding import ShardedQueue
+from libs.rmq.topology import retire_queue
+from libs.rmq.worker import worker_count, worker_index
+from libs.rmq.dedup import DedupStore
 from sqlalchemy import text
 
 from payment_service.app.cache import get_intent, update_intent, del_intent
@@ -29,8 +37,8 @@ def _try_finalize(payment_id: str, correlation_id: str | None = None) -> None:
         return
     logger.info("payment_service finalizing payment_id=%s (account_done=%s tuition_done=%s)", payment_id, intent.get("account_done"), intent.get("tuition_done"))
 
-    # Insert completed payment into DB and clear intent
-    with session_scope() as db:
+    # Insert completed payment and its payment_completed event in one transaction (outbox)
+    with session_scope() as db, outbox.bind(db):
         db.execute(
             text(
                 """
@@ -49,18 +57,18 @@ def _try_finalize(payment_id: str, correlation_id: str | None = None) -> None:
                 "st": "COMPLETED",
             },
         )
+        publish_payment_completed(
+            payment_id=payment_id,
+            user_id=intent.get("user_id"),
+            tuition_id=intent.get("tuition_id"),
+            amount=intent.get("amount"),
+            email=intent.get("email"),
+            student_id=intent.get("student_id"),
+            correlation_id=correlation_id,
+        )
 
     del_intent(payment_id)
-    publish_payment_completed(
-        payment_id=payment_id,
-        user_id=intent.get("user_id"),
-        tuition_id=intent.get("tuition_id"),
-        amount=intent.get("amount"),
-        email=intent.get("email"),
-        student_id=intent.get("student_id"),
-        correlation_id=correlation_id,
-    )
-    logger.info("payment_service published payment_completed payment_id=%s", payment_id)
+    logger.info("payment_service queued payment_completed payment_id=%s", payment_id)
 
 
 def on_otp_succeed(payload: Dict[str, Any], headers: Dict[str, Any], message_id: str) -> None:
@@ -287,25 +295,148 @@ def _on_message(payload: Dict[str, Any], headers: Dict[str, Any], message_id: st
     handler(payload, headers, message_id)
 
 
+def _dedup_store() -> DedupStore | None:
+    # Redelivered messages that were already handled are acked without re-running the handler
+    if settings.CONSUMER_DEDUP_TTL_SEC <= 0:
+        return None
+    return DedupStore.from_url(settings.REDIS_URL, ttl_sec=settings.CONSUMER_DEDUP_TTL_SEC)
+
+
+def _flow(initial: int | None = None) -> AdaptivePrefetch | None:
+    # Prefetch follows observed handler latency and pauses on DB pool / Redis saturation
+    if settings.CONSUMER_PREFETCH_MAX <= 0:
+        return None
+    return AdaptivePrefetch(initial or settings.CONSUMER_PREFETCH, max_prefetch=settings.CONSUMER_PREFETCH_MAX,
+                            target_latency=settings.CONSUMER_TARGET_LATENCY_MS / 1000.0)
+
+
+def _routes() -> dict[str, str]:
+    # event-type -> routing key, in _EVENT_HANDLERS order
+    return {
+        "otp_succeed": settings.RK_OTP_SUCCEED,
+        "otp_expired": settings.RK_OTP_EXPIRED,
+        "balance_updated": settings.RK_BALANCE_UPDATED,
+        "tuition_updated": settings.RK_TUITION_UPDATED,
+        "balance_released": settings.RK_BALANCE_RELEASED,
+        "tuition_unlocked": settings.RK_TUITION_UNLOCKED,
+        "balance_held": settings.RK_BALANCE_HELD,
+        "tuition_locked": settings.RK_TUITION_LOCK,
+        # failure events as well
+        "balance_hold_failed": settings.RK_BALANCE_HOLD_FAILED,
+        "tuition_lock_failed": settings.RK_TUITION_LOCK_FAILED,
+    }
+
+
+def _routing_keys() -> list[str]:
+    return list(_routes().values())
+
+
+# Latency-critical: outcomes a user is waiting on (OTP result, balance hold / tuition lock results).
+# Bookkeeping: completion and cancel acknowledgements. Events joined in the same intent step
+# (held + locked, updated + updated, released + unlocked) stay in one group, so their handlers
+# remain serialised per payment_id by partition_key.
+_CRITICAL_EVENTS = (
+    "otp_succeed",
+    "otp_expired",
+    "balance_held",
+    "tuition_locked",
+    "balance_hold_failed",
+    "tuition_lock_failed",
+)
+_BOOKKEEPING_EVENTS = (
+    "balance_updated",
+    "tuition_updated",
+    "balance_released",
+    "tuition_unlocked",
+)
+
+
+def _queue_layout() -> list[tuple[str, list[str], int]]:
+    """(queue, routing keys, initial prefetch) per consumer, from PAYMENT_QUEUE_LAYOUT."""
+    layout = settings.PAYMENT_QUEUE_LAYOUT.strip().lower()
+    if layout == "single":
+        return [(settings.PAYMENT_PAYMENT_QUEUE, _routing_keys(), settings.CONSUMER_PREFETCH)]
+    if layout == "split":
+        routes = _routes()
+        return [
+            (settings.PAYMENT_CRITICAL_QUEUE, [routes[e] for e in _CRITICAL_EVENTS],
+             settings.PAYMENT_CRITICAL_PREFETCH),
+            (settings.PAYMENT_BOOKKEEPING_QUEUE, [routes[e] for e in _BOOKKEEPING_EVENTS],
+             settings.PAYMENT_BOOKKEEPING_PREFETCH),
+        ]
+    raise ValueError(f"PAYMENT_QUEUE_LAYOUT must be 'single' or 'split', got {settings.PAYMENT_QUEUE_LAYOUT!r}")
+
+
+def _retire_old_layouts(retry: RetryPolicy | None) -> None:
+    """
+    Queues of the other layouts (single / split, sharded or not) stay bound on the broker and get a
+    copy of every event with nobody consuming them: unbind them, delete them once drained.
+    Must run after the current layout is declared, so no event is routed to no queue.
+    """
+    routes = _routes()
+    known = {
+        settings.PAYMENT_PAYMENT_QUEUE: _routing_keys(),
+        settings.PAYMENT_CRITICAL_QUEUE: [routes[e] for e in _CRITICAL_EVENTS],
+        settings.PAYMENT_BOOKKEEPING_QUEUE: [routes[e] for e in _BOOKKEEPING_EVENTS],
+    }
+    active = {queue for queue, _, _ in _queue_layout()}
+    shards = settings.PAYMENT_QUEUE_SHARDS
+    for queue, rks in known.items():
+        if queue not in active or shards > 0:
+            retire_queue(queue, rks, retry=retry)
+        # keep=0: whole sharded layout unused; else only shards beyond the current count
+        ShardedQueue(queue, rks, max(1, shards), retry=retry).retire(keep=shards if queue in active else 0)
+
+
 def start_consumers() -> None:
-    # One queue for all payment events; dispatch based on event-type header
-    rmq_bus.declare_queue(
-        settings.PAYMENT_PAYMENT_QUEUE,
-        settings.RK_OTP_SUCCEED,
-        dead_letter=True,
-        prefetch=settings.CONSUMER_PREFETCH,
-    )
-    ch = rmq_bus._Rmq.channel()
-    # Bind other events to the same queue
-    ch.queue_bind(queue=settings.PAYMENT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_OTP_EXPIRED)
-    ch.queue_bind(queue=settings.PAYMENT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_BALANCE_UPDATED)
-    ch.queue_bind(queue=settings.PAYMENT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_TUITION_UPDATED)
-    ch.queue_bind(queue=settings.PAYMENT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_BALANCE_RELEASED)
-    ch.queue_bind(queue=settings.PAYMENT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_TUITION_UNLOCKED)
-    ch.queue_bind(queue=settings.PAYMENT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_BALANCE_HELD)
-    ch.queue_bind(queue=settings.PAYMENT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_TUITION_LOCK)
-    # Bind failure events as well
-    ch.queue_bind(queue=settings.PAYMENT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_BALANCE_HOLD_FAILED)
-    ch.queue_bind(queue=settings.PAYMENT_PAYMENT_QUEUE, exchange=settings.EVENT_EXCHANGE, routing_key=settings.RK_TUITION_LOCK_FAILED)
-
-    rmq_bus.start_consume(settings.PAYMENT_PAYMENT_QUEUE, _on_message)
+    # Payment events (one queue, or critical/bookkeeping queues); dispatch based on event-type header.
+    # The supervisor re-declares and resubscribes on reconnect.
+    retry = RetryPolicy.parse(settings.CONSUMER_RETRY_TIERS_MS)
+    dedup = _dedup_store()
+    subs: list[rmq_consumer.Subscription] = []
+    queues: list[str] = []
+    for queue, rks, prefetch in _queue_layout():
+        common = dict(
+            prefetch=prefetch,
+            dedup=dedup,
+            workers=settings.CONSUMER_WORKERS,
+            partition_key="payment_id",
+        )
+        if settings.PAYMENT_QUEUE_SHARDS > 0:
+            # Events of one payment_id always hit the same shard; each shard has one active replica
+            layout = ShardedQueue(queue, rks, settings.PAYMENT_QUEUE_SHARDS, retry=retry)
+            # Each libs.rmq.worker process is its own replica slot: replica r, process p of P -> slot r * P + p
+            procs = worker_count()
+            subs += layout.subscriptions(
+                _on_message,
+                index=settings.PAYMENT_REPLICA_INDEX * procs + worker_index(),
+                replicas=settings.PAYMENT_REPLICAS * procs,
+                standby_delay=settings.PAYMENT_SHARD_STANDBY_DELAY_SEC,
+                flow=lambda prefetch=prefetch: _flow(prefetch),
+                **common,
+            )
+            queues += layout.queues
+        else:
+            subs.append(
+                rmq_consumer.Subscription(
+                    queue,
+                    rks[0],
+                    _on_message,
+                    routing_keys=rks[1:],
+                    retry=retry,
+                    flow=_flow(prefetch),
+                    **common,
+                )
+            )
+            queues.append(queue)
+    if settings.PAYMENT_RETIRE_OLD_QUEUES:
+        try:
+            for sub in subs:
+                sub.declare()  # new layout bound first, then the old one unbound
+            _retire_old_layouts(retry)
+        except Exception:
+            logger.warning("payment_service: old queue layout not retired (broker unavailable?)", exc_info=True)
+    rmq_consumer.run(subs, join=False)
+    if settings.PAYMENT_QUEUE_MONITOR_SEC > 0:
+        # rmq_queue_depth / rmq_queue_drain_seconds per queue (libs.rmq.lag)
+        start_monitor(queues, settings.PAYMENT_QUEUE_MONITOR_SEC)
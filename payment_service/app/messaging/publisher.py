@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from typing import Optional
 
+from libs.rmq import aio as rmq_aio
 from libs.rmq.publisher import publish_event
 from payment_service.app.settings import settings
 
@@ -29,10 +30,42 @@ def publish_payment_initiated(
             "student_id": student_id,
         },
         event_type="payment_initiated",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
 
 
+async def publish_payment_initiated_async(
+    *,
+    payment_id: str,
+    user_id: str,
+    tuition_id: str,
+    amount: int,
+    term: int | None = None,
+    email: str | None = None,
+    student_id: str | None = None,
+    correlation_id: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> None:
+    # Same event as publish_payment_initiated, for async endpoints (waits for broker ack, at most `timeout` s)
+    await rmq_aio.publish_event(
+        routing_key=settings.RK_PAYMENT_INITIATED,
+        payload={
+            "payment_id": payment_id,
+            "user_id": user_id,
+            "tuition_id": tuition_id,
+            "amount": amount,
+            "term": term,
+            "email": email,
+            "student_id": student_id,
+        },
+        event_type="payment_initiated",
+        partition_key=payment_id,
+        correlation_id=correlation_id,
+        timeout=timeout if timeout is not None else settings.PUBLISH_CONFIRM_TIMEOUT_SEC,
+    )
+
+
 def publish_payment_processing(
     *,
     payment_id: str,
@@ -56,6 +89,7 @@ def publish_payment_processing(
             "student_id": student_id,
         },
         event_type="payment_processing",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
 
@@ -81,6 +115,7 @@ def publish_payment_authorized(
             "student_id": student_id,
         },
         event_type="payment_authorized",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
 
@@ -107,6 +142,7 @@ def publish_payment_canceled(
             "student_id": student_id,
         },
         event_type="payment_canceled",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
 
@@ -132,12 +168,14 @@ def publish_payment_completed(
             "student_id": student_id,
         },
         event_type="payment_completed",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
 
 
 __all__ = [
     "publish_payment_initiated",
+    "publish_payment_initiated_async",
     "publish_payment_processing",
     "publish_payment_authorized",
     "publish_payment_canceled",
@@ -165,5 +203,6 @@ def publish_payment_unauthorized(
             "student_id": student_id,
         },
         event_type="payment_unauthorized",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
@@ -25,7 +25,30 @@ class Settings(BaseSettings):
     EVENT_EXCHANGE: str = Field(default="ibanking.events")
     EVENT_DLX: str = Field(default="ibanking.dlx")
     PAYMENT_PAYMENT_QUEUE: str = Field(default="payment.payment.q")
+    PAYMENT_QUEUE_LAYOUT: str = Field(default="single", description="single: one queue for every event; split: latency-critical events (OTP, hold/lock results) and bookkeeping events in separate queues. Switch every replica at once; on start the queues of the other layout are unbound and deleted once drained (PAYMENT_RETIRE_OLD_QUEUES)")
+    PAYMENT_CRITICAL_QUEUE: str = Field(default="payment.payment.critical.q")
+    PAYMENT_CRITICAL_PREFETCH: int = Field(default=16, description="Initial prefetch of the critical queue consumer (split layout)")
+    PAYMENT_BOOKKEEPING_QUEUE: str = Field(default="payment.payment.bookkeeping.q")
+    PAYMENT_BOOKKEEPING_PREFETCH: int = Field(default=64, description="Initial prefetch of the bookkeeping queue consumer (split layout)")
+    PAYMENT_QUEUE_MONITOR_SEC: float = Field(default=15.0, description="Poll interval of the queue depth / lag gauges (0 = off)")
+    PAYMENT_QUEUE_SHARDS: int = Field(default=0, description="Consistent-hash shards of the payment queue by payment_id (0 = single queue). Shards beyond the count, or all of them when set back to 0, are unbound and deleted once drained")
+    PAYMENT_RETIRE_OLD_QUEUES: bool = Field(default=True, description="On start, unbind the payment queues of other layouts / shard counts and delete them once empty (a queue with messages left is only unbound and logged)")
+    PAYMENT_REPLICA_INDEX: int = Field(default=0, description="This replica's index (0-based); it owns shards i % PAYMENT_REPLICAS == index")
+    PAYMENT_REPLICAS: int = Field(default=1)
+    PAYMENT_SHARD_STANDBY_DELAY_SEC: float = Field(default=15.0, description="Delay before subscribing to non-owned shards as failover standby")
     CONSUMER_PREFETCH: int = Field(default=32)
+    CONSUMER_PREFETCH_MAX: int = Field(default=256, description="Upper bound of the adaptive prefetch (0 = static CONSUMER_PREFETCH)")
+    CONSUMER_TARGET_LATENCY_MS: int = Field(default=250, description="Adaptive prefetch target: max wait of a prefetched message before its handler runs")
+    CONSUMER_WORKERS: int = Field(default=0, description="Handler threads per consumer (0 = inline, one message at a time)")
+    CONSUMER_RETRY_TIERS_MS: str = Field(default="1000,10000,60000", description="Delayed-retry tiers in ms before the DLQ (empty = no retry); the payment_id consumers wait out each tier in process, holding later events of the same payment until the retry is done")
+    CONSUMERS_IN_WEB: bool = Field(default=True, description="Run RMQ consumers inside the web process (false: run them with `python -m libs.rmq.worker payment_service`)")
+    CONSUMER_DRAIN_TIMEOUT_SEC: float = Field(default=8.0, description="On shutdown, how long in-flight handlers may run before the consumer connection is closed")
+    CONSUMER_DEDUP_TTL_SEC: int = Field(default=86400, description="How long processed message ids are remembered in Redis (0 = dedup off)")
+    PUBLISH_CONFIRM_TIMEOUT_SEC: float = Field(default=2.0, description="How long POST /payments/init waits for the broker ack of payment_initiated. Still unsent by then: 503 and the intent is dropped; sent but unconfirmed: PROCESSING and the intent is kept")
+    PUBLISH_SPOOL_DIR: str = Field(default="", description="Local directory buffering events while RabbitMQ is unreachable, replayed in order once it is back (empty = off)")
+    PUBLISH_SPOOL_MAX_MB: int = Field(default=256, description="Spool size limit; publishes fail again once it is full")
+    OUTBOX_BATCH_SIZE: int = Field(default=200, description="Events per outbox relay batch")
+    OUTBOX_POLL_INTERVAL_MS: int = Field(default=500)
 
 
     # Routing keys (subscribe)
@@ -0,0 +1,12 @@
+-- Transactional outbox drained by libs.rmq.outbox.OutboxRelay
+
+CREATE TABLE IF NOT EXISTS event_outbox (
+    id          bigserial   PRIMARY KEY,
+    message_id  uuid        NOT NULL UNIQUE,
+    routing_key text        NOT NULL,
+    payload     jsonb       NOT NULL,
+    headers     jsonb       NOT NULL DEFAULT '{}'::jsonb,
+    created_at  timestamptz NOT NULL DEFAULT now(),
+    attempts    integer     NOT NULL DEFAULT 0,
+    last_error  text        NULL
+);
@@ -2,8 +2,12 @@ import logging
 from fastapi import FastAPI
 import threading
 
+from libs.rmq import consumer as rmq_consumer
+from libs.rmq import outbox as rmq_outbox
 from tuition_service.app.api import router as api_router
+from tuition_service.app.db import engine
 from tuition_service.app.messaging.consumer import start_consumers
+from tuition_service.app.settings import settings
 
 logging.basicConfig(level=logging.INFO)
 
@@ -15,11 +19,25 @@ def create_app() -> FastAPI:
     @app.on_event("startup")
     def _startup() -> None:
         # Start RMQ consumers in a background daemon thread so API remains responsive
-        try:
-            threading.Thread(target=start_consumers, name="rmq-consumer", daemon=True).start()
-        except Exception:
-            # Do not crash API startup if consumer thread fails to start
-            pass
+        # (unless they run in separate worker processes, see libs.rmq.worker)
+        if settings.CONSUMERS_IN_WEB:
+            try:
+                threading.Thread(target=start_consumers, name="rmq-consumer", daemon=True).start()
+            except Exception:
+                # Do not crash API startup if consumer thread fails to start
+                pass
+
+        # Relay events committed to the outbox table (see libs.rmq.outbox)
+        app.state.outbox_relay = rmq_outbox.start_relay(
+            engine,
+            batch_size=settings.OUTBOX_BATCH_SIZE,
+            poll_interval=settings.OUTBOX_POLL_INTERVAL_MS / 1000.0,
+        )
+
+    rmq_consumer.mount_ops(app, settings, after_drain=[
+        # Events enqueued by the drained handlers stay in the outbox table for the next relay
+        lambda: app.state.outbox_relay.stop(),
+    ])
 
     return app
 
@@ -7,7 +7,10 @@ from typing import Dict, Any
 
 from sqlalchemy import text
 
-from libs.rmq import bus as rmq_bus
+from libs.rmq import consumer as rmq_consumer
+from libs.rmq import outbox
+from libs.rmq.bus import RetryPolicy
+from libs.rmq.flow import AdaptivePrefetch
 from tuition_service.app.messaging.publisher import (
     publish_tuition_locked,
     publish_tuition_lock_failed,
@@ -65,7 +68,7 @@ def _handle_payment_initiated(payload: Dict[str, Any], headers: Dict[str, Any],
         )
         return
 
-    with session_scope() as db:
+    with session_scope() as db, outbox.bind(db):
         # Lock tuition record (row-level lock)
         params = {"tid": tuition_id}
         query = """
@@ -153,31 +156,31 @@ def _handle_payment_initiated(payload: Dict[str, Any], headers: Dict[str, Any],
             {"pid": payment_id, "exp": expires_at, "tid": tuition_id, "sid": student_id},
         ).mappings().first()
 
-    if not locked_row:
-        logger.warning("tuition_service lock_race tuition_id=%s payment_id=%s", tuition_id, payment_id)
-        publish_tuition_lock_failed(
-            student_id=student_id,
-            tuition_id=tuition_id,
-            term_no=tuition["term_no"],
-            amount_due=float(tuition["amount_due"]),
-            status=tuition["status"],
+        if not locked_row:
+            logger.warning("tuition_service lock_race tuition_id=%s payment_id=%s", tuition_id, payment_id)
+            publish_tuition_lock_failed(
+                student_id=student_id,
+                tuition_id=tuition_id,
+                term_no=tuition["term_no"],
+                amount_due=float(tuition["amount_due"]),
+                status=tuition["status"],
+                payment_id=payment_id,
+                reason_code="lock_race",
+                reason_message="Tuition lock could not be captured (possibly already locked).",
+                correlation_id=(headers or {}).get("correlation-id"),
+            )
+            return
+
+        publish_tuition_locked(
+            student_id=locked_row["student_id"],
+            tuition_id=str(locked_row["tuition_id"]),
+            term_no=locked_row["term_no"],
+            amount_due=float(locked_row["amount_due"]),
+            status=locked_row["status"],
             payment_id=payment_id,
-            reason_code="lock_race",
-            reason_message="Tuition lock could not be captured (possibly already locked).",
             correlation_id=(headers or {}).get("correlation-id"),
         )
-        return
-
-    publish_tuition_locked(
-        student_id=locked_row["student_id"],
-        tuition_id=str(locked_row["tuition_id"]),
-        term_no=locked_row["term_no"],
-        amount_due=float(locked_row["amount_due"]),
-        status=locked_row["status"],
-        payment_id=payment_id,
-        correlation_id=(headers or {}).get("correlation-id"),
-    )
-    logger.info("tuition_service locked tuition_id=%s payment_id=%s", tuition_id, payment_id)
+        logger.info("tuition_service locked tuition_id=%s payment_id=%s", tuition_id, payment_id)
 
 
 def _handle_payment_authorized(payload: Dict[str, Any], headers: Dict[str, Any], message_id: str) -> None:
@@ -211,7 +214,7 @@ def _handle_payment_authorized(payload: Dict[str, Any], headers: Dict[str, Any],
     updated = False
     tuition_data = None
     
-    with session_scope() as db:
+    with session_scope() as db, outbox.bind(db):
         # Lock the tuition row by payment_id
         tuition_data = db.execute(
             text(
@@ -240,18 +243,18 @@ def _handle_payment_authorized(payload: Dict[str, Any], headers: Dict[str, Any],
             )
             updated = True
 
-    if updated and tuition_data:
-        student_id = student_id or tuition_data["student_id"]
-        publish_tuition_updated(
-            student_id=student_id,
-            tuition_id=tuition_id,
-            term_no=tuition_data["term_no"],
-            amount_due=float(tuition_data["amount_due"]),
-            status="PAID",
-            payment_id=payment_id,
-            correlation_id=(headers or {}).get("correlation-id"),
-        )
-        logger.info("tuition_service marked tuition paid tuition_id=%s payment_id=%s", tuition_id, payment_id)
+        if updated and tuition_data:
+            student_id = student_id or tuition_data["student_id"]
+            publish_tuition_updated(
+                student_id=student_id,
+                tuition_id=tuition_id,
+                term_no=tuition_data["term_no"],
+                amount_due=float(tuition_data["amount_due"]),
+                status="PAID",
+                payment_id=payment_id,
+                correlation_id=(headers or {}).get("correlation-id"),
+            )
+            logger.info("tuition_service marked tuition paid tuition_id=%s payment_id=%s", tuition_id, payment_id)
 
 
 def _handle_payment_unauthorized(payload: Dict[str, Any], headers: Dict[str, Any], message_id: str) -> None:
@@ -268,7 +271,7 @@ def _handle_payment_unauthorized(payload: Dict[str, Any], headers: Dict[str, Any
         return
 
     tuition_data = None
-    with session_scope() as db:
+    with session_scope() as db, outbox.bind(db):
         tuition_data = db.execute(
             text(
                 """
@@ -298,44 +301,44 @@ def _handle_payment_unauthorized(payload: Dict[str, Any], headers: Dict[str, Any
                 {"tid": tuition_data["tuition_id"], "sid": tuition_data["student_id"]},
             )
 
-    if tuition_data:
-        publish_tuition_unlocked(
-            student_id=tuition_data["student_id"],
-            tuition_id=tuition_data["tuition_id"],
-            term_no=tuition_data["term_no"],
-            amount_due=float(tuition_data["amount_due"]),
-            status="UNLOCKED",
-            payment_id=payment_id,
-            reason_code=reason_code,
-            reason_message=reason_message,
-            correlation_id=(headers or {}).get("correlation-id"),
-        )
-        logger.info("tuition_service released tuition lock tuition_id=%s payment_id=%s reason=%s", tuition_data["tuition_id"], payment_id, reason_code)
-    else:
-        logger.warning("tuition_service could not find locked tuition for payment_id=%s during unauthorized flow", payment_id)
+        if tuition_data:
+            publish_tuition_unlocked(
+                student_id=tuition_data["student_id"],
+                tuition_id=tuition_data["tuition_id"],
+                term_no=tuition_data["term_no"],
+                amount_due=float(tuition_data["amount_due"]),
+                status="UNLOCKED",
+                payment_id=payment_id,
+                reason_code=reason_code,
+                reason_message=reason_message,
+                correlation_id=(headers or {}).get("correlation-id"),
+            )
+            logger.info("tuition_service released tuition lock tuition_id=%s payment_id=%s reason=%s", tuition_data["tuition_id"], payment_id, reason_code)
+        else:
+            logger.warning("tuition_service could not find locked tuition for payment_id=%s during unauthorized flow", payment_id)
+
+
+def _flow() -> AdaptivePrefetch | None:
+    # Prefetch follows observed handler latency and pauses on DB pool / Redis saturation
+    if settings.CONSUMER_PREFETCH_MAX <= 0:
+        return None
+    return AdaptivePrefetch(settings.CONSUMER_PREFETCH, max_prefetch=settings.CONSUMER_PREFETCH_MAX,
+                            target_latency=settings.CONSUMER_TARGET_LATENCY_MS / 1000.0)
 
 
 def start_consumers() -> None:
-    # Declare queue and bind both routing keys
-    rmq_bus.declare_queue(
-        settings.TUITION_PAYMENT_QUEUE, 
-        settings.RK_PAYMENT_INITIATED, 
-        dead_letter=True, 
-        prefetch=settings.CONSUMER_PREFETCH
-    )
-    
-    # Bind second key manually
-    ch = rmq_bus._Rmq.channel()
-    ch.queue_bind(
-        queue=settings.TUITION_PAYMENT_QUEUE, 
-        exchange=settings.EVENT_EXCHANGE, 
-        routing_key=settings.RK_PAYMENT_AUTHORIZED
-    )
-    ch.queue_bind(
-        queue=settings.TUITION_PAYMENT_QUEUE,
-        exchange=settings.EVENT_EXCHANGE,
-        routing_key=settings.RK_PAYMENT_UNAUTHORIZED,
-    )
-    
-    # Start consuming
-    rmq_bus.start_consume(settings.TUITION_PAYMENT_QUEUE, _on_message)
+    # One queue for all payment events; the supervisor re-declares and resubscribes on reconnect
+    subs = [
+        rmq_consumer.Subscription(
+            settings.TUITION_PAYMENT_QUEUE,
+            settings.RK_PAYMENT_INITIATED,
+            _on_message,
+            routing_keys=[settings.RK_PAYMENT_AUTHORIZED, settings.RK_PAYMENT_UNAUTHORIZED],
+            prefetch=settings.CONSUMER_PREFETCH,
+            retry=RetryPolicy.parse(settings.CONSUMER_RETRY_TIERS_MS),
+            workers=settings.CONSUMER_WORKERS,
+            partition_key="payment_id",
+            flow=_flow(),
+        )
+    ]
+    rmq_consumer.run(subs, join=False)
@@ -30,6 +30,7 @@ def publish_tuition_locked(
             "payment_id": payment_id,
         },
         event_type="tuition_locked",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.info("event tuition_locked payment_id=%s tuition_id=%s status=%s", payment_id, tuition_id, status)
@@ -60,6 +61,7 @@ def publish_tuition_lock_failed(
             "reason_message": reason_message,
         },
         event_type="tuition_lock_failed",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.warning("event tuition_lock_failed payment_id=%s tuition_id=%s reason=%s", payment_id, tuition_id, reason_code)
@@ -86,6 +88,7 @@ def publish_tuition_updated(
             "payment_id": payment_id,
         },
         event_type="tuition_updated",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.info("event tuition_updated payment_id=%s tuition_id=%s", payment_id, tuition_id)
@@ -116,6 +119,7 @@ def publish_tuition_unlocked(
             "reason_message": reason_message,
         },
         event_type="tuition_unlocked",
+        partition_key=payment_id,
         correlation_id=correlation_id,
     )
     logger.info("event tuition_unlocked payment_id=%s tuition_id=%s reason=%s", payment_id, tuition_id, reason_code)